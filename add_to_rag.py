@@ -33,6 +33,17 @@ def load_transcript(transcript_path: str) -> dict:
     with open(transcript_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+# meeting_1st, meeting_1_5th, meeting_2nd, meeting_3rd, kickoff_meeting, upsell などを抽出
+# （すべて固定文字列なので正規表現は不要）
+SCENARIO_IDS = (
+    'meeting_1st',
+    'meeting_1_5th',
+    'meeting_2nd',
+    'meeting_3rd',
+    'kickoff_meeting',
+    'upsell',
+)
+
 def extract_scenario_id(filename: str) -> str:
     """
     ファイル名からシナリオIDを抽出
@@ -43,22 +54,9 @@ def extract_scenario_id(filename: str) -> str:
     Returns:
         シナリオID（例: meeting_1st）
     """
-    import re
-
-    # meeting_1st, meeting_1_5th, meeting_2nd, meeting_3rd, kickoff_meeting, upsell などを抽出
-    patterns = [
-        r'(meeting_1st)',
-        r'(meeting_1_5th)',
-        r'(meeting_2nd)',
-        r'(meeting_3rd)',
-        r'(kickoff_meeting)',
-        r'(upsell)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, filename)
-        if match:
-            return match.group(1)
+    for scenario_id in SCENARIO_IDS:
+        if scenario_id in filename:
+            return scenario_id
 
     # デフォルト: ファイル名の最初の部分を使用
     return filename.split('_')[0]
@@ -1,18 +1,28 @@
-from flask import Flask, request, jsonify, render_template, Response
+from flask import Flask, request, jsonify, render_template, Response, send_from_directory
+from werkzeug.exceptions import NotFound
 from openai import OpenAI  # 新SDKクライアントを統一利用
 import os
 import json
 import re
+import csv
 import subprocess
 import sys
+import time
+import traceback
 from datetime import datetime
+from statistics import fmean
+from collections import defaultdict
 import base64
 import io
 import tempfile
 from dotenv import load_dotenv
 from shutil import which
 from supabase import create_client, Client
-from d_id_client import get_did_client, generate_cache_key, get_cached_video, save_video_to_cache, download_video_to_storage
+from d_id_client import (
+    get_did_client, generate_cache_key, get_cached_video,
+    embed_cache_text, has_semantic_candidates, get_cached_video_semantic,
+    add_to_semantic_cache_async
+)
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from queue import Queue, Empty
 import threading
@@ -58,6 +68,16 @@ except ImportError as e:
     faiss = None
     np = None
 
+# pyarrowのインポート（RAGメタデータをメモリマップで読むため、無くても動作する）
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pc = None
+
 # 環境変数を読み込み
 load_dotenv()
 
@@ -218,8 +238,57 @@ def load_evaluation_samples(scenario_id: str):
 RAG_INDEX_DIR = os.path.join(os.path.dirname(__file__), 'rag_index')
 RAG_INDEX_PATH = os.path.join(RAG_INDEX_DIR, 'sales_patterns.faiss')
 RAG_METADATA_PATH = os.path.join(RAG_INDEX_DIR, 'sales_patterns.json')
+RAG_METADATA_ARROW_PATH = os.path.join(RAG_INDEX_DIR, 'sales_patterns.arrow')
 RAG_INDEX = None
 RAG_METADATA = []
+RAG_HNSW_EF_SEARCH = 128  # search_rag_patterns の search_k（top_k * 10）を上回る値
+
+
+class RagMetadataTable:
+    """
+    Arrow IPCファイルをメモリマップしたRAGメタデータ
+
+    JSONのリストと同じく len() と行番号でのアクセスができ、
+    行を参照したときだけPythonのdictに変換する
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, i):
+        # JSONで保存したときと同じく、値の無いキーは含めない
+        row = {name: column[i].as_py() for name, column in zip(self.table.column_names, self.table.columns)}
+        return {key: value for key, value in row.items() if value is not None}
+
+    def indices_for_scenario(self, scenario_id):
+        """指定シナリオの行番号のリスト"""
+        if 'scenario_id' not in self.table.column_names:
+            return []
+        mask = pc.fill_null(pc.equal(self.table.column('scenario_id'), scenario_id), False)
+        return np.flatnonzero(mask.to_numpy()).tolist()
+
+
+def load_rag_metadata_arrow():
+    """
+    Arrow形式のRAGメタデータを読み込む（使えない場合はNone）
+
+    JSONより古いArrowファイルは、JSONだけを更新するスクリプト（remove_unknown.pyなど）の
+    変更が反映されていないため使わない
+    """
+    if not PYARROW_AVAILABLE or not os.path.exists(RAG_METADATA_ARROW_PATH):
+        return None
+    if os.path.getmtime(RAG_METADATA_ARROW_PATH) < os.path.getmtime(RAG_METADATA_PATH):
+        return None
+
+    source = pa.memory_map(RAG_METADATA_ARROW_PATH, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if table.num_rows != RAG_INDEX.ntotal:
+        return None
+    return RagMetadataTable(table)
+
 
 def load_rag_index():
     """RAGインデックスを読み込む"""
@@ -239,10 +308,17 @@ def load_rag_index():
         
         # FAISSインデックスを読み込み
         RAG_INDEX = faiss.read_index(RAG_INDEX_PATH)
+
+        # 近似最近傍インデックスの場合は検索時の探索幅を設定
+        # （IVF系はビルド時に設定したnprobeがインデックスファイルに保存されている）
+        if hasattr(RAG_INDEX, 'hnsw'):
+            RAG_INDEX.hnsw.efSearch = RAG_HNSW_EF_SEARCH
         
-        # メタデータを読み込み
-        with open(RAG_METADATA_PATH, 'r', encoding='utf-8') as f:
-            RAG_METADATA = json.load(f)
+        # メタデータを読み込み（Arrow形式があればメモリマップで読み、無ければJSON）
+        RAG_METADATA = load_rag_metadata_arrow()
+        if RAG_METADATA is None:
+            with open(RAG_METADATA_PATH, 'r', encoding='utf-8') as f:
+                RAG_METADATA = json.load(f)
         
         print(f"RAGインデックス読込完了: {len(RAG_METADATA)}件のパターン")
     except Exception as e:
@@ -277,7 +353,10 @@ def search_rag_patterns(query: str, top_k: int = 3, scenario_id: str = None):
         # シナリオIDでフィルタリング
         if scenario_id:
             # 指定シナリオのメタデータのみを対象にする
-            filtered_indices = [i for i, m in enumerate(RAG_METADATA) if m.get('scenario_id') == scenario_id]
+            if isinstance(RAG_METADATA, RagMetadataTable):
+                filtered_indices = RAG_METADATA.indices_for_scenario(scenario_id)
+            else:
+                filtered_indices = [i for i, m in enumerate(RAG_METADATA) if m.get('scenario_id') == scenario_id]
             if not filtered_indices:
                 # 該当するシナリオのデータがない場合は全データから検索
                 print(f"[RAG検索] シナリオ {scenario_id} のデータがありません。全データから検索します。")
@@ -499,20 +578,22 @@ SALES_ROLEPLAY_PROMPT = """
 - 【実例活用】下記の「実例パターン」は実際のロープレから抽出した本物の顧客応答です。これらの話し方・トーン・言葉遣いを積極的に真似て、よりリアルな顧客を演じてください
 """
 
+# ビルド済みフロントエンド（起動時に一度だけ存在確認）
+DIST_DIR = os.path.join(os.path.dirname(__file__), 'dist')
+DIST_ASSETS_DIR = os.path.join(DIST_DIR, 'assets')
+_HAVE_INDEX = os.path.exists(os.path.join(DIST_DIR, 'index.html'))
+
 @app.route('/')
 def index():
     """Reactアプリを配信（distディレクトリが存在する場合）"""
-    dist_path = os.path.join(os.path.dirname(__file__), 'dist', 'index.html')
-    if os.path.exists(dist_path):
-        with open(dist_path, 'r', encoding='utf-8') as f:
-            return f.read()
+    if _HAVE_INDEX:
+        return send_from_directory(DIST_DIR, 'index.html')
     # フォールバック: 従来のHTMLテンプレート
     return render_template('index.html')
 
 @app.route('/favicon.ico')
 def favicon():
     try:
-        from flask import send_from_directory
         static_dir = os.path.join(app.root_path, 'static')
         icon_file = 'favicon.ico'
         icon_path = os.path.join(static_dir, icon_file)
@@ -761,7 +842,6 @@ def chat():
                                 print("[RAG検索] 類似パターンが見つかりませんでした")
                     except Exception as e:
                         print(f"RAG検索エラー（フォールバック）: {e}")
-                        import traceback
                         traceback.print_exc()
                         # RAG検索に失敗しても続行（通常の応答生成にフォールバック）
                 
@@ -834,7 +914,6 @@ def chat_stream():
 
                 def generate_tts_task(chunk_text, chunk_index):
                     """TTS生成タスク（スレッドプールで実行、リトライ対応）"""
-                    import time
                     tts_start = time.time()
 
                     # リトライ設定（最大3回、指数バックオフ）
@@ -1192,7 +1271,6 @@ def chat_stream():
                 print(f"[ストリーミング完了] 合計{chunk_count}チャンク送信")
 
             except Exception as e:
-                import traceback
                 traceback.print_exc()
                 yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
@@ -1202,7 +1280,6 @@ def chat_stream():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -1258,7 +1335,6 @@ def text_to_speech():
         return Response(audio_data, mimetype='audio/mpeg')
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify(success=False, error=str(e)), 500
 
@@ -1280,6 +1356,7 @@ def generate_did_video():
             "success": true,
             "video_url": "https://...",
             "cached": true|false,  # キャッシュヒットかどうか
+            "cache_id": "cache-...",  # キャッシュヒット時のみ（ヒットごとに一意）
             "talk_id": "..."  # 新規生成時のみ
         }
     """
@@ -1295,7 +1372,8 @@ def generate_did_video():
         # Week 7: キャッシュキーを生成
         cache_key = generate_cache_key(text, voice_id, avatar_url)
 
-        # Week 7: キャッシュをチェック
+        # Week 7: キャッシュをチェック（D-IDのAPIキーが無くてもキャッシュ済みの動画は返す）
+        cache_embedding = None
         if supabase_client:
             cached_video = get_cached_video(supabase_client, cache_key)
             if cached_video:
@@ -1304,15 +1382,31 @@ def generate_did_video():
                     success=True,
                     video_url=cached_video['video_url'],
                     cached=True,
+                    cache_id=cached_video.get('id'),
                     cache_hit_count=cached_video.get('hit_count', 0)
                 )
 
-        # キャッシュミス：D-IDで新規生成
-        did_client = get_did_client()
+            # 完全一致しない場合は意味的に同一な既存動画を探す（候補がある組み合わせのみEmbeddingを計算）
+            if openai_client and has_semantic_candidates(voice_id, avatar_url):
+                try:
+                    cache_embedding = embed_cache_text(openai_client, text)
+                    cached_video = get_cached_video_semantic(supabase_client, cache_embedding, voice_id, avatar_url)
+                    if cached_video:
+                        return jsonify(
+                            success=True,
+                            video_url=cached_video['video_url'],
+                            cached=True,
+                            cache_id=cached_video.get('id'),
+                            cache_hit_count=cached_video.get('hit_count', 0)
+                        )
+                except Exception as e:
+                    print(f"⚠️ 意味的キャッシュ検索エラー: {e}")
+
+        # キャッシュミス：D-IDで新規生成（テキストから直接）
+        did_client = get_did_client(supabase_client)
         if not did_client:
             return jsonify(success=False, error='D-ID APIが設定されていません'), 500
 
-        # D-ID動画を生成（テキストから直接）
         print(f"🎬 Generating D-ID video for text: {text[:50]}...")
         result = did_client.create_talk_from_text(
             text=text,
@@ -1330,19 +1424,22 @@ def generate_did_video():
             print(f"✅ D-ID video ready: {did_video_url}")
 
             # Week 7: Supabase Storageに保存してキャッシュ
-            if supabase_client:
-                storage_url = download_video_to_storage(supabase_client, did_video_url, cache_key)
-                if storage_url:
+            if did_client.supabase_client:
+                stored_video = did_client.download_video_to_storage(did_video_url, cache_key)
+                if stored_video:
+                    storage_url = stored_video['video_url']
                     # キャッシュテーブルに保存
-                    save_video_to_cache(
-                        supabase_client,
-                        cache_key=cache_key,
+                    did_client.save_video_to_cache(
+                        cache_key,
                         text=text,
                         voice_id=voice_id,
                         avatar_url=avatar_url,
                         video_url=storage_url,
-                        storage_path=f"video_cache/{cache_key}.mp4"
+                        storage_path=stored_video['storage_path'],
+                        file_size_bytes=stored_video['file_size_bytes'],
+                        content_hash=stored_video['content_hash']
                     )
+                    add_to_semantic_cache_async(openai_client, text, cache_embedding, cache_key, voice_id, avatar_url)
                     # Supabase Storageの URL を返す
                     final_video_url = storage_url
                 else:
@@ -1365,7 +1462,6 @@ def generate_did_video():
             ), 500
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify(success=False, error=str(e)), 500
 
@@ -1425,7 +1521,7 @@ def transcribe():
                 try: os.remove(wav_path)
                 except Exception: pass
     except Exception as e:
-        import traceback; traceback.print_exc()
+        traceback.print_exc()
         return jsonify(success=False, error=str(e)), 500
     finally:
         try:
@@ -1490,7 +1586,6 @@ def transcribe_with_whisper(audio_bytes):
                     
     except Exception as e:
         print(f"Whisper音声認識エラー詳細: {str(e)}")
-        import traceback
         traceback.print_exc()
         return jsonify({
             'success': False,
@@ -1544,7 +1639,7 @@ def transcribe_with_whisper_file(input_file_path):
 
     except Exception as e:
         print(f"Whisper音声認識エラー詳細: {str(e)}")
-        import traceback; traceback.print_exc()
+        traceback.print_exc()
         return jsonify({'success': False, 'error': f'Whisper音声認識エラー: {str(e)}'}), 500
     finally:
         # 一時ファイルを削除
@@ -2053,7 +2148,6 @@ def save_conversation():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2087,7 +2181,6 @@ def get_conversations():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2123,7 +2216,6 @@ def handle_evaluations():
             })
 
         except Exception as e:
-            import traceback
             traceback.print_exc()
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2172,7 +2264,6 @@ def handle_evaluations():
             })
 
         except Exception as e:
-            import traceback
             traceback.print_exc()
             return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2181,7 +2272,6 @@ def handle_evaluations():
 def ingest_videos():
     """動画取り込みスクリプトを実行"""
     try:
-        import subprocess
         script_path = os.path.join(os.path.dirname(__file__), 'tools', 'batch_ingest_videos.py')
         
         if not os.path.exists(script_path):
@@ -2229,7 +2319,6 @@ def ingest_videos():
         })
         
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({
             'success': False,
@@ -2260,7 +2349,7 @@ def get_stores_stats():
         evaluations_result = supabase_client.table('evaluations').select('average_score').execute()
         evaluations = evaluations_result.data if evaluations_result.data else []
         total_evaluations = len(evaluations)
-        overall_avg_score = sum(e['average_score'] for e in evaluations) / total_evaluations if total_evaluations > 0 else 0
+        overall_avg_score = fmean(e['average_score'] for e in evaluations) if evaluations else 0
 
         return jsonify({
             'success': True,
@@ -2274,7 +2363,6 @@ def get_stores_stats():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2305,7 +2393,7 @@ def get_stores_rankings():
             # 店舗の評価平均スコア
             evaluations_result = supabase_client.table('evaluations').select('average_score').eq('store_id', store_id).execute()
             evaluations = evaluations_result.data if evaluations_result.data else []
-            avg_score = sum(e['average_score'] for e in evaluations) / len(evaluations) if evaluations else 0
+            avg_score = fmean(e['average_score'] for e in evaluations) if evaluations else 0
 
             rankings.append({
                 'store_id': store_id,
@@ -2327,7 +2415,6 @@ def get_stores_rankings():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2354,7 +2441,7 @@ def get_store_members(store_id):
             # 評価平均スコア
             evaluations_result = supabase_client.table('evaluations').select('average_score').eq('user_id', user_id).execute()
             evaluations = evaluations_result.data if evaluations_result.data else []
-            member['average_score'] = round(sum(e['average_score'] for e in evaluations) / len(evaluations), 2) if evaluations else 0
+            member['average_score'] = round(fmean(e['average_score'] for e in evaluations), 2) if evaluations else 0
             member['evaluation_count'] = len(evaluations)
 
         return jsonify({
@@ -2363,7 +2450,6 @@ def get_store_members(store_id):
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2407,7 +2493,7 @@ def get_regions_stats():
             # 店舗の評価平均スコア
             evaluations_result = supabase_client.table('evaluations').select('average_score').eq('store_id', store_id).execute()
             evaluations = evaluations_result.data if evaluations_result.data else []
-            avg_score = sum(e['average_score'] for e in evaluations) / len(evaluations) if evaluations else 0
+            avg_score = fmean(e['average_score'] for e in evaluations) if evaluations else 0
 
             # リージョンの統計を更新
             regions[region]['store_count'] += 1
@@ -2453,7 +2539,6 @@ def get_regions_stats():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2476,20 +2561,16 @@ def get_store_analytics(store_id):
         evaluations_result = supabase_client.table('evaluations').select('scenario_id, average_score').eq('store_id', store_id).execute()
         evaluations = evaluations_result.data if evaluations_result.data else []
 
-        scenario_stats = {}
+        scenario_scores = defaultdict(list)
         for eval in evaluations:
-            scenario_id = eval['scenario_id']
-            if scenario_id not in scenario_stats:
-                scenario_stats[scenario_id] = {'count': 0, 'total_score': 0}
-            scenario_stats[scenario_id]['count'] += 1
-            scenario_stats[scenario_id]['total_score'] += eval['average_score']
+            scenario_scores[eval['scenario_id']].append(eval['average_score'])
 
         scenario_analytics = []
-        for scenario_id, stats in scenario_stats.items():
+        for scenario_id, scores in scenario_scores.items():
             scenario_analytics.append({
                 'scenario_id': scenario_id,
-                'count': stats['count'],
-                'average_score': round(stats['total_score'] / stats['count'], 2)
+                'count': len(scores),
+                'average_score': round(fmean(scores), 2)
             })
 
         return jsonify({
@@ -2500,7 +2581,6 @@ def get_store_analytics(store_id):
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2508,10 +2588,10 @@ def get_store_analytics(store_id):
 # 静的アセットを配信
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
-    """Viteでビルドされたアセットファイルを配信"""
-    from flask import send_from_directory
-    assets_path = os.path.join(os.path.dirname(__file__), 'dist', 'assets')
-    return send_from_directory(assets_path, filename)
+    """Viteでビルドされたアセットファイルを配信（ファイル名はハッシュ付きなので長期キャッシュ可）"""
+    response = send_from_directory(DIST_ASSETS_DIR, filename)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 
 # キャッチオールルート: React Routerのクライアント側ルーティングをサポート
@@ -2521,7 +2601,6 @@ def catch_all(path):
     APIルート以外のすべてのパスでindex.htmlを返す
     これによりReact Routerがクライアント側でルーティングを処理できる
     """
-    from flask import send_from_directory
     print(f"🔍 Catch-all route called with path: {path}")
 
     # APIルートは除外
@@ -2531,23 +2610,19 @@ def catch_all(path):
 
     # メディアファイル（動画・画像）を配信
     if path.endswith(('.mp4', '.webm', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.ico')):
-        dist_path = os.path.join(os.path.dirname(__file__), 'dist')
-        file_path = os.path.join(dist_path, path)
-        if os.path.exists(file_path):
+        try:
+            response = send_from_directory(DIST_DIR, path)
             print(f"📹 Serving media file: {path}")
-            return send_from_directory(dist_path, path)
-
-    # distディレクトリのindex.htmlを返す
-    dist_index = os.path.join(os.path.dirname(__file__), 'dist', 'index.html')
-    print(f"📁 Looking for index.html at: {dist_index}")
-    print(f"✅ File exists: {os.path.exists(dist_index)}")
+            return response
+        except NotFound:
+            pass
 
-    if os.path.exists(dist_index):
+    # distディレクトリのindex.htmlを返す（ETag/Last-Modifiedによる304応答に対応）
+    if _HAVE_INDEX:
         print(f"✅ Serving index.html for path: {path}")
-        with open(dist_index, 'r', encoding='utf-8') as f:
-            return f.read()
+        return send_from_directory(DIST_DIR, 'index.html')
 
-    print(f"❌ index.html not found at: {dist_index}")
+    print(f"❌ index.html not found in: {DIST_DIR}")
     return jsonify({'error': 'Frontend not built', 'path': path}), 404
 
 
@@ -2589,12 +2664,11 @@ def export_all_evaluations():
         if region:
             evaluations = [e for e in evaluations if stores_dict.get(e.get('store_id'), {}).get('region') == region]
 
-        # CSV データ生成
-        import io
-        import csv
-
-        output = io.StringIO()
-        writer = csv.writer(output)
+        # CSV データ生成（BOM付きUTF-8のバイト列へ直接書き込み、Excel互換）
+        output = io.BytesIO()
+        output.write(b'\xef\xbb\xbf')
+        text_output = io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True)
+        writer = csv.writer(text_output)
 
         # ヘッダー
         writer.writerow([
@@ -2635,8 +2709,10 @@ def export_all_evaluations():
                 evaluation.get('created_at', '')
             ])
 
-        # BOM付きUTF-8で返却（Excel互換）
-        csv_data = '\ufeff' + output.getvalue()
+        # 書き込み済みのバイト列をそのまま返却（再エンコード不要）
+        text_output.flush()
+        text_output.detach()
+        csv_data = output.getvalue()
 
         return csv_data, 200, {
             'Content-Type': 'text/csv; charset=utf-8',
@@ -2644,7 +2720,6 @@ def export_all_evaluations():
         }
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2685,14 +2760,13 @@ def export_all_stores():
             evaluations_result = supabase_client.table('evaluations').select('average_score').eq('store_id', store_id).execute()
             evaluations = evaluations_result.data if evaluations_result.data else []
             store['evaluation_count'] = len(evaluations)
-            store['average_score'] = round(sum(e['average_score'] for e in evaluations) / len(evaluations), 2) if evaluations else 0
-
-        # CSV データ生成
-        import io
-        import csv
+            store['average_score'] = round(fmean(e['average_score'] for e in evaluations), 2) if evaluations else 0
 
-        output = io.StringIO()
-        writer = csv.writer(output)
+        # CSV データ生成（BOM付きUTF-8のバイト列へ直接書き込み、Excel互換）
+        output = io.BytesIO()
+        output.write(b'\xef\xbb\xbf')
+        text_output = io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True)
+        writer = csv.writer(text_output)
 
         # ヘッダー
         writer.writerow([
@@ -2721,8 +2795,10 @@ def export_all_stores():
                 store.get('created_at', '')
             ])
 
-        # BOM付きUTF-8で返却（Excel互換）
-        csv_data = '\ufeff' + output.getvalue()
+        # 書き込み済みのバイト列をそのまま返却（再エンコード不要）
+        text_output.flush()
+        text_output.detach()
+        csv_data = output.getvalue()
 
         return csv_data, 200, {
             'Content-Type': 'text/csv; charset=utf-8',
@@ -2730,7 +2806,6 @@ def export_all_stores():
         }
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2795,7 +2870,6 @@ def save_instructor_evaluation():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2829,7 +2903,6 @@ def get_instructor_evaluations():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2889,12 +2962,12 @@ def get_evaluation_accuracy():
 
         # 平均精度を計算
         overall_accuracy = total_accuracy / len(instructor_evaluations) if instructor_evaluations else 0
-        average_difference = sum(total_differences) / len(total_differences) if total_differences else 0
+        average_difference = fmean(total_differences) if total_differences else 0
 
         # メトリック別の平均精度を計算
         metric_accuracy = {}
         for metric, accuracies in accuracy_by_metric.items():
-            metric_accuracy[metric] = sum(accuracies) / len(accuracies) if accuracies else 0
+            metric_accuracy[metric] = fmean(accuracies) if accuracies else 0
 
         report = {
             'total_evaluations': len(instructor_evaluations),
@@ -2911,7 +2984,6 @@ def get_evaluation_accuracy():
         })
 
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -2931,7 +3003,7 @@ def calculate_accuracy_metrics(instructor_scores, ai_scores):
         return {'overall_accuracy': 0, 'message': 'スコアの比較ができません'}
 
     # 平均差分を計算（5点満点）
-    avg_difference = sum(differences) / len(differences)
+    avg_difference = fmean(differences)
     # 精度を計算（差分が小さいほど精度が高い）
     overall_accuracy = 1 - (avg_difference / 5)
 
@@ -2943,7 +3015,6 @@ def calculate_accuracy_metrics(instructor_scores, ai_scores):
 
 
 if __name__ == '__main__':
-    import sys
     # 環境変数PORTを優先、次にコマンドライン引数、最後にデフォルト5001
     port = int(os.getenv('PORT', 5001))
     if len(sys.argv) > 1:
@@ -6,7 +6,7 @@ import os
 import sys
 import time
 from pathlib import Path
-from compress_and_transcribe import compress_audio, transcribe_audio
+from compress_and_transcribe import compress_audio_many, transcribe_audio
 
 def batch_transcribe(file_list_path: str, base_dir: str = ".."):
     """
@@ -29,6 +29,8 @@ def batch_transcribe(file_list_path: str, base_dir: str = ".."):
     failed = []
     skipped = []
 
+    # 処理対象を決める（文字起こし済み・存在しないファイルは除く）
+    pending = []
     for i, relative_path in enumerate(files, 1):
         # フルパスを構築
         audio_path = os.path.join(base_dir, relative_path)
@@ -44,55 +46,56 @@ def batch_transcribe(file_list_path: str, base_dir: str = ".."):
             skipped.append(relative_path)
             continue
 
-        print(f"\n{'='*70}")
-        print(f"[{i}/{total}] 処理中: {relative_path}")
-        print(f"{'='*70}")
-
-        try:
-            # ファイルの存在確認
-            if not os.path.exists(audio_path):
-                print(f"❌ ファイルが見つかりません: {audio_path}")
-                failed.append((relative_path, "ファイルが見つかりません"))
-                continue
-
-            # 圧縮
-            compressed_path = compress_audio(audio_path)
-
-            # 文字起こし
-            result = transcribe_audio(compressed_path, output_dir="transcripts")
-
-            # 元のファイル名でリネーム
-            temp_transcript = f"transcripts/{os.path.splitext(os.path.basename(compressed_path))[0]}_transcript.json"
-            final_transcript = f"transcripts/{filename_without_ext}_transcript.json"
-
-            if os.path.exists(temp_transcript) and temp_transcript != final_transcript:
-                # source_fileを修正
-                import json
-                with open(temp_transcript, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                data['source_file'] = filename
-                with open(final_transcript, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                os.remove(temp_transcript)
-
-            # 一時ファイルを削除
-            if compressed_path != audio_path and os.path.exists(compressed_path):
-                os.unlink(compressed_path)
-
-            print(f"✅ 完了: {filename}")
-            successful.append(relative_path)
-
-            # API レート制限対策（少し待機）
-            if i < total:
-                print("⏳ 次のファイル処理まで3秒待機...")
-                time.sleep(3)
-
-        except Exception as e:
-            print(f"❌ エラー: {relative_path}")
-            print(f"   {str(e)}")
-            failed.append((relative_path, str(e)))
+        # ファイルの存在確認
+        if not os.path.exists(audio_path):
+            print(f"\n[{i}/{total}] ❌ ファイルが見つかりません: {audio_path}")
+            failed.append((relative_path, "ファイルが見つかりません"))
             continue
 
+        pending.append((i, relative_path, audio_path, filename))
+
+    # 圧縮はffmpegがほぼシングルスレッドのため、CPUコア数ずつまとめて並列に実行し、その後に順に文字起こしする
+    # （圧縮済みの一時ファイルが溜まりすぎないよう、まとめて圧縮するのはCPUコア数まで）
+    group_size = os.cpu_count() or 1
+    for group_start in range(0, len(pending), group_size):
+        group = pending[group_start:group_start + group_size]
+        print(f"\n🗜️  {len(group)}本の音声ファイルを並列で圧縮中...")
+        compressed_paths = compress_audio_many([audio_path for _, _, audio_path, _ in group], concurrency=group_size)
+
+        for (i, relative_path, audio_path, filename), compressed_path in zip(group, compressed_paths):
+            print(f"\n{'='*70}")
+            print(f"[{i}/{total}] 処理中: {relative_path}")
+            print(f"{'='*70}")
+
+            try:
+                if isinstance(compressed_path, Exception):
+                    raise compressed_path
+
+                # 文字起こし（元のファイル名で直接保存）
+                result = transcribe_audio(
+                    compressed_path,
+                    output_dir="transcripts",
+                    output_basename=filename
+                )
+
+                print(f"✅ 完了: {filename}")
+                successful.append(relative_path)
+
+                # API レート制限対策（少し待機）
+                if i < total:
+                    print("⏳ 次のファイル処理まで3秒待機...")
+                    time.sleep(3)
+
+            except Exception as e:
+                print(f"❌ エラー: {relative_path}")
+                print(f"   {str(e)}")
+                failed.append((relative_path, str(e)))
+
+            finally:
+                # 一時ファイルを削除
+                if isinstance(compressed_path, str) and compressed_path != audio_path and os.path.exists(compressed_path):
+                    os.unlink(compressed_path)
+
     # 結果サマリー
     print("\n" + "="*70)
     print("📊 一括文字起こし結果")
@@ -2,12 +2,134 @@
 """
 大きな音声ファイルを圧縮してから文字起こしするスクリプト
 """
+import io
 import os
 import sys
+import json
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from transcribe_audio import transcribe_audio
 
+# PyAVのインポート（あればffmpegプロセスを起動せずにプロセス内で圧縮）
+try:
+    import av
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+    av = None
+
+# MP3の1フレームあたりのサンプル数
+MP3_FRAME_SIZE = 1152
+
+def _target_bitrate(file_size_mb: float, max_size_mb: float) -> int:
+    """目標サイズに収まるビットレート（kbps）を計算"""
+    target_bitrate = int((max_size_mb / file_size_mb) * 128)  # 元が128kbpsと仮定
+    return max(32, min(target_bitrate, 128))  # 32-128kbps
+
+def _build_ffmpeg_cmd(input_path: str, target_bitrate: int, output: str) -> list:
+    """圧縮用のffmpegコマンドを組み立てる（outputに'pipe:1'を渡すと標準出力へ書き出す）"""
+    return [
+        'ffmpeg', '-i', input_path,
+        '-ac', '1',  # モノラル化
+        '-ar', '16000',  # サンプリングレート16kHz
+        '-b:a', f'{target_bitrate}k',  # ビットレート
+        '-threads', '1',  # 並列実行時のCPU過剰割り当てを防ぐ
+        '-f', 'mp3',
+        '-y',  # 上書き
+        output
+    ]
+
+def probe_audio(input_path: str):
+    """
+    ffprobeで先頭の音声ストリームの情報を取得
+
+    Returns:
+        {'codec_name', 'sample_rate', 'channels', 'bit_rate', 'duration'} または None（取得失敗時）
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,sample_rate,channels,bit_rate:format=duration',
+        '-of', 'json',
+        input_path
+    ]
+    try:
+        proc = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        info = json.loads(proc.stdout)
+        stream = info['streams'][0]
+        return {
+            'codec_name': stream.get('codec_name'),
+            'sample_rate': int(stream.get('sample_rate', 0)),
+            'channels': int(stream.get('channels', 0)),
+            'bit_rate': int(stream.get('bit_rate', 0)),
+            'duration': float(info.get('format', {}).get('duration', 0))
+        }
+    except (subprocess.CalledProcessError, FileNotFoundError, KeyError, IndexError, ValueError):
+        return None
+
+def _stream_copy_cmd(input_path: str, output: str, max_size_mb: float):
+    """
+    音声が既にモノラル16kHz以下のMP3で、音声ストリームだけなら目標サイズに収まる場合
+    （動画コンテナ等）は、再エンコードせずに取り出すffmpegコマンドを返す
+
+    Returns:
+        ffmpegコマンド または None（再エンコードが必要な場合）
+    """
+    probe = probe_audio(input_path)
+    if not probe or not probe['bit_rate'] or not probe['duration']:
+        return None
+
+    audio_size_mb = probe['bit_rate'] * probe['duration'] / 8 / (1024 * 1024)
+    if (probe['codec_name'] == 'mp3'
+            and probe['sample_rate'] <= 16000
+            and probe['channels'] == 1
+            and audio_size_mb <= max_size_mb):
+        return [
+            'ffmpeg', '-i', input_path,
+            '-vn',  # 映像は捨てる
+            '-c:a', 'copy',  # 再エンコードしない
+            '-f', 'mp3',
+            '-y',
+            output
+        ]
+    return None
+
+def _compress_with_pyav(input_path: str, output, target_bitrate: int) -> None:
+    """
+    PyAV（libavのバインディング）でモノラル16kHzのMP3にエンコード
+
+    Args:
+        input_path: 入力音声ファイルのパス
+        output: 出力先のパスまたはファイルライクオブジェクト
+        target_bitrate: ビットレート（kbps）
+    """
+    with av.open(input_path) as in_container, av.open(output, 'w', format='mp3') as out_container:
+        in_stream = in_container.streams.audio[0]
+        out_stream = out_container.add_stream('libmp3lame', rate=16000)
+        out_stream.codec_context.layout = 'mono'
+        out_stream.codec_context.bit_rate = target_bitrate * 1000
+
+        resampler = av.AudioResampler(format='s16p', layout='mono', rate=16000)
+        fifo = av.AudioFifo()
+
+        def encode(frame):
+            for packet in out_stream.encode(frame):
+                out_container.mux(packet)
+
+        for frame in in_container.decode(in_stream):
+            for resampled in resampler.resample(frame):
+                resampled.pts = None
+                fifo.write(resampled)
+            # libmp3lameは固定長フレームしか受け付けないのでFIFOで切り出す
+            while fifo.samples >= MP3_FRAME_SIZE:
+                encode(fifo.read(MP3_FRAME_SIZE))
+
+        remaining = fifo.read()
+        if remaining is not None:
+            encode(remaining)
+        encode(None)
+
 def compress_audio(input_path: str, max_size_mb: float = 24.5) -> str:
     """
     音声ファイルを圧縮
@@ -32,21 +154,28 @@ def compress_audio(input_path: str, max_size_mb: float = 24.5) -> str:
     temp_path = temp_file.name
     temp_file.close()
 
-    # 圧縮率を計算（ビットレートを下げる）
-    target_bitrate = int((max_size_mb / file_size_mb) * 128)  # 元が128kbpsと仮定
-    target_bitrate = max(32, min(target_bitrate, 128))  # 32-128kbps
+    # 既に条件を満たすMP3音声なら再エンコードせずに取り出すだけ
+    cmd = _stream_copy_cmd(input_path, temp_path, max_size_mb)
+    if cmd:
+        print("🔧 再エンコード不要: 音声ストリームをそのまま取り出します...")
+    else:
+        # 圧縮率を計算（ビットレートを下げる）
+        target_bitrate = _target_bitrate(file_size_mb, max_size_mb)
 
-    print(f"🔧 ffmpegで圧縮中（目標ビットレート: {target_bitrate}kbps）...")
+        print(f"🔧 ffmpegで圧縮中（目標ビットレート: {target_bitrate}kbps）...")
 
-    # ffmpegで圧縮
-    cmd = [
-        'ffmpeg', '-i', input_path,
-        '-ac', '1',  # モノラル化
-        '-ar', '16000',  # サンプリングレート16kHz
-        '-b:a', f'{target_bitrate}k',  # ビットレート
-        '-y',  # 上書き
-        temp_path
-    ]
+        # PyAVがあればffmpegプロセスを起動せずに圧縮
+        if AV_AVAILABLE:
+            try:
+                _compress_with_pyav(input_path, temp_path, target_bitrate)
+                compressed_size_mb = os.path.getsize(temp_path) / (1024 * 1024)
+                print(f"✅ 圧縮完了: {compressed_size_mb:.2f} MB ({file_size_mb/compressed_size_mb:.1f}x圧縮)")
+                return temp_path
+            except Exception as e:
+                print(f"⚠️ PyAVでの圧縮に失敗したためffmpegで再試行します: {e}")
+
+        # ffmpegで圧縮
+        cmd = _build_ffmpeg_cmd(input_path, target_bitrate, temp_path)
 
     try:
         subprocess.run(cmd, check=True, capture_output=True, text=True)
@@ -60,6 +189,85 @@ def compress_audio(input_path: str, max_size_mb: float = 24.5) -> str:
         print("❌ ffmpegがインストールされていません。brew install ffmpeg を実行してください")
         raise
 
+def compress_audio_to_bytes(input_path: str, max_size_mb: float = 24.5):
+    """
+    音声ファイルを圧縮し、一時ファイルを介さずにMP3のバイト列として返す
+
+    Args:
+        input_path: 入力音声ファイルのパス
+        max_size_mb: 目標サイズ（MB）
+
+    Returns:
+        圧縮後のMP3バイト列（圧縮不要の場合はNone）
+    """
+    file_size_mb = os.path.getsize(input_path) / (1024 * 1024)
+    print(f"📊 元のファイルサイズ: {file_size_mb:.2f} MB")
+
+    if file_size_mb <= max_size_mb:
+        print("✅ 圧縮不要です")
+        return None
+
+    # 既に条件を満たすMP3音声なら再エンコードせずに取り出すだけ
+    cmd = _stream_copy_cmd(input_path, 'pipe:1', max_size_mb)
+    if cmd:
+        print("🔧 再エンコード不要: 音声ストリームをそのまま取り出します...")
+    else:
+        target_bitrate = _target_bitrate(file_size_mb, max_size_mb)
+        print(f"🔧 ffmpegで圧縮中（目標ビットレート: {target_bitrate}kbps）...")
+
+        # PyAVがあればffmpegプロセスを起動せずにメモリ上へ圧縮
+        if AV_AVAILABLE:
+            try:
+                buffer = io.BytesIO()
+                _compress_with_pyav(input_path, buffer, target_bitrate)
+                compressed_data = buffer.getvalue()
+                compressed_size_mb = len(compressed_data) / (1024 * 1024)
+                print(f"✅ 圧縮完了: {compressed_size_mb:.2f} MB ({file_size_mb/compressed_size_mb:.1f}x圧縮)")
+                return compressed_data
+            except Exception as e:
+                print(f"⚠️ PyAVでの圧縮に失敗したためffmpegで再試行します: {e}")
+
+        cmd = _build_ffmpeg_cmd(input_path, target_bitrate, 'pipe:1')
+
+    try:
+        proc = subprocess.run(cmd, check=True, capture_output=True)
+        compressed_size_mb = len(proc.stdout) / (1024 * 1024)
+        print(f"✅ 圧縮完了: {compressed_size_mb:.2f} MB ({file_size_mb/compressed_size_mb:.1f}x圧縮)")
+        return proc.stdout
+    except subprocess.CalledProcessError as e:
+        print(f"❌ 圧縮エラー: {e.stderr.decode('utf-8', errors='replace')}")
+        raise
+    except FileNotFoundError:
+        print("❌ ffmpegがインストールされていません。brew install ffmpeg を実行してください")
+        raise
+
+def compress_audio_many(input_paths: list, max_size_mb: float = 24.5, concurrency: int = None) -> list:
+    """
+    複数の音声ファイルを並列で圧縮
+
+    ffmpeg（libmp3lame）はほぼシングルスレッドで動くため、
+    ファイル単位でプロセスを並列起動してCPUコアを使い切る
+
+    Args:
+        input_paths: 入力音声ファイルのパスのリスト
+        max_size_mb: 目標サイズ（MB）
+        concurrency: 同時に実行するffmpegプロセス数（省略時はCPUコア数）
+
+    Returns:
+        圧縮後のファイルパスのリスト（入力と同じ順序。圧縮に失敗したファイルはその例外）
+    """
+    concurrency = concurrency or os.cpu_count() or 1
+
+    def compress(path: str):
+        # 1ファイルの失敗で他のファイルの結果を失わないよう、例外は結果として返す
+        try:
+            return compress_audio(path, max_size_mb)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(compress, input_paths))
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python compress_and_transcribe.py <audio_file_path>")
@@ -71,26 +279,23 @@ def main():
         print(f"❌ Error: File not found: {audio_file_path}")
         sys.exit(1)
 
-    # 圧縮
-    compressed_path = compress_audio(audio_file_path)
+    # 圧縮（ffmpegの出力をメモリ上で受け取り、一時ファイルの書き込み・読み込みを省く）
+    compressed_data = compress_audio_to_bytes(audio_file_path)
 
-    try:
-        # 文字起こし
-        result = transcribe_audio(compressed_path)
-
-        print("\n" + "="*60)
-        print("📊 文字起こし統計")
-        print("="*60)
-        print(f"ファイル: {result['source_file']}")
-        print(f"時長: {result['duration']:.1f}秒")
-        print(f"文字数: {len(result['full_text'])}文字")
-        print(f"セグメント数: {len(result['segments'])}個")
-        print("="*60)
-    finally:
-        # 一時ファイルを削除
-        if compressed_path != audio_file_path and os.path.exists(compressed_path):
-            os.unlink(compressed_path)
-            print(f"🗑️  一時ファイルを削除: {compressed_path}")
+    # 文字起こし
+    if compressed_data is None:
+        result = transcribe_audio(audio_file_path)
+    else:
+        result = transcribe_audio(audio_file_path, audio_stream=io.BytesIO(compressed_data))
+
+    print("\n" + "="*60)
+    print("📊 文字起こし統計")
+    print("="*60)
+    print(f"ファイル: {result['source_file']}")
+    print(f"時長: {result['duration']:.1f}秒")
+    print(f"文字数: {len(result['full_text'])}文字")
+    print(f"セグメント数: {len(result['segments'])}個")
+    print("="*60)
 
 if __name__ == "__main__":
     main()
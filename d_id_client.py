@@ -4,22 +4,68 @@ D-ID API クライアント
 Week 7: キャッシング機能追加
 """
 import os
+import atexit
 import requests
+from requests.adapters import HTTPAdapter
 import time
+import base64
 import hashlib
+import json
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
 from typing import Optional, Dict
 
+# FAISSとnumpyのインポート（意味的キャッシュ検索用、無くても動作する）
+try:
+    import faiss
+    import numpy as np
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+    faiss = None
+    np = None
+
+# fcntlのインポート（意味的キャッシュのログ追記時のファイルロック用、Windowsには無い）
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 動画ダウンロード時のチャンクサイズ（1MB）
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
 class DIDClient:
     """D-ID API クライアント"""
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, supabase_client=None):
         self.api_key = api_key
+        # キャッシュ用のSupabaseクライアント（Noneの場合はキャッシュしない）
+        self.supabase_client = supabase_client
         self.base_url = "https://api.d-id.com"
         self.headers = {
             "Authorization": f"Basic {api_key}",
             "Content-Type": "application/json"
         }
 
+        # 接続を使い回す（ポーリングのたびにTCP/TLSハンドシェイクしない）
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """セッションを閉じる"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def create_talk(
         self,
         audio_url: str,
@@ -62,7 +108,7 @@ class DIDClient:
         if webhook_url:
             payload["webhook"] = webhook_url
 
-        response = requests.post(endpoint, json=payload, headers=self.headers)
+        response = self.session.post(endpoint, json=payload)
         response.raise_for_status()
 
         return response.json()
@@ -103,7 +149,7 @@ class DIDClient:
             }
         }
 
-        response = requests.post(endpoint, json=payload, headers=self.headers)
+        response = self.session.post(endpoint, json=payload)
         response.raise_for_status()
 
         return response.json()
@@ -121,7 +167,7 @@ class DIDClient:
         """
         endpoint = f"{self.base_url}/talks/{talk_id}"
 
-        response = requests.get(endpoint, headers=self.headers)
+        response = self.session.get(endpoint)
         response.raise_for_status()
 
         return response.json()
@@ -130,23 +176,29 @@ class DIDClient:
         self,
         talk_id: str,
         timeout: int = 120,
-        poll_interval: int = 2
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 10.0
     ) -> Optional[str]:
         """
         動画生成が完了するまで待機
 
+        ポーリング間隔は poll_interval から指数的に伸ばし、max_poll_interval で頭打ちにする。
+        短いジョブは早く検知でき、長いジョブでは無駄なAPI呼び出しを減らせる。
+
         Args:
             talk_id: トークID
             timeout: タイムアウト（秒）
-            poll_interval: ポーリング間隔（秒）
+            poll_interval: 初回のポーリング間隔（秒）
+            max_poll_interval: ポーリング間隔の上限（秒）
 
         Returns:
             result_url: 動画URL（成功時）
             None: タイムアウトまたはエラー時
         """
-        start_time = time.time()
+        deadline = time.time() + timeout
+        delay = poll_interval
 
-        while time.time() - start_time < timeout:
+        while True:
             result = self.get_talk(talk_id)
             status = result.get('status')
 
@@ -156,7 +208,12 @@ class DIDClient:
                 print(f"❌ D-ID error: {result.get('error')}")
                 return None
 
-            time.sleep(poll_interval)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 1.6, max_poll_interval)
 
         print(f"⏱️ D-ID timeout after {timeout}s")
         return None
@@ -165,23 +222,83 @@ class DIDClient:
         """トーク動画を削除"""
         endpoint = f"{self.base_url}/talks/{talk_id}"
 
-        response = requests.delete(endpoint, headers=self.headers)
+        response = self.session.delete(endpoint)
         return response.status_code == 200
 
+    def save_video_to_cache(self, cache_key: str, **kwargs) -> bool:
+        """生成した動画をキャッシュに保存（save_video_to_cacheを参照）"""
+        if not self.supabase_client:
+            return False
+        return save_video_to_cache(self.supabase_client, cache_key, **kwargs)
+
+    def download_video_to_storage(self, video_url: str, cache_key: str) -> Optional[Dict]:
+        """D-IDの動画をStorageに保存（download_video_to_storageを参照）"""
+        if not self.supabase_client:
+            return None
+        return download_video_to_storage(self.supabase_client, video_url, cache_key)
+
+
+_DID_CLIENT: Optional[DIDClient] = None
+_DID_CLIENT_LOCK = threading.Lock()
+
+
+def get_did_client(supabase_client=None) -> Optional[DIDClient]:
+    """
+    D-IDクライアントのインスタンスを取得（接続プールを共有するためプロセス内で使い回す）
+
+    Args:
+        supabase_client: キャッシュ用のSupabaseクライアント（指定時にクライアントへ紐付ける）
+    """
+    global _DID_CLIENT
 
-def get_did_client() -> Optional[DIDClient]:
-    """D-IDクライアントのインスタンスを取得"""
     api_key = os.getenv('D_ID_API_KEY')
 
     if not api_key:
         print("⚠️ D_ID_API_KEY not set")
         return None
 
-    return DIDClient(api_key)
+    with _DID_CLIENT_LOCK:
+        if _DID_CLIENT is None or _DID_CLIENT.api_key != api_key:
+            _DID_CLIENT = DIDClient(api_key, supabase_client)
+        elif supabase_client is not None:
+            _DID_CLIENT.supabase_client = supabase_client
+        return _DID_CLIENT
 
 
 # ===== Week 7: キャッシング機能 =====
 
+# プロセス内LRUキャッシュ（Supabaseへの往復を省く）: cache_key -> (row, 保存時刻)
+_LOCAL_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_LOCAL_CACHE_MAX_SIZE = 512
+_LOCAL_CACHE_TTL_SECONDS = 3600
+_LOCAL_CACHE_LOCK = threading.Lock()
+
+
+def _get_local_cache(cache_key: str) -> Optional[Dict]:
+    """プロセス内キャッシュから取得（期限切れは破棄）"""
+    with _LOCAL_CACHE_LOCK:
+        entry = _LOCAL_CACHE.get(cache_key)
+        if entry is None:
+            return None
+
+        row, stored_at = entry
+        if time.time() - stored_at > _LOCAL_CACHE_TTL_SECONDS:
+            del _LOCAL_CACHE[cache_key]
+            return None
+
+        _LOCAL_CACHE.move_to_end(cache_key)
+        return row
+
+
+def _set_local_cache(cache_key: str, row: Dict) -> None:
+    """プロセス内キャッシュに保存（上限を超えたら最も古いものを削除）"""
+    with _LOCAL_CACHE_LOCK:
+        _LOCAL_CACHE[cache_key] = (row, time.time())
+        _LOCAL_CACHE.move_to_end(cache_key)
+        if len(_LOCAL_CACHE) > _LOCAL_CACHE_MAX_SIZE:
+            _LOCAL_CACHE.popitem(last=False)
+
+
 def generate_cache_key(text: str, voice_id: str, avatar_url: str) -> str:
     """
     キャッシュキーを生成
@@ -199,6 +316,59 @@ def generate_cache_key(text: str, voice_id: str, avatar_url: str) -> str:
     return hashlib.sha256(combined.encode('utf-8')).hexdigest()
 
 
+def _as_cache_hit(cached_video: Dict) -> Dict:
+    """キャッシュ行をヒットごとに別イベントとして扱えるよう、新しいIDと時刻を付けて返す"""
+    return {
+        **cached_video,
+        'id': f"cache-{uuid.uuid4()}",
+        'original_id': cached_video.get('id'),
+        'cache_hit': True,
+        'created': int(time.time())
+    }
+
+
+# bump_and_get_cache関数が未作成の場合はFalseにし、以降はSELECT + UPDATEで取得する
+_BUMP_RPC_AVAILABLE = True
+# PostgRESTの「関数が見つからない」エラーコード
+_MISSING_FUNCTION_CODES = ('PGRST202', '42883')
+
+
+def _bump_and_get_cache(supabase_client, cache_key: str) -> Optional[Dict]:
+    """
+    キャッシュ行を取得し、ヒット数を加算する（更新後の行を返す。無ければNone）
+
+    取得と加算を1回のRPCで行う（database/12_bump_and_get_video_cache.sql）。
+    関数が未作成、またはRPCが失敗した場合はSELECTしてからUPDATEする
+    """
+    global _BUMP_RPC_AVAILABLE
+
+    if _BUMP_RPC_AVAILABLE:
+        try:
+            result = supabase_client.rpc('bump_and_get_cache', {'p_key': cache_key}).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            if getattr(e, 'code', None) in _MISSING_FUNCTION_CODES:
+                _BUMP_RPC_AVAILABLE = False
+                print("⚠️ bump_and_get_cache関数が未作成のため、SELECT + UPDATEで取得します")
+            else:
+                print(f"⚠️ bump_and_get_cache呼び出しエラー（SELECT + UPDATEで取得します）: {e}")
+
+    result = supabase_client.table('video_cache').select('*').eq('cache_key', cache_key).execute()
+    if not result.data:
+        return None
+
+    cached_video = result.data[0]
+    cached_video['hit_count'] = cached_video.get('hit_count', 0) + 1
+    try:
+        supabase_client.table('video_cache').update({
+            'hit_count': cached_video['hit_count']
+        }).eq('cache_key', cache_key).execute()
+    except Exception as e:
+        # ヒット数の更新に失敗しても取得した動画は返す
+        print(f"⚠️ ヒット数更新エラー: {e}")
+    return cached_video
+
+
 def get_cached_video(supabase_client, cache_key: str) -> Optional[Dict]:
     """
     キャッシュから動画を取得
@@ -211,23 +381,26 @@ def get_cached_video(supabase_client, cache_key: str) -> Optional[Dict]:
         {
             'video_url': 'https://...',
             'hit_count': 10,
+            'id': 'cache-<uuid>',  # ヒットごとに新しいID
+            'original_id': ...,    # キャッシュ行のID
+            'cache_hit': True,
+            'created': 1700000000,
             ...
         } または None
     """
-    try:
-        result = supabase_client.table('video_cache').select('*').eq('cache_key', cache_key).execute()
-
-        if result.data and len(result.data) > 0:
-            cached_video = result.data[0]
+    # まずプロセス内キャッシュを確認（ヒット時はSupabaseに問い合わせない）
+    cached_video = _get_local_cache(cache_key)
+    if cached_video:
+        print(f"✅ ローカルキャッシュヒット: {cache_key[:16]}...")
+        return _as_cache_hit(cached_video)
 
-            # ヒットカウントを増やす
-            new_hit_count = cached_video.get('hit_count', 0) + 1
-            supabase_client.table('video_cache').update({
-                'hit_count': new_hit_count
-            }).eq('cache_key', cache_key).execute()
+    try:
+        cached_video = _bump_and_get_cache(supabase_client, cache_key)
 
-            print(f"✅ キャッシュヒット: {cache_key[:16]}... (ヒット数: {new_hit_count})")
-            return cached_video
+        if cached_video:
+            print(f"✅ キャッシュヒット: {cache_key[:16]}... (ヒット数: {cached_video.get('hit_count', 0)})")
+            _set_local_cache(cache_key, cached_video)
+            return _as_cache_hit(cached_video)
 
         print(f"❌ キャッシュミス: {cache_key[:16]}...")
         return None
@@ -237,6 +410,119 @@ def get_cached_video(supabase_client, cache_key: str) -> Optional[Dict]:
         return None
 
 
+# キャッシュ書き込みの遅延バッファ（複数行をまとめて1回のINSERTで送る）
+_PENDING_ROWS: Dict[str, Dict] = {}
+_PENDING_CLIENT = None
+_PENDING_LOCK = threading.Lock()
+_FLUSH_EVENT = threading.Event()
+_FLUSH_THREAD: Optional[threading.Thread] = None
+_FLUSH_INTERVAL_SECONDS = 2
+_FLUSH_BATCH_SIZE = 20
+# 書き込みに失敗した行を再送する回数の上限（cache_key -> 失敗回数）
+_FLUSH_MAX_ATTEMPTS = 5
+_FLUSH_ATTEMPTS: Dict[str, int] = {}
+# content_hash列が未作成（database/13_add_video_cache_content_hash.sql 未適用）の場合はFalseにし、以降は送らない
+_CONTENT_HASH_COLUMN_AVAILABLE = True
+# PostgREST・PostgreSQLの「列が見つからない」エラーコード
+_MISSING_COLUMN_CODES = ('PGRST204', '42703')
+
+
+def _requeue_failed_rows(batch: list) -> None:
+    """
+    書き込みに失敗した行を保留バッファに戻す（次回のフラッシュで再送）
+
+    失敗中に同じcache_keyの新しい行が追加されていればそちらを優先し、
+    失敗回数が上限に達した行は破棄する
+    """
+    with _PENDING_LOCK:
+        for row in batch:
+            cache_key = row['cache_key']
+            if cache_key in _PENDING_ROWS:
+                continue
+            attempts = _FLUSH_ATTEMPTS.get(cache_key, 0) + 1
+            if attempts >= _FLUSH_MAX_ATTEMPTS:
+                _FLUSH_ATTEMPTS.pop(cache_key, None)
+                print(f"❌ キャッシュ保存を断念: {cache_key[:16]}... ({attempts}回失敗)")
+                continue
+            _FLUSH_ATTEMPTS[cache_key] = attempts
+            _PENDING_ROWS[cache_key] = row
+
+
+def _upsert_cache_rows(supabase_client, batch: list) -> None:
+    """
+    キャッシュ行をまとめてUPSERTする
+
+    content_hash列が未作成の場合は1回だけ検出し、以降はcontent_hashを除いて送る
+    """
+    global _CONTENT_HASH_COLUMN_AVAILABLE
+
+    def upsert(rows: list) -> None:
+        # 同じcache_keyが既にあれば無視（同時生成による重複でバッチ全体を失敗させない）
+        supabase_client.table('video_cache').upsert(
+            rows,
+            on_conflict='cache_key',
+            ignore_duplicates=True
+        ).execute()
+
+    def without_content_hash(rows: list) -> list:
+        return [{key: value for key, value in row.items() if key != 'content_hash'} for row in rows]
+
+    if not _CONTENT_HASH_COLUMN_AVAILABLE:
+        upsert(without_content_hash(batch))
+        return
+
+    try:
+        upsert(batch)
+    except Exception as e:
+        message = f"{getattr(e, 'message', '')} {e}"
+        if getattr(e, 'code', None) not in _MISSING_COLUMN_CODES or 'content_hash' not in message:
+            raise
+        _CONTENT_HASH_COLUMN_AVAILABLE = False
+        print("⚠️ video_cacheにcontent_hash列が無いため、content_hashを除いて保存します")
+        upsert(without_content_hash(batch))
+
+
+def flush_video_cache_writes() -> int:
+    """
+    保留中のキャッシュ行をまとめてSupabaseに書き込む
+
+    失敗した行は保留バッファに戻し、次回のフラッシュで再送する（_FLUSH_MAX_ATTEMPTS回まで）
+
+    Returns:
+        書き込んだ行数
+    """
+    with _PENDING_LOCK:
+        if not _PENDING_ROWS:
+            return 0
+        batch = list(_PENDING_ROWS.values())
+        supabase_client = _PENDING_CLIENT
+        _PENDING_ROWS.clear()
+
+    try:
+        _upsert_cache_rows(supabase_client, batch)
+        with _PENDING_LOCK:
+            for row in batch:
+                _FLUSH_ATTEMPTS.pop(row['cache_key'], None)
+        print(f"💾 キャッシュ保存完了: {len(batch)}件")
+        return len(batch)
+
+    except Exception as e:
+        print(f"⚠️ キャッシュ保存エラー（{len(batch)}件を再送します）: {e}")
+        _requeue_failed_rows(batch)
+        return 0
+
+
+def _flush_loop() -> None:
+    """一定間隔、またはバッファが溜まった時点で書き込むバックグラウンドループ"""
+    while True:
+        _FLUSH_EVENT.wait(_FLUSH_INTERVAL_SECONDS)
+        _FLUSH_EVENT.clear()
+        flush_video_cache_writes()
+
+
+atexit.register(flush_video_cache_writes)
+
+
 def save_video_to_cache(
     supabase_client,
     cache_key: str,
@@ -246,10 +532,17 @@ def save_video_to_cache(
     video_url: str,
     storage_path: str,
     file_size_bytes: int = 0,
-    duration_seconds: float = 0
+    duration_seconds: float = 0,
+    content_hash: Optional[str] = None
 ) -> bool:
     """
-    生成した動画をキャッシュに保存
+    生成した動画をキャッシュへの書き込み待ちに追加
+
+    Supabaseへの書き込みはバッファに積んで即座に返り、
+    バックグラウンドスレッドがまとめてINSERTする（プロセス内キャッシュには即時反映）。
+    書き込みはベストエフォートで、失敗時の再送が上限に達した場合や、
+    フラッシュ前にプロセスが強制終了（SIGKILL等）された場合はvideo_cacheに行が残らない
+    （Storageの動画は残り、同じcache_keyで再生成した際に同じパスへ上書きされる）
 
     Args:
         supabase_client: Supabaseクライアント
@@ -261,34 +554,47 @@ def save_video_to_cache(
         storage_path: Storageパス
         file_size_bytes: ファイルサイズ
         duration_seconds: 動画の長さ
+        content_hash: 動画ファイルの内容ハッシュ（content_hash列が無い場合は保存しない）
 
     Returns:
-        成功: True, 失敗: False
+        書き込み待ちに追加した: True（Supabaseへの保存完了を意味しない）
     """
-    try:
-        supabase_client.table('video_cache').insert({
-            'cache_key': cache_key,
-            'text_content': text,
-            'voice_id': voice_id,
-            'avatar_url': avatar_url,
-            'video_url': video_url,
-            'storage_path': storage_path,
-            'file_size_bytes': file_size_bytes,
-            'duration_seconds': duration_seconds,
-            'hit_count': 0
-        }).execute()
+    global _PENDING_CLIENT, _FLUSH_THREAD
 
-        print(f"💾 キャッシュ保存完了: {cache_key[:16]}...")
-        return True
+    row = {
+        'cache_key': cache_key,
+        'text_content': text,
+        'voice_id': voice_id,
+        'avatar_url': avatar_url,
+        'video_url': video_url,
+        'storage_path': storage_path,
+        'file_size_bytes': file_size_bytes,
+        'duration_seconds': duration_seconds,
+        'content_hash': content_hash,
+        'hit_count': 0
+    }
 
-    except Exception as e:
-        print(f"⚠️ キャッシュ保存エラー: {e}")
-        return False
+    _set_local_cache(cache_key, row)
+
+    with _PENDING_LOCK:
+        _PENDING_ROWS[cache_key] = row
+        _PENDING_CLIENT = supabase_client
+        pending_count = len(_PENDING_ROWS)
+
+        if _FLUSH_THREAD is None:
+            _FLUSH_THREAD = threading.Thread(target=_flush_loop, name='video-cache-flush', daemon=True)
+            _FLUSH_THREAD.start()
 
+    if pending_count >= _FLUSH_BATCH_SIZE:
+        _FLUSH_EVENT.set()
 
-def download_video_to_storage(supabase_client, video_url: str, cache_key: str) -> Optional[str]:
+    print(f"📝 キャッシュ保存をキューに追加: {cache_key[:16]}... (保留: {pending_count}件)")
+    return True
+
+
+def download_video_to_storage(supabase_client, video_url: str, cache_key: str) -> Optional[Dict]:
     """
-    D-IDから動画をダウンロードしてSupabase Storageに保存
+    D-IDから動画をダウンロードしてSupabase Storageに保存（ダウンロードしながら内容ハッシュも計算する）
 
     Args:
         supabase_client: Supabaseクライアント
@@ -296,22 +602,37 @@ def download_video_to_storage(supabase_client, video_url: str, cache_key: str) -
         cache_key: キャッシュキー
 
     Returns:
-        Supabase StorageのパブリックURL または None
+        {
+            'video_url': 'https://...',  # Supabase StorageのパブリックURL
+            'storage_path': 'video_cache/...mp4',
+            'content_hash': '...',
+            'file_size_bytes': 123456
+        } または None
     """
+    temp_path = None
     try:
-        # D-IDから動画をダウンロード
-        response = requests.get(video_url, timeout=30)
-        response.raise_for_status()
-        video_data = response.content
+        # D-IDから動画をチャンク単位でダウンロード（動画全体をメモリに載せない）
+        content_hasher = hashlib.blake2b(digest_size=16)
+        file_size_bytes = 0
+        with requests.get(video_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
+                temp_path = temp_file.name
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    temp_file.write(chunk)
+                    content_hasher.update(chunk)
+                    file_size_bytes += len(chunk)
+
+        content_hash = content_hasher.hexdigest()
 
         # Supabase Storageに保存
         storage_path = f"video_cache/{cache_key}.mp4"
         bucket_name = "videos"  # Supabaseバケット名（事前に作成が必要）
 
-        # アップロード
+        # アップロード（ファイルパスを渡すとディスクから読み出して送信される）
         supabase_client.storage.from_(bucket_name).upload(
             storage_path,
-            video_data,
+            temp_path,
             {
                 "content-type": "video/mp4",
                 "cache-control": "3600",
@@ -323,8 +644,232 @@ def download_video_to_storage(supabase_client, video_url: str, cache_key: str) -
         public_url = supabase_client.storage.from_(bucket_name).get_public_url(storage_path)
 
         print(f"📤 動画をStorageに保存: {storage_path}")
-        return public_url
+        return {
+            'video_url': public_url,
+            'storage_path': storage_path,
+            'content_hash': content_hash,
+            'file_size_bytes': file_size_bytes
+        }
 
     except Exception as e:
         print(f"⚠️ Storage保存エラー: {e}")
         return None
+
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+# ===== 意味的キャッシュ（言い回しの微差でも既存動画を再利用） =====
+
+SEMANTIC_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'rag_index')
+# 登録した動画のEmbeddingを1行ずつ追記するログ（全ワーカーで共有し、書き込みは追記のみ）
+SEMANTIC_CACHE_LOG_PATH = os.path.join(SEMANTIC_CACHE_DIR, 'video_cache.jsonl')
+SEMANTIC_CACHE_EMBEDDING_MODEL = "text-embedding-3-large"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# (音声ID, アバターURL) -> (FAISSインデックス, 行番号 -> cache_key)
+# 音声・アバターごとに分けて、条件の一致する候補だけを検索する
+_SEMANTIC_INDEXES: Dict[tuple, tuple] = {}
+_SEMANTIC_LOG_OFFSET = 0  # ログを読み込み済みの位置
+_SEMANTIC_LOCK = threading.Lock()
+
+
+def _sync_semantic_index() -> None:
+    """ログの未読部分（他のワーカーが追記した分を含む）をインデックスに取り込む"""
+    global _SEMANTIC_LOG_OFFSET
+
+    if not os.path.exists(SEMANTIC_CACHE_LOG_PATH):
+        return
+
+    with open(SEMANTIC_CACHE_LOG_PATH, 'rb') as f:
+        f.seek(_SEMANTIC_LOG_OFFSET)
+        data = f.read()
+
+    # 書き込み途中の行（改行で終わっていない行）は次回読み込む
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        try:
+            entry = json.loads(line)
+            embedding = np.frombuffer(base64.b64decode(entry['embedding']), dtype=np.float32).reshape(1, -1)
+        except (ValueError, KeyError):
+            continue
+
+        key = (entry['voice_id'], entry['avatar_url'])
+        if key not in _SEMANTIC_INDEXES:
+            # L2正規化したベクトルの内積 = コサイン類似度
+            _SEMANTIC_INDEXES[key] = (faiss.IndexFlatIP(embedding.shape[1]), [])
+        index, cache_keys = _SEMANTIC_INDEXES[key]
+        if index.d != embedding.shape[1]:
+            continue
+        index.add(embedding)
+        cache_keys.append(entry['cache_key'])
+
+    _SEMANTIC_LOG_OFFSET += end
+
+
+def _append_semantic_log(line: bytes) -> None:
+    """ログに1行追記する（他のワーカーの追記と混ざらないよう、可能ならファイルロックする）"""
+    os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+    fd = os.open(SEMANTIC_CACHE_LOG_PATH, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        # 書き込み途中で中断された行が末尾にあれば、つながらないよう改行してから追記する
+        if os.lseek(fd, 0, os.SEEK_END) > 0:
+            os.lseek(fd, -1, os.SEEK_END)
+            if os.read(fd, 1) != b'\n':
+                line = b'\n' + line
+        view = memoryview(line)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def embed_cache_text(openai_client, text: str):
+    """
+    キャッシュ検索用にテキストをEmbedding化
+
+    Returns:
+        L2正規化済みの (1, d) float32配列（FAISS未導入の場合はNone）
+    """
+    if not FAISS_AVAILABLE:
+        return None
+
+    response = openai_client.embeddings.create(
+        model=SEMANTIC_CACHE_EMBEDDING_MODEL,
+        input=[text]
+    )
+    embedding = np.array([response.data[0].embedding], dtype=np.float32)
+    faiss.normalize_L2(embedding)
+    return embedding
+
+
+def has_semantic_candidates(voice_id: str, avatar_url: str) -> bool:
+    """
+    音声IDとアバターURLの組に意味的キャッシュの候補があるか
+
+    候補が無ければ検索しても当たらないため、Embedding APIを呼ばずに済ませる
+    """
+    if not FAISS_AVAILABLE:
+        return False
+
+    with _SEMANTIC_LOCK:
+        _sync_semantic_index()
+        entry = _SEMANTIC_INDEXES.get((voice_id, avatar_url))
+        return entry is not None and entry[0].ntotal > 0
+
+
+def get_cached_video_semantic(
+    supabase_client,
+    embedding,
+    voice_id: str,
+    avatar_url: str,
+    threshold: float = SEMANTIC_CACHE_THRESHOLD
+) -> Optional[Dict]:
+    """
+    意味的に同一なテキストの動画をキャッシュから取得
+
+    音声IDとアバターURLが完全一致する候補の中で、
+    コサイン類似度がthreshold以上のものがあればその動画を返す
+
+    Args:
+        supabase_client: Supabaseクライアント
+        embedding: embed_cache_text() の戻り値
+        voice_id: 音声ID
+        avatar_url: アバター画像URL
+        threshold: 類似度のしきい値
+
+    Returns:
+        キャッシュ行 または None
+    """
+    if embedding is None:
+        return None
+
+    with _SEMANTIC_LOCK:
+        _sync_semantic_index()
+        entry = _SEMANTIC_INDEXES.get((voice_id, avatar_url))
+        if entry is None or entry[0].d != embedding.shape[1]:
+            return None
+
+        index, cache_keys = entry
+        scores, indices = index.search(embedding, 1)
+        score, idx = scores[0][0], indices[0][0]
+        if idx < 0 or score < threshold:
+            return None
+        cache_key = cache_keys[idx]
+        print(f"🔎 意味的キャッシュ候補: {cache_key[:16]}... (類似度: {score:.3f})")
+
+    return get_cached_video(supabase_client, cache_key)
+
+
+def add_to_semantic_cache(embedding, cache_key: str, voice_id: str, avatar_url: str) -> bool:
+    """
+    生成した動画を意味的キャッシュのインデックスに登録
+
+    Args:
+        embedding: embed_cache_text() の戻り値
+        cache_key: キャッシュキー
+        voice_id: 音声ID
+        avatar_url: アバター画像URL
+
+    Returns:
+        成功: True, 失敗: False
+    """
+    if embedding is None:
+        return False
+
+    try:
+        line = json.dumps({
+            'cache_key': cache_key,
+            'voice_id': voice_id,
+            'avatar_url': avatar_url,
+            'embedding': base64.b64encode(embedding[0].tobytes()).decode('ascii')
+        }, ensure_ascii=False).encode('utf-8') + b'\n'
+
+        # ファイル全体を書き直さず1行追記し、追記した行（と他のワーカーの追記分）をインデックスに取り込む
+        with _SEMANTIC_LOCK:
+            _append_semantic_log(line)
+            _sync_semantic_index()
+
+        return True
+
+    except Exception as e:
+        print(f"⚠️ 意味的キャッシュ登録エラー: {e}")
+        return False
+
+
+def add_to_semantic_cache_async(
+    openai_client,
+    text: str,
+    embedding,
+    cache_key: str,
+    voice_id: str,
+    avatar_url: str
+) -> None:
+    """
+    生成済みの動画を意味的キャッシュにバックグラウンドで登録
+
+    生成前にEmbeddingを計算していない場合はここで計算するため、
+    レスポンスを返すまでの時間には影響しない
+
+    Args:
+        openai_client: OpenAIクライアント（Embedding未計算時に使用）
+        text: 動画のテキスト
+        embedding: embed_cache_text() の戻り値（未計算ならNone）
+        cache_key: キャッシュキー
+        voice_id: 音声ID
+        avatar_url: アバター画像URL
+    """
+    if not FAISS_AVAILABLE or (embedding is None and openai_client is None):
+        return
+
+    def _register():
+        try:
+            vector = embedding if embedding is not None else embed_cache_text(openai_client, text)
+            add_to_semantic_cache(vector, cache_key, voice_id, avatar_url)
+        except Exception as e:
+            print(f"⚠️ 意味的キャッシュ登録エラー: {e}")
+
+    threading.Thread(target=_register, name='semantic-cache-register', daemon=True).start()
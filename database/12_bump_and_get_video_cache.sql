@@ -0,0 +1,16 @@
+-- Week 7: 動画キャッシュ取得の最適化
+-- キャッシュ取得（SELECT）とヒット数更新（UPDATE）を1回のRPCにまとめる
+-- ・往復回数が2回→1回になる
+-- ・UPDATE ... RETURNING で原子的に加算するため、同時ヒット時にカウントが失われない
+-- ・video_cache には SELECT のポリシーしか無いため、SECURITY DEFINER で実行する
+--   （anonキーで接続した場合もRLSでUPDATEが0件にならない。search_pathは固定する）
+
+CREATE OR REPLACE FUNCTION bump_and_get_cache(p_key TEXT)
+RETURNS SETOF video_cache AS $$
+  UPDATE video_cache
+  SET hit_count = hit_count + 1
+  WHERE cache_key = p_key
+  RETURNING *;
+$$ LANGUAGE SQL SECURITY DEFINER SET search_path = public;
+
+COMMENT ON FUNCTION bump_and_get_cache(TEXT) IS 'cache_keyに一致する動画キャッシュのhit_countを加算し、更新後の行を返す';
@@ -0,0 +1,7 @@
+-- Week 7: 動画キャッシュの内容ハッシュ
+-- 動画ファイルの内容ハッシュ（BLAKE2b 128bit）を保存し、Storageの動画の同一性を確認できるようにする
+-- ・未適用の場合、d_id_client.py はcontent_hashを除いてキャッシュ行を保存する
+
+ALTER TABLE video_cache ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+COMMENT ON COLUMN video_cache.content_hash IS '動画ファイルの内容ハッシュ（BLAKE2b 128bit）';
@@ -0,0 +1,12 @@
+-- Week 7: データベース確認スクリプトの最適化
+-- publicスキーマのテーブル一覧を1回のRPCで取得する
+-- ・tools/verify_database.py がテーブルごとにリクエストせず、1往復で存在確認できる
+
+CREATE OR REPLACE FUNCTION list_tables()
+RETURNS SETOF TEXT AS $$
+  SELECT table_name::TEXT
+  FROM information_schema.tables
+  WHERE table_schema = 'public';
+$$ LANGUAGE SQL STABLE;
+
+COMMENT ON FUNCTION list_tables() IS 'publicスキーマのテーブル名一覧を返す';
@@ -2,33 +2,37 @@
 """
 既存のRAGメタデータにscenario_idを追加するスクリプト
 """
-import json
-import re
-
-RAG_METADATA_PATH = 'rag_index/sales_patterns.json'
+import sys
+from collections import Counter
+from pathlib import Path
+
+# JSONの読み書きはtools/json_common.pyの共通処理を使う（orjsonがあれば高速に読み書きする）
+sys.path.insert(0, str(Path(__file__).parent / 'tools'))
+from json_common import read_json, write_json
+
+RAG_METADATA_PATH = Path('rag_index/sales_patterns.json')
+
+# ファイル名に含まれるシナリオID（すべて固定文字列なので正規表現は不要）
+SCENARIO_IDS = (
+    'meeting_1st',
+    'meeting_1_5th',
+    'meeting_2nd',
+    'meeting_3rd',
+    'kickoff_meeting',
+    'upsell',
+)
 
 def extract_scenario_id(filename: str) -> str:
     """ファイル名からシナリオIDを抽出"""
-    patterns = [
-        r'(meeting_1st)',
-        r'(meeting_1_5th)',
-        r'(meeting_2nd)',
-        r'(meeting_3rd)',
-        r'(kickoff_meeting)',
-        r'(upsell)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, filename)
-        if match:
-            return match.group(1)
+    for scenario_id in SCENARIO_IDS:
+        if scenario_id in filename:
+            return scenario_id
 
     # デフォルト
     return 'unknown'
 
 # メタデータを読み込み
-with open(RAG_METADATA_PATH, 'r', encoding='utf-8') as f:
-    metadata = json.load(f)
+metadata = read_json(RAG_METADATA_PATH)
 
 print(f"📂 メタデータ読み込み: {len(metadata)}件")
 
@@ -46,17 +50,13 @@ for item in metadata:
 print(f"\n✅ 修正完了: {fixed_count}件")
 
 # 統計情報
-scenario_stats = {}
-for item in metadata:
-    scenario_id = item.get('scenario_id', 'unknown')
-    scenario_stats[scenario_id] = scenario_stats.get(scenario_id, 0) + 1
+scenario_stats = Counter(item.get('scenario_id', 'unknown') for item in metadata)
 
 print(f"\n📊 シナリオ別データ数:")
 for scenario_id, count in sorted(scenario_stats.items()):
     print(f"  {scenario_id}: {count}件")
 
 # 保存
-with open(RAG_METADATA_PATH, 'w', encoding='utf-8') as f:
-    json.dump(metadata, f, ensure_ascii=False, indent=2)
+write_json(RAG_METADATA_PATH, metadata)
 
 print(f"\n💾 保存完了: {RAG_METADATA_PATH}")
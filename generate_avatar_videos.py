@@ -4,7 +4,7 @@ D-ID APIを使ってアバター表情動画を自動生成するスクリプト
 """
 import os
 import requests
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from d_id_client import get_did_client
 from dotenv import load_dotenv
 
@@ -16,6 +16,9 @@ AVATAR_URL = "https://d-id-public-bucket.s3.amazonaws.com/alice.jpg"
 # 出力ディレクトリ
 OUTPUT_DIR = "public/videos/avatar_03"
 
+# 同時に生成するジョブ数（D-IDのレート制限を考慮）
+MAX_CONCURRENT_JOBS = 3
+
 # 6種類の表情に対応するテキストと音声設定
 EXPRESSIONS = {
     "listening": {
@@ -64,13 +67,15 @@ def download_video(video_url: str, output_path: str) -> bool:
     """
     try:
         print(f"📥 動画ダウンロード中: {output_path}")
-        response = requests.get(video_url, timeout=60)
-        response.raise_for_status()
+        # チャンク単位でファイルへ書き出す（動画全体をメモリに載せない）
+        with requests.get(video_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
 
-        with open(output_path, 'wb') as f:
-            f.write(response.content)
+            with open(output_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
 
-        file_size_mb = len(response.content) / (1024 * 1024)
+        file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
         print(f"✅ ダウンロード完了: {file_size_mb:.2f} MB")
         return True
 
@@ -122,7 +127,7 @@ def generate_expression_video(
 
         # 完了を待機
         print("⏳ 動画生成中... (最大2分)")
-        video_url = client.wait_for_completion(talk_id, timeout=120, poll_interval=3)
+        video_url = client.wait_for_completion(talk_id, timeout=120)
 
         if not video_url:
             print(f"❌ 動画生成失敗: {expression_name}")
@@ -162,25 +167,25 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     print(f"📁 出力ディレクトリ: {OUTPUT_DIR}")
 
-    # 各表情動画を生成
+    # 各表情動画を並列生成（D-ID側の処理待ちが大半なのでスレッドで重ねる）
     success_count = 0
     total_count = len(EXPRESSIONS)
 
-    for expression_name, config in EXPRESSIONS.items():
-        success = generate_expression_video(
-            client,
-            expression_name,
-            config,
-            OUTPUT_DIR
-        )
-
-        if success:
-            success_count += 1
-
-        # API制限を考慮して待機（次のリクエストまで5秒）
-        if expression_name != list(EXPRESSIONS.keys())[-1]:  # 最後でなければ
-            print("\n⏸️  5秒待機中...")
-            time.sleep(5)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS) as executor:
+        futures = {
+            executor.submit(
+                generate_expression_video,
+                client,
+                expression_name,
+                config,
+                OUTPUT_DIR
+            ): expression_name
+            for expression_name, config in EXPRESSIONS.items()
+        }
+
+        for future in as_completed(futures):
+            if future.result():
+                success_count += 1
 
     # 結果サマリー
     print(f"\n{'='*60}")
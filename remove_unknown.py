@@ -1,45 +1,62 @@
 #!/usr/bin/env python3
 """
 RAGデータからscenario_id='unknown'のエントリを削除するスクリプト
+
+Usage: python remove_unknown.py
+  インデックスの種別（flat / hnsw / hnsw_sq8 / ivfpq）は保存済みのインデックスのまま変えない
 """
-import json
+import sys
+from collections import Counter
+from pathlib import Path
 import numpy as np
 import faiss
 
+# JSONの読み書きはtools/json_common.pyの共通処理を使う（orjsonがあれば高速に読み書きする）
+sys.path.insert(0, str(Path(__file__).parent / 'tools'))
+from json_common import read_json, write_json
+
+
 # 既存のメタデータとインデックスを読み込み
 print("Loading existing RAG data...")
-with open('rag_index/sales_patterns.json', 'r', encoding='utf-8') as f:
-    metadata = json.load(f)
+metadata = read_json(Path('rag_index/sales_patterns.json'))
 
 index = faiss.read_index('rag_index/sales_patterns.faiss')
 
 print(f"Total entries before filtering: {len(metadata)}")
 
-# scenario_id が 'unknown' でないものだけをフィルタ
-filtered_metadata = [item for item in metadata if item.get('scenario_id') != 'unknown']
-unknown_count = len(metadata) - len(filtered_metadata)
+# scenario_id が 'unknown' かどうかを1回だけ判定し、行番号とフィルタ結果の両方に使う
+is_unknown = np.fromiter(
+    (item.get('scenario_id') == 'unknown' for item in metadata),
+    dtype=bool,
+    count=len(metadata)
+)
+unknown_ids = np.flatnonzero(is_unknown).astype('int64')
+filtered_metadata = [item for item, unknown in zip(metadata, is_unknown) if not unknown]
+unknown_count = len(unknown_ids)
 
 print(f"Entries with scenario_id='unknown': {unknown_count}")
 print(f"Total entries after filtering: {len(filtered_metadata)}")
 
-# unknownのインデックスを特定
-unknown_indices = [i for i, item in enumerate(metadata) if item.get('scenario_id') == 'unknown']
+if isinstance(index, faiss.IndexFlat):
+    # FAISSインデックスから該当ベクトルを削除
+    # IndexFlatのremove_idsは残りの行を詰めるため、行番号はfiltered_metadataと一致したまま
+    # （ベクトルの再構築や一時バッファは不要）
+    index.remove_ids(unknown_ids)
+else:
+    # HNSWは行の削除に対応せず、IVFは削除しても行番号が詰まらないため、残すベクトルだけで作り直す
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # IVFは行番号からベクトルを取り出すための対応表が必要
+        ivf.make_direct_map()
+    keep_mask = np.ones(index.ntotal, dtype=bool)
+    keep_mask[unknown_ids] = False
+    vectors = np.ascontiguousarray(index.reconstruct_n(0, index.ntotal)[keep_mask])
 
-# FAISSインデックスから該当ベクトルを削除
-# FAISSのIndexFlatL2は直接削除できないので、unknownでないものだけで再構築
-valid_indices = [i for i in range(len(metadata)) if i not in unknown_indices]
-
-# 既存のベクトルを取得して、valid_indicesのものだけで新しいインデックスを作成
-d = index.d  # ベクトルの次元数
-new_index = faiss.IndexFlatL2(d)
-
-# 既存のベクトルを抽出
-vectors = np.zeros((len(valid_indices), d), dtype='float32')
-for new_idx, old_idx in enumerate(valid_indices):
-    vectors[new_idx] = index.reconstruct(old_idx)
-
-# 新しいインデックスに追加
-new_index.add(vectors)
+    # 同じ種別・構築パラメータの空のインデックスに入れ直す（量子化の学習結果も引き継ぐ）
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    new_index.add(vectors)
+    index = new_index
 
 # バックアップを作成
 print("\nCreating backups...")
@@ -51,18 +68,16 @@ shutil.copy('rag_index/sales_patterns.faiss', f'rag_index/sales_patterns_backup_
 
 # 新しいデータを保存
 print("Saving filtered data...")
-with open('rag_index/sales_patterns.json', 'w', encoding='utf-8') as f:
-    json.dump(filtered_metadata, f, ensure_ascii=False, indent=2)
+write_json(Path('rag_index/sales_patterns.json'), filtered_metadata)
 
-faiss.write_index(new_index, 'rag_index/sales_patterns.faiss')
+faiss.write_index(index, 'rag_index/sales_patterns.faiss')
 
 print(f"\n✓ Successfully removed {unknown_count} entries with scenario_id='unknown'")
 print(f"✓ New total: {len(filtered_metadata)} entries")
 print(f"✓ Backups saved with timestamp: {timestamp}")
 
 # scenario_id別の統計を表示
-from collections import Counter
-scenario_counts = Counter(item['scenario_id'] for item in filtered_metadata)
+scenario_counts = Counter(item.get('scenario_id', 'unknown') for item in filtered_metadata)
 print("\nScenario distribution after cleanup:")
 for scenario, count in sorted(scenario_counts.items()):
     print(f"  {scenario}: {count}")
@@ -2,15 +2,30 @@
 # -*- coding: utf-8 -*-
 """
 動画ファイルを一括取り込みしてシナリオJSONとRAGインデックスを生成するスクリプト
+
+使い方:
+    python tools/batch_ingest_videos.py [flat|hnsw|hnsw_sq8|ivfpq] [--rebuild]
+      flat: 厳密検索のIndexFlatIP（デフォルト）
+      hnsw: 近似最近傍検索のIndexHNSWFlat（中規模データ向け）
+      hnsw_sq8: 8bitスカラー量子化したIndexHNSWSQ（hnswの約1/4のサイズ）
+      ivfpq: 直積量子化で圧縮したIndexIVFPQ（大規模データ向け）
+      --rebuild: 保存済みのメタデータ（build_rag_index.py の分も含む）と全パターンから作り直す
+      ※インデックス種別は新規作成時のみ使われる（既存インデックスへの追加では元の種別のまま）
 """
 
 import os
 import sys
 import json
 import re
+import hashlib
+import asyncio
+import subprocess
 import tempfile
+import traceback
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from shutil import which
+from typing import List, Dict, Any, Optional, Tuple
 import tiktoken
 
 # プロジェクトルートをパスに追加
@@ -18,9 +33,10 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from dotenv import load_dotenv
-from openai import OpenAI
-import faiss
-import numpy as np
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+from json_common import read_json, write_json
+from rag_common import INDEX_TYPES, RAG_INDEX_DIR, add_to_index, save_index
 
 # pydubのインポート（オプション）
 try:
@@ -30,6 +46,9 @@ except ImportError:
     PYDUB_AVAILABLE = False
     AudioSegment = None
 
+# ffmpegがあればWAV変換に直接使う（pydubのように音声全体をメモリに展開しない）
+FFMPEG_AVAILABLE = which('ffmpeg') is not None
+
 # 環境変数を読み込み
 load_dotenv()
 
@@ -39,127 +58,247 @@ if not api_key:
     print("エラー: OPENAI_API_KEYが設定されていません")
     sys.exit(1)
 
-client = OpenAI(api_key=api_key)
+# 文字起こし・GPT整形・Embeddingは並行処理するため非同期クライアントを使う
+async_client = AsyncOpenAI(api_key=api_key)
+
+# 同時に処理する動画数（APIのレート制限に応じて調整）
+MAX_CONCURRENT_VIDEOS = 8
+
+# Whisper APIの設定
+WHISPER_MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB制限
+DIRECT_SEND_RETRIES = 3
+# リトライで回復する可能性のある一時的なエラー
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
 
 # ディレクトリ設定
 PROJECT_ROOT = Path(__file__).parent.parent
 VIDEOS_DIR = PROJECT_ROOT / 'videos'
 SCENARIOS_DIR = PROJECT_ROOT / 'scenarios'
-RAG_INDEX_DIR = PROJECT_ROOT / 'rag_index'
 INDEX_JSON_PATH = SCENARIOS_DIR / 'index.json'
 
+# 文字起こし・GPT整形結果のキャッシュ（再実行時にAPI呼び出しをスキップする）
+CACHE_DIR = Path(__file__).parent / '.cache'
+TRANSCRIPT_CACHE_DIR = CACHE_DIR / 'transcripts'  # 動画ファイルの内容ハッシュ → 文字起こし
+FORMATTED_CACHE_DIR = CACHE_DIR / 'formatted'  # 文字起こしのハッシュ → GPT整形結果
+FORMAT_CACHE_VERSION = 1  # 整形プロンプトを変更したら上げる（古いキャッシュを使わないように）
+HASH_CHUNK_SIZE = 1 << 20  # 1MB
+
 # ディレクトリ作成
 SCENARIOS_DIR.mkdir(exist_ok=True)
-RAG_INDEX_DIR.mkdir(exist_ok=True)
+TRANSCRIPT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+FORMATTED_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+@lru_cache(maxsize=4)
+def get_encoding(model: str):
+    """モデルに対応するTokenizerを取得（BPEテーブルの読み込みは初回のみ）"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # tiktoken 0.5.2ではgpt-4o-miniが未対応のため、cl100k_baseを直接使用
+        return tiktoken.get_encoding("cl100k_base")
+
 
 # Tokenizer初期化（GPT-4o-mini用：cl100k_baseを使用）
-try:
-    encoding = tiktoken.encoding_for_model("gpt-4o-mini")
-except KeyError:
-    # tiktoken 0.5.2ではgpt-4o-miniが未対応のため、cl100k_baseを直接使用
-    encoding = tiktoken.get_encoding("cl100k_base")
+encoding = get_encoding("gpt-4o-mini")
 MAX_TOKENS_PER_CHUNK = 24000  # 安全マージンを考慮
 
+# 営業発話のパターン判定用の正規表現（呼び出しごとにコンパイルしない）
+# 3種類を名前付きグループで1つにまとめ、matchしたグループ名（lastgroup）を種類とする
+# 選択肢ごとに先読みでテキスト全体を調べるため、複数該当しても 良い質問 > 異論処理 > クロージング の優先順位になる
+SALES_PATTERN_RE = re.compile(
+    r'(?=[\s\S]*?(?P<good_question>なぜ|理由|目的|課題|ゴール|懸念|不安|どのように|どうして))'
+    r'|(?=[\s\S]*?(?P<objection_handling>たしかに|とはいえ|一方で|ご安心|もし.*なら))'
+    r'|(?=[\s\S]*?(?P<closing>次|日程|進め|合意|ご提案|いかが))'
+)
+
+# GPT応答からJSONを取り出す正規表現（extract_jsonの後段で使う）
+JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+JSON_BRACE_RE = re.compile(r'(\{.*\})', re.DOTALL)
+
+# expected_flow / pain_points 判定用の正規表現
+# 全カテゴリを名前付きグループで1つにまとめ、テキストを1回走査するだけで判定する
+# （先読みで各位置を調べるため「高いつ」のように重なったキーワードも両方検出できる）
+EXPECTED_FLOW_ORDER = ['greeting', 'needs_analysis', 'proposal', 'objection_handling', 'closing']
+EXPECTED_FLOW_RE = re.compile(
+    r'(?=(?P<greeting>こんにちは|はじめまして|お世話)'
+    r'|(?P<needs_analysis>困って|課題|問題|悩み|どのような|現状)'
+    r'|(?P<proposal>提案|おすすめ|解決|サービス|プラン)'
+    r'|(?P<objection_handling>でも|しかし|心配|不安|懸念|高い|難しい)'
+    r'|(?P<closing>いかがでしょうか|ご検討|次回|後日|ご連絡))'
+)
+PAIN_POINT_LABELS = {'cost': '費用感', 'delivery': '納期', 'effect': '具体的効果'}
+PAIN_POINT_RE = re.compile(
+    r'(?=(?P<cost>費用|価格|予算|コスト|高い|安い)'
+    r'|(?P<delivery>納期|期間|いつ|時間)'
+    r'|(?P<effect>効果|成果|メリット|改善))'
+)
+
+
+def convert_to_wav(video_path: Path) -> str:
+    """16kHz・モノラルのWAV（Whisper推奨形式）に変換し、一時ファイルのパスを返す"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
+        wav_path = tmp.name
+    try:
+        if FFMPEG_AVAILABLE:
+            # ffmpegでストリーム変換してディスクに直接書き出す（メモリ使用量はファイルサイズに依存しない）
+            subprocess.run([
+                'ffmpeg', '-y',
+                '-i', str(video_path),
+                '-vn',
+                '-ac', '1',
+                '-ar', '16000',
+                '-acodec', 'pcm_s16le',
+                wav_path
+            ], check=True, capture_output=True)
+        else:
+            audio = AudioSegment.from_file(str(video_path))
+            audio = audio.set_frame_rate(16000).set_channels(1)
+            audio.export(wav_path, format='wav')
+    except Exception:
+        os.remove(wav_path)
+        raise
+    return wav_path
+
 
-def transcribe_video(video_path: Path) -> str:
+def convert_to_opus(video_path: Path) -> str:
+    """ffmpegで16kHz・モノラル・24kbpsのOpus（Ogg）に変換し、一時ファイルのパスを返す（WAVの約1/10のサイズ）"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as tmp:
+        opus_path = tmp.name
+    try:
+        subprocess.run([
+            'ffmpeg', '-y',
+            '-i', str(video_path),
+            '-vn',
+            '-ac', '1',
+            '-ar', '16000',
+            '-c:a', 'libopus',
+            '-b:a', '24k',
+            opus_path
+        ], check=True, capture_output=True)
+    except Exception:
+        os.remove(opus_path)
+        raise
+    return opus_path
+
+
+async def request_transcription(file_name: str, data: bytes) -> str:
+    """Whisper APIに音声データを送信して文字起こし"""
+    transcript = await async_client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(file_name, data),
+        language="ja",
+        response_format="text"
+    )
+    # response_format="text"の場合、transcriptはstr型
+    return transcript.strip() if isinstance(transcript, str) else getattr(transcript, 'text', str(transcript)).strip()
+
+
+async def transcribe_converted(video_path: Path, convert) -> str:
+    """音声を変換してから文字起こし（変換後の一時ファイルは削除する）"""
+    converted_path = None
+    try:
+        # 変換はブロッキング処理のためスレッドで実行
+        converted_path = await asyncio.to_thread(convert, video_path)
+
+        converted_size = os.path.getsize(converted_path)
+        if converted_size > WHISPER_MAX_FILE_SIZE:
+            print(f"[警告] 変換後もファイルサイズが大きすぎます ({converted_size / 1024 / 1024:.1f}MB > 25MB)")
+            print("[推奨] 動画ファイルを分割してください")
+            raise Exception(f"変換後のファイルサイズが大きすぎます: {converted_size / 1024 / 1024:.1f}MB")
+
+        converted_data = await asyncio.to_thread(Path(converted_path).read_bytes)
+        return await request_transcription(Path(converted_path).name, converted_data)
+    finally:
+        # 一時ファイルを削除
+        if converted_path and os.path.exists(converted_path):
+            try:
+                os.remove(converted_path)
+            except Exception:
+                pass
+
+
+async def transcribe_video(video_path: Path) -> str:
     """Whisperで動画を文字起こし"""
     print(f"[文字起こし開始] {video_path.name}")
     
     # ファイルサイズチェック（Whisper APIは25MB制限）
     file_size = video_path.stat().st_size
-    max_size = 25 * 1024 * 1024  # 25MB
     
     try:
-        # まず直接送信を試行
-        try:
-            with open(video_path, 'rb') as f:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=f,
-                    language="ja",
-                    response_format="text"
-                )
-            # response_format="text"の場合、transcriptはstr型
-            text = transcript.strip() if isinstance(transcript, str) else getattr(transcript, 'text', str(transcript)).strip()
-            print(f"[文字起こし完了] {len(text)}文字")
-            return text
-        except Exception as direct_err:
-            print(f"[直接送信失敗] {direct_err}")
-            
-            # ファイルサイズが大きい場合、または直接送信失敗時はWAV変換を試行
-            if file_size > max_size or not PYDUB_AVAILABLE:
-                if file_size > max_size:
-                    print(f"[警告] ファイルサイズが大きすぎます ({file_size / 1024 / 1024:.1f}MB > 25MB)")
-                    print("[推奨] 動画ファイルを分割するか、音声のみを抽出してください")
-                raise direct_err
-            
-            # pydubでWAVに変換して再送信
-            print("[WAV変換して再送信...]")
-            wav_path = None
+        # 25MB以下ならまず元のファイルをそのまま送信（一時的なエラーはバックオフしてリトライ）
+        if file_size <= WHISPER_MAX_FILE_SIZE:
+            # ファイル読み込みでイベントループを止めないようスレッドで読む
+            video_data = await asyncio.to_thread(video_path.read_bytes)
+            for attempt in range(DIRECT_SEND_RETRIES):
+                try:
+                    text = await request_transcription(video_path.name, video_data)
+                    print(f"[文字起こし完了] {len(text)}文字")
+                    return text
+                except RETRYABLE_ERRORS as e:
+                    print(f"[直接送信失敗] {e} ({attempt + 1}/{DIRECT_SEND_RETRIES})")
+                    if attempt + 1 == DIRECT_SEND_RETRIES:
+                        # 通信・レート制限のエラーは変換しても解決しない
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+                except Exception as e:
+                    # 形式エラーなどはリトライしても同じ結果になるため変換して送信
+                    print(f"[直接送信失敗] {e}")
+                    break
+        else:
+            print(f"[警告] ファイルサイズが大きすぎます ({file_size / 1024 / 1024:.1f}MB > 25MB)")
+
+        # 音声のみを抽出・圧縮して送信
+        if FFMPEG_AVAILABLE:
             try:
-                audio = AudioSegment.from_file(str(video_path))
-                # 16kHz、モノラルに変換（Whisper推奨形式）
-                audio = audio.set_frame_rate(16000).set_channels(1)
-                
-                # 一時ファイルに保存
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
-                    wav_path = tmp.name
-                    audio.export(wav_path, format='wav')
-                
-                # WAVファイルサイズチェック
-                wav_size = os.path.getsize(wav_path)
-                if wav_size > max_size:
-                    print(f"[警告] WAV変換後もファイルサイズが大きすぎます ({wav_size / 1024 / 1024:.1f}MB > 25MB)")
-                    raise Exception(f"変換後のファイルサイズが大きすぎます: {wav_size / 1024 / 1024:.1f}MB")
-                
-                with open(wav_path, 'rb') as f:
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=f,
-                        language="ja",
-                        response_format="text"
-                    )
-                text = transcript.strip() if isinstance(transcript, str) else getattr(transcript, 'text', str(transcript)).strip()
-                print(f"[文字起こし完了] {len(text)}文字")
-                return text
-            finally:
-                # 一時ファイルを削除
-                if wav_path and os.path.exists(wav_path):
-                    try:
-                        os.remove(wav_path)
-                    except Exception:
-                        pass
+                print("[Opus変換して送信...]")
+                text = await transcribe_converted(video_path, convert_to_opus)
+            except subprocess.CalledProcessError:
+                # libopusを含まないffmpegの場合はWAVに変換
+                print("[Opus変換失敗、WAV変換して送信...]")
+                text = await transcribe_converted(video_path, convert_to_wav)
+        elif PYDUB_AVAILABLE:
+            print("[WAV変換して再送信...]")
+            text = await transcribe_converted(video_path, convert_to_wav)
+        else:
+            print("[推奨] ffmpegをインストールするか、音声のみを抽出してください")
+            raise Exception("ffmpeg/pydubが利用できないため音声を変換できません")
+
+        print(f"[文字起こし完了] {len(text)}文字")
+        return text
     except Exception as e:
         print(f"[文字起こしエラー] {video_path.name}: {e}")
         raise
 
 
-def chunk_text_by_tokens(text: str, max_tokens: int) -> List[str]:
-    """テキストをトークン数でチャンク分割"""
-    tokens = encoding.encode(text)
-    chunks = []
-    for i in range(0, len(tokens), max_tokens):
-        chunk_tokens = tokens[i:i + max_tokens]
-        chunk_text = encoding.decode(chunk_tokens)
-        chunks.append(chunk_text)
-    return chunks
+def chunk_tokens(tokens: List[int], max_tokens: int) -> List[str]:
+    """エンコード済みのトークン列をトークン数でチャンク分割してテキストに戻す"""
+    return [
+        encoding.decode(tokens[i:i + max_tokens])
+        for i in range(0, len(tokens), max_tokens)
+    ]
 
 
-def format_transcript_with_gpt(transcript: str) -> Dict[str, Any]:
+async def format_transcript_with_gpt(transcript: str) -> Dict[str, Any]:
     """GPT-4o-miniで文字起こしを二者会話形式に整形"""
     print("[GPT整形開始]")
     
-    # 長文対策: チャンク分割
-    if len(encoding.encode(transcript)) > MAX_TOKENS_PER_CHUNK:
+    # 長文対策: チャンク分割（エンコードは1回だけ行い、分割にも使い回す）
+    # BPEの1トークンは1バイト以上なので、UTF-8のバイト数が上限以下ならトークン数も上限以下（エンコード不要）
+    if len(transcript.encode('utf-8')) <= MAX_TOKENS_PER_CHUNK:
+        return await format_chunk_with_gpt(transcript)
+    
+    tokens = encoding.encode(transcript)
+    if len(tokens) > MAX_TOKENS_PER_CHUNK:
         print(f"[長文検出] チャンク分割して処理します")
-        chunks = chunk_text_by_tokens(transcript, MAX_TOKENS_PER_CHUNK)
+        chunks = chunk_tokens(tokens, MAX_TOKENS_PER_CHUNK)
         all_turns = []
         persona_notes = ""
         skills = []
         
         for i, chunk in enumerate(chunks):
             print(f"[チャンク {i+1}/{len(chunks)} 処理中]")
-            result = format_chunk_with_gpt(chunk)
+            result = await format_chunk_with_gpt(chunk)
             if result:
                 all_turns.extend(result.get('turns', []))
                 if not persona_notes and result.get('persona_notes'):
@@ -170,7 +309,7 @@ def format_transcript_with_gpt(transcript: str) -> Dict[str, Any]:
         # 結合後、40ターンに要約圧縮
         if len(all_turns) > 40:
             print(f"[ターン数超過] {len(all_turns)}ターン → 40ターンに圧縮")
-            all_turns = compress_turns(all_turns)
+            all_turns = await compress_turns(all_turns)
         
         return {
             'turns': all_turns,
@@ -178,10 +317,10 @@ def format_transcript_with_gpt(transcript: str) -> Dict[str, Any]:
             'skills': skills
         }
     else:
-        return format_chunk_with_gpt(transcript)
+        return await format_chunk_with_gpt(transcript)
 
 
-def format_chunk_with_gpt(chunk: str) -> Optional[Dict[str, Any]]:
+async def format_chunk_with_gpt(chunk: str) -> Optional[Dict[str, Any]]:
     """チャンク単位でGPT整形"""
     prompt = f"""以下の文字起こしテキストを営業とお客様の二者会話形式に整形してください。
 
@@ -207,7 +346,7 @@ def format_chunk_with_gpt(chunk: str) -> Optional[Dict[str, Any]]:
 """
     
     try:
-        response = client.chat.completions.create(
+        response = await async_client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "あなたは会話整形の専門家です。JSON形式で正確に出力してください。"},
@@ -234,34 +373,29 @@ def format_chunk_with_gpt(chunk: str) -> Optional[Dict[str, Any]]:
 
 def extract_json(text: str) -> Optional[str]:
     """テキストからJSONを抽出"""
-    # まず通常のJSONを試す
-    try:
-        json.loads(text)
-        return text
-    except:
-        pass
-    
-    # ```json``` または ```{...}``` ブロックを探す
-    patterns = [
-        r'```json\s*(\{.*?\})\s*```',
-        r'```\s*(\{.*?\})\s*```',
-        r'(\{.*\})',
-    ]
+    # response_formatでJSONを指定しているため、ほとんどはそのままJSONとして読める
+    if text.lstrip().startswith('{'):
+        try:
+            json.loads(text)
+            return text
+        except json.JSONDecodeError:
+            pass
     
-    for pattern in patterns:
-        match = re.search(pattern, text, re.DOTALL)
+    # ```json``` または ```{...}``` ブロック、次に最初の { から最後の } までを探す
+    for pattern in (JSON_FENCE_RE, JSON_BRACE_RE):
+        match = pattern.search(text)
         if match:
+            json_text = match.group(1)
             try:
-                json_text = match.group(1)
                 json.loads(json_text)  # バリデーション
                 return json_text
-            except:
+            except json.JSONDecodeError:
                 continue
     
     return None
 
 
-def compress_turns(turns: List[Dict[str, str]], target: int = 40) -> List[Dict[str, str]]:
+async def compress_turns(turns: List[Dict[str, str]], target: int = 40) -> List[Dict[str, str]]:
     """ターン数を圧縮（GPTで要約）"""
     if len(turns) <= target:
         return turns
@@ -288,7 +422,7 @@ def compress_turns(turns: List[Dict[str, str]], target: int = 40) -> List[Dict[s
 """
     
     try:
-        response = client.chat.completions.create(
+        response = await async_client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "あなたは会話要約の専門家です。重要発話を残しつつ要約してください。"},
@@ -347,17 +481,8 @@ def create_scenario_json(video_name: str, formatted_data: Dict[str, Any]) -> Dic
 
 def infer_expected_flow(text: str) -> List[str]:
     """会話テキストからexpected_flowを推定"""
-    flow = []
-    if re.search(r'(こんにちは|はじめまして|お世話)', text):
-        flow.append('greeting')
-    if re.search(r'(困って|課題|問題|悩み|どのような|現状)', text):
-        flow.append('needs_analysis')
-    if re.search(r'(提案|おすすめ|解決|サービス|プラン)', text):
-        flow.append('proposal')
-    if re.search(r'(でも|しかし|心配|不安|懸念|高い|難しい)', text):
-        flow.append('objection_handling')
-    if re.search(r'(いかがでしょうか|ご検討|次回|後日|ご連絡)', text):
-        flow.append('closing')
+    found = {m.lastgroup for m in EXPECTED_FLOW_RE.finditer(text)}
+    flow = [step for step in EXPECTED_FLOW_ORDER if step in found]
     
     # デフォルト
     if not flow:
@@ -368,13 +493,8 @@ def infer_expected_flow(text: str) -> List[str]:
 
 def extract_pain_points(text: str) -> List[str]:
     """会話テキストからpain_pointsを抽出"""
-    pain_points = []
-    if re.search(r'(費用|価格|予算|コスト|高い|安い)', text):
-        pain_points.append('費用感')
-    if re.search(r'(納期|期間|いつ|時間)', text):
-        pain_points.append('納期')
-    if re.search(r'(効果|成果|メリット|改善)', text):
-        pain_points.append('具体的効果')
+    found = {m.lastgroup for m in PAIN_POINT_RE.finditer(text)}
+    pain_points = [label for key, label in PAIN_POINT_LABELS.items() if key in found]
     if not pain_points:
         pain_points = ['費用感', '納期', '具体的効果']
     return pain_points
@@ -385,8 +505,7 @@ def save_scenario_json(scenario: Dict[str, Any]) -> Path:
     scenario_id = scenario['id']
     file_path = SCENARIOS_DIR / f"{scenario_id}.json"
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(scenario, f, ensure_ascii=False, indent=2)
+    write_json(file_path, scenario)
     
     print(f"[シナリオ保存] {file_path.name}")
     return file_path
@@ -395,8 +514,7 @@ def save_scenario_json(scenario: Dict[str, Any]) -> Path:
 def update_index_json(scenario_id: str, scenario_title: str, is_first: bool = False):
     """scenarios/index.jsonを更新"""
     if INDEX_JSON_PATH.exists():
-        with open(INDEX_JSON_PATH, 'r', encoding='utf-8') as f:
-            index_data = json.load(f)
+        index_data = read_json(INDEX_JSON_PATH)
     else:
         index_data = {
             "default_id": None,
@@ -417,123 +535,106 @@ def update_index_json(scenario_id: str, scenario_title: str, is_first: bool = Fa
         if is_first and not index_data.get('default_id'):
             index_data['default_id'] = scenario_id
     
-    with open(INDEX_JSON_PATH, 'w', encoding='utf-8') as f:
-        json.dump(index_data, f, ensure_ascii=False, indent=2)
+    write_json(INDEX_JSON_PATH, index_data)
     
     print(f"[インデックス更新] {INDEX_JSON_PATH.name}")
 
 
 def extract_sales_patterns(utterances: List[Dict[str, str]]) -> List[Dict[str, Any]]:
-    """営業発話からパターンを抽出"""
-    patterns = []
-    
-    for u in utterances:
-        if u.get('speaker') != '営業':
-            continue
-        
-        text = u.get('text', '')
-        pattern_type = None
-        pattern_text = None
-        
-        # (a) 良い質問
-        if re.search(r'(なぜ|理由|目的|課題|ゴール|懸念|不安|どのように|どうして)', text):
-            pattern_type = 'good_question'
-            pattern_text = text
-        
-        # (b) 異論処理
-        elif re.search(r'(たしかに|とはいえ|一方で|ご安心|もし.*なら)', text):
-            pattern_type = 'objection_handling'
-            pattern_text = text
-        
-        # (c) クロージング
-        elif re.search(r'(次|日程|進め|合意|ご提案|いかが)', text):
-            pattern_type = 'closing'
-            pattern_text = text
-        
-        if pattern_type and pattern_text:
-            patterns.append({
-                'type': pattern_type,
-                'text': pattern_text,
-                'scenario_id': None  # 後で設定
-            })
-    
-    return patterns
+    """営業発話からパターンを抽出（良い質問 / 異論処理 / クロージング）"""
+    matches = (
+        (SALES_PATTERN_RE.match(text), text)
+        for text in (u.get('text', '') for u in utterances if u.get('speaker') == '営業')
+    )
+    return [
+        {
+            'type': m.lastgroup,
+            'text': text,
+            'scenario_id': None  # 後で設定
+        }
+        for m, text in matches if m
+    ]
 
 
-def create_rag_index(all_patterns: List[Dict[str, Any]]):
-    """RAGインデックスを作成"""
+async def create_rag_index(all_patterns: List[Dict[str, Any]], index_type: str = 'flat', rebuild: bool = False):
+    """RAGインデックスに未登録のパターンを追加（Embedding生成・インデックス作成・保存はrag_common.pyの共通処理）"""
     if not all_patterns:
         print("[警告] 抽出パターンがありません、RAGインデックスは作成しません")
         return 0
     
-    print(f"[RAGインデックス作成開始] {len(all_patterns)}件")
-    
-    # テキストを取得
-    texts = [p['text'] for p in all_patterns]
-    
-    # Embedding生成
-    print("[Embedding生成中...]")
-    embeddings = []
-    batch_size = 100
-    
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        try:
-            response = client.embeddings.create(
-                model="text-embedding-3-large",
-                input=batch
-            )
-            batch_embeddings = [e.embedding for e in response.data]
-            embeddings.extend(batch_embeddings)
-            print(f"[Embedding進捗] {min(i + batch_size, len(texts))}/{len(texts)}")
-        except Exception as e:
-            print(f"[Embeddingエラー] {e}")
-            continue
-    
-    if not embeddings:
+    print(f"[RAGインデックス更新開始] {len(all_patterns)}件")
+    index, metadata, added = await add_to_index(async_client, all_patterns, index_type, rebuild, RAG_INDEX_DIR)
+    if index is None:
         print("[警告] Embeddingが生成できませんでした")
         return 0
+    if not added:
+        print("[RAGインデックス] 追加するパターンはありません")
+        return len(metadata)
     
-    # NumPy配列に変換
-    embeddings_array = np.array(embeddings, dtype=np.float32)
-    
-    # L2正規化
-    faiss.normalize_L2(embeddings_array)
-    
-    # FAISSインデックス作成（内積、L2正規化済み）
-    dimension = embeddings_array.shape[1]
-    index = faiss.IndexFlatIP(dimension)  # 内積
-    index.add(embeddings_array)
-    
-    # 保存
-    faiss_path = RAG_INDEX_DIR / 'sales_patterns.faiss'
-    json_path = RAG_INDEX_DIR / 'sales_patterns.json'
-    
-    faiss.write_index(index, str(faiss_path))
-    
-    # メタデータをJSONで保存
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(all_patterns, f, ensure_ascii=False, indent=2)
-    
-    print(f"[RAGインデックス保存完了] {faiss_path.name}, {json_path.name}")
-    return len(all_patterns)
+    faiss_path, json_path = save_index(index, metadata, RAG_INDEX_DIR)
+    print(f"[RAGインデックス保存完了] {faiss_path.name}, {json_path.name}（{added}件追加、計{len(metadata)}件）")
+    return len(metadata)
+
+
+def hash_file(path: Path) -> str:
+    """ファイルの内容ハッシュを計算（チャンク単位で読むため大きな動画でもメモリを使わない）"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 
-def process_video(video_path: Path) -> Optional[Dict[str, Any]]:
+def hash_text(text: str) -> str:
+    """テキストの内容ハッシュを計算"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def read_cache(cache_path: Path) -> Optional[Any]:
+    """キャッシュを読み込む（無い・壊れている場合はNone）"""
+    try:
+        return read_json(cache_path)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_cache(cache_path: Path, data: Any) -> None:
+    """キャッシュを書き込む（一時ファイルに書いてから置き換え、途中で中断しても壊れないように）"""
+    tmp_path = cache_path.with_suffix('.tmp')
+    write_json(tmp_path, data, indent=False)
+    os.replace(tmp_path, cache_path)
+
+
+async def process_video(video_path: Path) -> Optional[Dict[str, Any]]:
     """1つの動画を処理"""
     print(f"\n{'='*60}")
     print(f"[処理開始] {video_path.name}")
     print(f"{'='*60}")
     
     try:
-        # 1. 文字起こし
-        transcript = transcribe_video(video_path)
+        # 1. 文字起こし（同じ内容の動画はキャッシュを使う）
+        transcript_cache_path = TRANSCRIPT_CACHE_DIR / f"{await asyncio.to_thread(hash_file, video_path)}.json"
+        cached = read_cache(transcript_cache_path)
+        if cached:
+            transcript = cached['transcript']
+            print(f"[キャッシュ使用] 文字起こし: {video_path.name}")
+        else:
+            transcript = await transcribe_video(video_path)
+            if transcript:
+                write_cache(transcript_cache_path, {'transcript': transcript})
         if not transcript:
             print(f"[スキップ] 文字起こし結果が空です: {video_path.name}")
             return None
         
-        # 2. GPT整形
-        formatted_data = format_transcript_with_gpt(transcript)
+        # 2. GPT整形（同じ文字起こしはキャッシュを使う）
+        formatted_cache_path = FORMATTED_CACHE_DIR / f"{hash_text(f'{FORMAT_CACHE_VERSION}:{transcript}')}.json"
+        formatted_data = read_cache(formatted_cache_path)
+        if formatted_data:
+            print(f"[キャッシュ使用] GPT整形: {video_path.name}")
+        else:
+            formatted_data = await format_transcript_with_gpt(transcript)
+            if formatted_data and formatted_data.get('turns'):
+                write_cache(formatted_cache_path, formatted_data)
         if not formatted_data or not formatted_data.get('turns'):
             print(f"[スキップ] GPT整形失敗: {video_path.name}")
             return None
@@ -548,6 +649,7 @@ def process_video(video_path: Path) -> Optional[Dict[str, Any]]:
         patterns = extract_sales_patterns(formatted_data.get('turns', []))
         for p in patterns:
             p['scenario_id'] = scenario['id']
+            p['source_file'] = video_path.name
         
         return {
             'scenario': scenario,
@@ -556,17 +658,67 @@ def process_video(video_path: Path) -> Optional[Dict[str, Any]]:
         
     except Exception as e:
         print(f"[エラー] {video_path.name}: {e}")
-        import traceback
         traceback.print_exc()
         return None
 
 
+async def process_videos(video_files: List[Path]) -> List[Optional[Dict[str, Any]]]:
+    """複数の動画を同時実行数を制限して並行処理（結果は入力順）"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_VIDEOS)
+
+    async def bounded(i: int, video_path: Path) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            print(f"\n[{i}/{len(video_files)}]")
+            return await process_video(video_path)
+
+    return await asyncio.gather(*[
+        bounded(i, video_path) for i, video_path in enumerate(video_files, 1)
+    ])
+
+
+async def ingest_videos(video_files: List[Path], index_type: str = 'flat', rebuild: bool = False) -> Tuple[int, int]:
+    """動画の取り込みからRAGインデックス作成まで（戻り値: 作成シナリオ数, RAGアイテム数）"""
+    # 各動画を並行処理（文字起こし・GPT整形はAPI待ちが大半のため）
+    results = await process_videos(video_files)
+
+    # index.jsonの更新は入力順に行う（default_idが実行ごとに変わらないように）
+    all_patterns = []
+    scenarios_created = 0
+    
+    for result in results:
+        if result:
+            scenario = result['scenario']
+            patterns = result['patterns']
+            
+            # インデックス更新（最初の1つをdefault_idに）
+            is_first = (scenarios_created == 0)
+            update_index_json(scenario['id'], scenario['title'], is_first)
+            
+            all_patterns.extend(patterns)
+            scenarios_created += 1
+    
+    # RAGインデックス作成
+    rag_items = 0
+    if all_patterns:
+        rag_items = await create_rag_index(all_patterns, index_type, rebuild)
+
+    return scenarios_created, rag_items
+
+
 def main():
     """メイン処理"""
     print("=" * 60)
     print("動画取り込みスクリプト開始")
     print("=" * 60)
     
+    # インデックス種別（--rebuild 指定時は保存済みのメタデータと合わせて全件から作り直す）
+    args = [arg for arg in sys.argv[1:] if arg != '--rebuild']
+    rebuild = '--rebuild' in sys.argv[1:]
+    index_type = args[0] if args else 'flat'
+    if index_type not in INDEX_TYPES:
+        print(f"[エラー] 不明なインデックス種別です: {index_type} ({'|'.join(INDEX_TYPES)})")
+        sys.exit(1)
+    
     # videosディレクトリの存在確認
     if not VIDEOS_DIR.exists():
         print(f"[エラー] {VIDEOS_DIR} が見つかりません")
@@ -583,29 +735,8 @@ def main():
     
     print(f"[検出] {len(video_files)}本の動画/音声ファイル (MP4: {len(mp4_files)}, WAV: {len(wav_files)})")
     
-    # 各動画を処理
-    all_patterns = []
-    scenarios_created = 0
-    
-    for i, video_path in enumerate(video_files, 1):
-        print(f"\n[{i}/{len(video_files)}]")
-        result = process_video(video_path)
-        
-        if result:
-            scenario = result['scenario']
-            patterns = result['patterns']
-            
-            # インデックス更新（最初の1つをdefault_idに）
-            is_first = (scenarios_created == 0)
-            update_index_json(scenario['id'], scenario['title'], is_first)
-            
-            all_patterns.extend(patterns)
-            scenarios_created += 1
-    
-    # RAGインデックス作成
-    rag_items = 0
-    if all_patterns:
-        rag_items = create_rag_index(all_patterns)
+    # 非同期クライアントの接続プールを使い回すため、全工程を1つのイベントループで実行
+    scenarios_created, rag_items = asyncio.run(ingest_videos(video_files, index_type, rebuild))
     
     # 結果表示
     print("\n" + "=" * 60)
@@ -3,7 +3,13 @@
 RAGインデックス構築ツール
 
 使い方:
-    python tools/build_rag_index.py
+    python tools/build_rag_index.py [flat|hnsw|hnsw_sq8|ivfpq] [--rebuild]
+      flat: 厳密検索のIndexFlatIP（デフォルト）
+      hnsw: 近似最近傍検索のIndexHNSWFlat（中規模データ向け）
+      hnsw_sq8: 8bitスカラー量子化したIndexHNSWSQ（hnswの約1/4のサイズ）
+      ivfpq: 直積量子化で圧縮したIndexIVFPQ（大規模データ向け）
+      --rebuild: 保存済みのメタデータ（batch_ingest_videos.py の分も含む）と全データから作り直す
+      ※インデックス種別は新規作成時のみ使われる（既存インデックスへの追加では元の種別のまま）
 
 機能:
 - transcripts/から文字起こしデータ読み込み
@@ -15,25 +21,90 @@ RAGインデックス構築ツール
 
 import os
 import sys
-import json
+import re
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
-import numpy as np
-import faiss
-from openai import OpenAI
+from typing import Callable, List, Dict, Set
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
+from json_common import read_json
+from rag_common import INDEX_TYPES, RAG_INDEX_DIR, add_to_index, save_index
+
+# pyahocorasickのインポート（オプション、無い場合は正規表現で判定）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    ahocorasick = None
+
 # 環境変数読み込み
 load_dotenv()
 
-# OpenAI クライアント初期化
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# OpenAI クライアント初期化（Embeddingはバッチを並行リクエストするため非同期）
+async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
 # ディレクトリ設定
 BASE_DIR = Path(__file__).parent.parent
 TRANSCRIPTS_DIR = BASE_DIR / 'transcripts'
-RAG_INDEX_DIR = BASE_DIR / 'rag_index'
-RAG_INDEX_DIR.mkdir(exist_ok=True)
+
+# シーン判定のキーワード（先に書いたシーンほど優先）
+SCENE_KEYWORDS = {
+    'greeting': ['はじめまして', 'よろしく', 'ご紹介', 'お名前'],
+    'closing': ['ありがとう', 'それでは', 'よろしくお願い', '今後'],
+    'proposal': ['提案', 'プラン', 'サービス', 'こちら', '例えば', 'ご覧'],
+}
+
+# トピック辞書
+TOPIC_KEYWORDS = {
+    'budget': ['予算', '費用', '価格', '金額', 'コスト'],
+    'timeline': ['期間', 'いつ', 'スケジュール', '納期', '時間'],
+    'examples': ['事例', '実績', '他社', '例', 'ケース'],
+    'features': ['機能', 'サービス', 'プラン', 'できる', 'できます'],
+    'concerns': ['不安', '心配', '懸念', '悩み', '困って'],
+    'social_media': ['SNS', 'インスタ', 'TikTok', 'Twitter', 'Facebook'],
+    'video': ['動画', 'ビデオ', '映像', 'コンテンツ'],
+    'results': ['効果', '成果', '実績', '数字', '反応'],
+}
+
+
+def build_keyword_matcher(keyword_groups: Dict[str, List[str]]) -> Callable[[str], Set[str]]:
+    """
+    キーワード辞書から、テキストに含まれるグループ名の集合を返す関数を作る
+
+    pyahocorasickがあれば全キーワードを1つのオートマトンにまとめ、テキストを1回走査するだけで判定する
+    """
+    if AHOCORASICK_AVAILABLE:
+        # 同じキーワードが複数グループに属する場合（例: 実績）に備えてグループをまとめる
+        groups_by_keyword = defaultdict(list)
+        for group, keywords in keyword_groups.items():
+            for keyword in keywords:
+                groups_by_keyword[keyword].append(group)
+
+        automaton = ahocorasick.Automaton()
+        for keyword, groups in groups_by_keyword.items():
+            automaton.add_word(keyword, tuple(groups))
+        automaton.make_automaton()
+
+        def match(text: str) -> Set[str]:
+            return {group for _, groups in automaton.iter(text) for group in groups}
+    else:
+        patterns = {
+            group: re.compile('|'.join(map(re.escape, keywords)))
+            for group, keywords in keyword_groups.items()
+        }
+
+        def match(text: str) -> Set[str]:
+            return {group for group, pattern in patterns.items() if pattern.search(text)}
+
+    return match
+
+
+match_scene_keywords = build_keyword_matcher(SCENE_KEYWORDS)
+match_topic_keywords = build_keyword_matcher(TOPIC_KEYWORDS)
 
 
 def detect_scene(text: str, position: float) -> str:
@@ -56,14 +127,10 @@ def detect_scene(text: str, position: float) -> str:
         return 'closing'
 
     # キーワードベースの判定
-    if any(kw in text for kw in ['はじめまして', 'よろしく', 'ご紹介', 'お名前']):
-        return 'greeting'
-
-    if any(kw in text for kw in ['ありがとう', 'それでは', 'よろしくお願い', '今後']):
-        return 'closing'
-
-    if any(kw in text for kw in ['提案', 'プラン', 'サービス', 'こちら', '例えば', 'ご覧']):
-        return 'proposal'
+    found = match_scene_keywords(text)
+    for scene in SCENE_KEYWORDS:
+        if scene in found:
+            return scene
 
     # デフォルトはニーズ分析
     return 'needs_analysis'
@@ -79,48 +146,12 @@ def extract_topics(text: str) -> List[str]:
     Returns:
         トピックのリスト
     """
-    topics = []
-
-    # トピック辞書
-    topic_keywords = {
-        'budget': ['予算', '費用', '価格', '金額', 'コスト'],
-        'timeline': ['期間', 'いつ', 'スケジュール', '納期', '時間'],
-        'examples': ['事例', '実績', '他社', '例', 'ケース'],
-        'features': ['機能', 'サービス', 'プラン', 'できる', 'できます'],
-        'concerns': ['不安', '心配', '懸念', '悩み', '困って'],
-        'social_media': ['SNS', 'インスタ', 'TikTok', 'Twitter', 'Facebook'],
-        'video': ['動画', 'ビデオ', '映像', 'コンテンツ'],
-        'results': ['効果', '成果', '実績', '数字', '反応'],
-    }
-
-    for topic, keywords in topic_keywords.items():
-        if any(kw in text for kw in keywords):
-            topics.append(topic)
+    found = match_topic_keywords(text)
+    topics = [topic for topic in TOPIC_KEYWORDS if topic in found]
 
     return topics if topics else ['general']
 
 
-def generate_embedding(text: str) -> List[float]:
-    """
-    テキストのEmbeddingを生成
-
-    Args:
-        text: テキスト
-
-    Returns:
-        Embeddingベクトル
-    """
-    try:
-        response = client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"❌ Embedding生成エラー: {e}")
-        return None
-
-
 def detect_scenario_from_filename(filename: str) -> str:
     """
     ファイル名からシナリオIDを判定
@@ -172,8 +203,7 @@ def process_transcript(transcript_path: Path) -> List[Dict]:
     """
     print(f"\n📄 処理中: {transcript_path.name}")
 
-    with open(transcript_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = read_json(transcript_path)
 
     # ファイル名からシナリオIDを判定
     source_file = data.get('source_file', transcript_path.stem)
@@ -217,51 +247,29 @@ def process_transcript(transcript_path: Path) -> List[Dict]:
     return rag_data
 
 
-def build_faiss_index(rag_data: List[Dict]) -> tuple:
+def build_faiss_index(rag_data: List[Dict], index_type: str = 'flat', rebuild: bool = False) -> tuple:
     """
-    FAISSインデックスを構築
-
-    Args:
-        rag_data: RAGデータのリスト
+    FAISSインデックスを構築（保存済みのインデックスがあれば未登録のデータだけ追加する。
+    Embedding生成・インデックス作成はrag_common.pyの共通処理）
 
     Returns:
-        (index, metadata)
+        (index, metadata, 追加件数)
     """
     print(f"\n🔧 FAISSインデックス構築中...")
     print(f"   データ件数: {len(rag_data)}")
 
-    # Embedding生成
-    embeddings = []
-    metadata = []
-
-    for i, item in enumerate(rag_data):
-        if (i + 1) % 10 == 0:
-            print(f"   進捗: {i + 1}/{len(rag_data)}")
-
-        embedding = generate_embedding(item['text'])
-        if embedding:
-            embeddings.append(embedding)
-            metadata.append(item)
-
-    print(f"✅ {len(embeddings)}件のEmbeddingを生成")
-
-    # FAISSインデックス作成
-    if not embeddings:
+    index, metadata, added = asyncio.run(add_to_index(async_client, rag_data, index_type, rebuild, RAG_INDEX_DIR))
+    if index is None:
         print("❌ エラー: Embeddingが生成されませんでした")
-        return None, []
-
-    dimension = len(embeddings[0])
-    embeddings_array = np.array(embeddings).astype('float32')
-
-    # IndexFlatL2: L2距離で検索（正確だが遅い、小規模データ向け）
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_array)
+        return None, [], 0
 
     print(f"✅ FAISSインデックス構築完了")
-    print(f"   次元数: {dimension}")
+    print(f"   種別: {type(index).__name__}")
+    print(f"   次元数: {index.d}")
+    print(f"   追加件数: {added}")
     print(f"   インデックス件数: {index.ntotal}")
 
-    return index, metadata
+    return index, metadata, added
 
 
 def main():
@@ -280,6 +288,14 @@ RAGインデックス構築ツール
         print("❌ エラー: OPENAI_API_KEYが設定されていません")
         sys.exit(1)
 
+    # インデックス種別（--rebuild 指定時は保存済みのメタデータと合わせて全件から作り直す）
+    args = [arg for arg in sys.argv[1:] if arg != '--rebuild']
+    rebuild = '--rebuild' in sys.argv[1:]
+    index_type = args[0] if args else 'flat'
+    if index_type not in INDEX_TYPES:
+        print(f"❌ エラー: 不明なインデックス種別です: {index_type} ({'|'.join(INDEX_TYPES)})")
+        sys.exit(1)
+
     # 文字起こしファイルを検索
     transcript_files = list(TRANSCRIPTS_DIR.glob('*_transcript.json'))
 
@@ -290,11 +306,12 @@ RAGインデックス構築ツール
 
     print(f"📁 {len(transcript_files)}件の文字起こしファイルを検出\n")
 
-    # RAGデータ抽出
+    # RAGデータ抽出（ファイルごとに独立したCPU処理のためプロセスを分けて並列実行、結果はファイル順）
     all_rag_data = []
-    for tf in transcript_files:
-        rag_data = process_transcript(tf)
-        all_rag_data.extend(rag_data)
+    max_workers = min(os.cpu_count() or 1, len(transcript_files))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for rag_data in executor.map(process_transcript, transcript_files):
+            all_rag_data.extend(rag_data)
 
     if not all_rag_data:
         print("❌ RAGデータが抽出できませんでした")
@@ -318,20 +335,18 @@ RAGインデックス構築ツール
         print(f"   {scene}: {count}件")
 
     # FAISSインデックス構築
-    index, metadata = build_faiss_index(all_rag_data)
+    index, metadata, added = build_faiss_index(all_rag_data, index_type, rebuild)
 
     if not index:
         sys.exit(1)
 
-    # 保存
-    index_path = RAG_INDEX_DIR / 'sales_patterns.faiss'
-    metadata_path = RAG_INDEX_DIR / 'sales_patterns.json'
+    if not added:
+        print("\n✅ 追加するデータはありません（インデックスは最新です）")
+        return
 
-    faiss.write_index(index, str(index_path))
+    # 保存
+    index_path, metadata_path = save_index(index, metadata, RAG_INDEX_DIR)
     print(f"💾 インデックス保存: {index_path}")
-
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
     print(f"💾 メタデータ保存: {metadata_path}")
 
     print(f"\n{'='*60}")
@@ -3,18 +3,50 @@
 
 OpenAI DALL-E 3を使用して、SNS動画営業ロープレ用の日本人アバター画像を生成します。
 各アバターにつき6種類の表情（listening, smile, confused, thinking, nodding, interested）を生成します。
+
+使い方:
+    python tools/generate_avatars.py [--force] [--no-cache]
+      既に保存済みの画像は生成をスキップします（--force で全て作り直す）
+      生成した画像はプロンプトごとに tools/.cache/dalle/ にキャッシュし、
+      同じプロンプトではDALL-E 3を呼ばずにキャッシュから保存します（--no-cache で使わない）
 """
 
 import os
+import sys
+import asyncio
+import hashlib
+import shutil
 import requests
-from openai import OpenAI
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from openai import AsyncOpenAI, RateLimitError
 from dotenv import load_dotenv
-import time
 
 load_dotenv()
 
-# OpenAI クライアント初期化
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# OpenAI クライアント初期化（画像生成は待ち時間が大半のため非同期で並行リクエストする）
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+# 画像ダウンロード用のセッション（接続を使い回し、画像ごとにTCP/TLSハンドシェイクしない）
+download_session = requests.Session()
+download_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# 画像ダウンロード時のチャンクサイズ（64KB）
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# 生成画像のキャッシュ（プロンプトのハッシュ → 画像ファイル）
+DALLE_CACHE_DIR = Path(__file__).parent / '.cache' / 'dalle'
+
+# 同時に生成する画像数（DALL-E 3のレート制限に応じて調整）
+MAX_CONCURRENT_GENERATIONS = 5
+# レート制限（429）時のリトライ
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF_SECONDS = 10
 
 # アバター定義（3パターン）
 AVATARS = [
@@ -69,7 +101,35 @@ EXPRESSIONS = [
     }
 ]
 
-def generate_avatar_image(avatar_id: str, base_prompt: str, expression_type: str, expression_prompt: str, output_dir: str = "public/avatars"):
+def download_image(image_url: str, filepath: str) -> None:
+    """
+    画像をストリーミングでダウンロードしてファイルに直接書き出す（画像全体をメモリに読み込まない）
+
+    書き込み途中の画像が保存済み扱いでスキップされないよう、一時ファイルに書いてから置き換える
+    """
+    tmp_path = f"{filepath}.tmp"
+    with download_session.get(image_url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    os.replace(tmp_path, filepath)
+
+
+def get_cache_path(full_prompt: str) -> Path:
+    """プロンプトに対応するキャッシュ画像のパス（モデル・サイズ等の生成条件もキーに含める）"""
+    key = hashlib.sha1(f"dall-e-3|1024x1024|standard|{full_prompt}".encode('utf-8')).hexdigest()
+    return DALLE_CACHE_DIR / f"{key}.png"
+
+
+def copy_atomic(src, dst) -> None:
+    """一時ファイルにコピーしてから置き換える（コピー途中のファイルを残さない）"""
+    tmp_path = f"{dst}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+async def generate_avatar_image(avatar_id: str, base_prompt: str, expression_type: str, expression_prompt: str, output_dir: str = "public/avatars", force: bool = False, use_cache: bool = True):
     """
     DALL-E 3でアバター画像を生成
 
@@ -78,97 +138,133 @@ def generate_avatar_image(avatar_id: str, base_prompt: str, expression_type: str
         base_prompt: ベースプロンプト（人物の基本情報）
         expression_type: 表情タイプ（例: listening）
         expression_prompt: 表情の説明
-        output_dir: 出力ディレクトリ
+        output_dir: 出力ディレクトリ（呼び出し側で作成しておく）
+        force: Trueの場合は保存済みの画像があっても生成し直す
+        use_cache: Trueの場合は同じプロンプトのキャッシュ画像があればDALL-E 3を呼ばずに使う
 
     Returns:
         生成された画像のファイルパス
     """
+    # ファイル名: avatar_01_listening.png
+    filename = f"{avatar_id}_{expression_type}.png"
+    filepath = os.path.join(output_dir, filename)
+
+    # 保存済みなら生成しない（再実行時は失敗した画像だけ生成される）
+    if not force and os.path.exists(filepath):
+        print(f"⏭️  スキップ（保存済み）: {filepath}")
+        return filepath
+
     # 完全なプロンプト
     full_prompt = f"{base_prompt}, {expression_prompt}, photorealistic, professional portrait photography, 4K quality"
 
+    # 同じプロンプトで生成済みならキャッシュから保存（プロンプトを変えた画像だけ生成される）
+    cache_path = get_cache_path(full_prompt)
+    if use_cache and cache_path.exists():
+        await asyncio.to_thread(copy_atomic, cache_path, filepath)
+        print(f"♻️  キャッシュから保存: {filepath}")
+        return filepath
+
     print(f"📸 生成中: {avatar_id}_{expression_type}")
     print(f"   プロンプト: {full_prompt[:100]}...")
 
     try:
-        # DALL-E 3で画像生成
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=full_prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1
-        )
+        # DALL-E 3で画像生成（レート制限時は待ってからリトライ）
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                response = await client.images.generate(
+                    model="dall-e-3",
+                    prompt=full_prompt,
+                    size="1024x1024",
+                    quality="standard",
+                    n=1
+                )
+                break
+            except RateLimitError:
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                wait_seconds = RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt
+                print(f"   ⏳ レート制限のため{wait_seconds}秒待機: {avatar_id}_{expression_type}")
+                await asyncio.sleep(wait_seconds)
 
         # 生成された画像のURL
         image_url = response.data[0].url
 
-        # 画像をダウンロード
-        image_data = requests.get(image_url).content
-
-        # ファイル名: avatar_01_listening.png
-        filename = f"{avatar_id}_{expression_type}.png"
-        filepath = os.path.join(output_dir, filename)
-
-        # ディレクトリが存在しない場合は作成
-        os.makedirs(output_dir, exist_ok=True)
+        # 画像をダウンロードして保存（同期通信のためスレッドで実行し、他の生成を止めない）
+        await asyncio.to_thread(download_image, image_url, filepath)
 
-        # 画像を保存
-        with open(filepath, 'wb') as f:
-            f.write(image_data)
+        # 次回以降のためにキャッシュへ保存
+        DALLE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(copy_atomic, filepath, cache_path)
 
         print(f"   ✅ 保存完了: {filepath}")
         return filepath
 
     except Exception as e:
-        print(f"   ❌ エラー: {e}")
+        print(f"   ❌ エラー: {avatar_id}_{expression_type}: {e}")
         return None
 
-def generate_all_avatars():
+async def generate_all_avatars(output_dir: str = "public/avatars", force: bool = False, use_cache: bool = True):
     """
-    すべてのアバターと表情の組み合わせを生成
+    すべてのアバターと表情の組み合わせを並行して生成（同時実行数はMAX_CONCURRENT_GENERATIONSまで）
+
+    Args:
+        output_dir: 出力ディレクトリ
+        force: Trueの場合は保存済みの画像も生成し直す
+        use_cache: Falseの場合はキャッシュ画像を使わずDALL-E 3で生成する
     """
     print("🎨 日本人アバター画像の生成を開始します...")
     print(f"   アバター数: {len(AVATARS)}")
     print(f"   表情数: {len(EXPRESSIONS)}")
     print(f"   合計: {len(AVATARS) * len(EXPRESSIONS)}枚")
+    print(f"   同時生成数: {MAX_CONCURRENT_GENERATIONS}")
     print()
 
-    generated_files = []
+    # 出力ディレクトリは最初に1回だけ作成する
+    os.makedirs(output_dir, exist_ok=True)
 
-    for avatar in AVATARS:
-        print(f"\n👤 {avatar['name']} の生成開始")
-        print("=" * 60)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_GENERATIONS)
+    combinations = [(avatar, expression) for avatar in AVATARS for expression in EXPRESSIONS]
 
-        for expression in EXPRESSIONS:
-            filepath = generate_avatar_image(
+    async def bounded(avatar, expression):
+        async with semaphore:
+            return await generate_avatar_image(
                 avatar_id=avatar['id'],
                 base_prompt=avatar['base_prompt'],
                 expression_type=expression['type'],
-                expression_prompt=expression['prompt_suffix']
+                expression_prompt=expression['prompt_suffix'],
+                output_dir=output_dir,
+                force=force,
+                use_cache=use_cache
             )
 
-            if filepath:
-                generated_files.append({
-                    'avatar_id': avatar['id'],
-                    'avatar_name': avatar['name'],
-                    'expression_type': expression['type'],
-                    'expression_name': expression['name'],
-                    'filepath': filepath
-                })
+    # 結果は組み合わせの順（アバター → 表情）に並ぶ
+    filepaths = await asyncio.gather(*[bounded(avatar, expression) for avatar, expression in combinations])
 
-            # レート制限を避けるため、少し待機
-            time.sleep(2)
+    generated_files = [
+        {
+            'avatar_id': avatar['id'],
+            'avatar_name': avatar['name'],
+            'expression_type': expression['type'],
+            'expression_name': expression['name'],
+            'filepath': filepath
+        }
+        for (avatar, expression), filepath in zip(combinations, filepaths)
+        if filepath
+    ]
 
     print("\n" + "=" * 60)
     print(f"✅ 完了！ {len(generated_files)}枚の画像を生成しました。")
-    print(f"📁 保存先: public/avatars/")
+    print(f"📁 保存先: {output_dir}/")
     print()
     print("次のステップ:")
-    print("1. public/avatars/ フォルダの画像を確認")
+    print(f"1. {output_dir}/ フォルダの画像を確認")
     print("2. Supabase Storage にアップロード")
     print("3. データベースに登録")
 
     return generated_files
 
 if __name__ == "__main__":
-    generate_all_avatars()
+    asyncio.run(generate_all_avatars(
+        force='--force' in sys.argv[1:],
+        use_cache='--no-cache' not in sys.argv[1:]
+    ))
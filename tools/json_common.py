@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+JSONファイル読み書きの共通処理（RAGインデックス構築・文字起こしの各ツールから利用）
+
+- orjsonがあればUTF-8のバイト列を直接読み書きする（無い場合は標準のjson）
+- 日本語はエスケープしない
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+
+# orjsonのインポート（オプション、無い場合は標準のjsonで読み書きする）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+
+def write_json(path: Path, obj: Any, indent: bool = True) -> None:
+    """JSONを書き込む（orjsonがあればUTF-8のバイト列を直接書き出す。日本語はエスケープしない）"""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        path.write_bytes(orjson.dumps(obj, option=option))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2 if indent else None)
+
+
+def read_json(path: Path) -> Any:
+    """JSONを読み込む（壊れている場合はjson.JSONDecodeError。orjsonの例外もそのサブクラス）"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def append_jsonl(f, obj: Any) -> None:
+    """JSON Lines形式で1行追記する（fはバイナリの追記モードで開いたファイル。書いたらすぐフラッシュする）"""
+    if ORJSON_AVAILABLE:
+        f.write(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE))
+    else:
+        f.write(json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n')
+    f.flush()
+
+
+def truncate_torn_jsonl(path: Path) -> None:
+    """
+    書き込み途中で中断された末尾の行（改行で終わっていない行）を削除する
+
+    追記を再開する前に呼び、次に追記する行が途中の行とつながって読めなくなるのを防ぐ
+    """
+    if not path.exists():
+        return
+    with open(path, 'r+b') as f:
+        end = f.seek(0, 2)
+        pos = end
+        # 末尾から遡って最後の改行を探す
+        while pos > 0:
+            block_start = max(0, pos - (1 << 16))
+            f.seek(block_start)
+            block = f.read(pos - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                pos = block_start + newline + 1
+                break
+            pos = block_start
+        if pos != end:
+            f.truncate(pos)
+
+
+def iter_jsonl_offsets(path: Path):
+    """JSON Lines形式のファイルを1行ずつ読み込み、(行の先頭位置, 値) を返す（読めない行は読み飛ばす）"""
+    loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            try:
+                yield offset, loads(line)
+            except json.JSONDecodeError:
+                pass
+            offset += len(line)
+
+
+def read_jsonl_at(f, offset: int) -> Any:
+    """バイナリで開いたJSON Linesファイルの指定位置から1行読み込む（位置はiter_jsonl_offsetsで取得）"""
+    f.seek(offset)
+    line = f.readline()
+    return orjson.loads(line) if ORJSON_AVAILABLE else json.loads(line)
+
+
+def read_jsonl(path: Path):
+    """JSON Lines形式のファイルを1行ずつ読み込む（書き込み途中で中断された末尾の行は読み飛ばす）"""
+    for _, obj in iter_jsonl_offsets(path):
+        yield obj
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+RAGインデックス構築の共通処理（batch_ingest_videos.py / build_rag_index.py から利用）
+
+- Embedding生成（バッチを並行リクエストし、base64で受け取る）
+- FAISSインデックス作成（L2正規化して内積検索 = コサイン類似度。バッチごとに逐次追加）
+- インデックスとメタデータの保存
+
+使い方（既存メタデータのEmbeddingを作り直す。Embeddingモデルを変更したときなど）:
+    python tools/rag_common.py [メタデータJSON] [flat|hnsw|hnsw_sq8|ivfpq]
+      メタデータJSON: 省略時は rag_index/sales_patterns.json
+"""
+
+import os
+import sys
+import base64
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import faiss
+
+from json_common import read_json, write_json
+
+# pyarrowのインポート（オプション、RAGメタデータをArrow形式でも保存する）
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pc = None
+
+# Embedding生成の設定
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_BATCH_SIZE = 512  # 1リクエストあたりのテキスト数（APIの上限は2048件）
+EMBEDDING_CONCURRENCY = 16  # 同時リクエスト数
+
+# FAISSインデックスの種別と構築パラメータ
+INDEX_TYPES = ('flat', 'hnsw', 'hnsw_sq8', 'ivfpq')
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+IVFPQ_M = 64  # 直積量子化のサブベクトル数（次元数の約数）
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = 16
+IVFPQ_MIN_POINTS_PER_LIST = 39  # FAISSが推奨するクラスタあたりの学習件数
+IVFPQ_MAX_TRAINING_POINTS = 100_000  # 学習に使う件数の上限（学習用のEmbeddingだけはまとめてメモリに置く）
+
+# 保存先（app.pyが読み込むファイル）
+RAG_INDEX_DIR = Path(__file__).parent.parent / 'rag_index'
+INDEX_FILENAME = 'sales_patterns.faiss'
+METADATA_FILENAME = 'sales_patterns.json'
+METADATA_ARROW_FILENAME = 'sales_patterns.arrow'
+
+
+def decode_embedding(embedding) -> np.ndarray:
+    """base64形式のEmbedding（float32のバイト列）をPythonのfloatを経由せずに配列へ変換"""
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+    # base64に対応していないモデルではfloatのリストが返る
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def create_index(n: int, dimension: int, index_type: str = 'flat'):
+    """
+    内積検索用の空のFAISSインデックスを作成
+
+    Args:
+        n: 追加する予定の件数（IVFPQのクラスタ数の決定に使う）
+        dimension: 次元数
+        index_type: flat（厳密検索）/ hnsw（近似最近傍）/ hnsw_sq8（近似最近傍＋8bitスカラー量子化で約1/4のサイズ）
+                    / ivfpq（近似最近傍＋直積量子化で省メモリ）
+
+    Returns:
+        FAISSインデックス（hnsw_sq8・ivfpqは未学習。is_trainedを確認して学習してから追加する）
+    """
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == 'hnsw_sq8':
+        # 各次元をfloat32から8bitに量子化する（正規化済みテキストEmbeddingの内積なら精度の低下は小さい）
+        index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == 'ivfpq':
+        nlist = max(1, int(4 * np.sqrt(n)))
+        # 学習に必要な件数に満たない場合は量子化の精度が出ないためFlatにする
+        if n < max(nlist * IVFPQ_MIN_POINTS_PER_LIST, 2 ** IVFPQ_NBITS) or dimension % IVFPQ_M:
+            print(f"⚠️  IVFPQの学習には件数が不足しているためFlatで作成します ({n}件)")
+            return create_index(n, dimension, 'flat')
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, IVFPQ_M, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        # nprobeはインデックスファイルに保存され、app.pyの読み込み時にもそのまま使われる
+        index.nprobe = IVFPQ_NPROBE
+    else:
+        index = faiss.IndexFlatIP(dimension)
+    return index
+
+
+def training_size(index, n: int) -> int:
+    """未学習のインデックスの学習に使う件数（先頭から集めたこの件数で学習し、以降は逐次追加する）"""
+    nlist = index.nlist if isinstance(index, faiss.IndexIVF) else 1
+    target = max(nlist * IVFPQ_MIN_POINTS_PER_LIST, 2 ** IVFPQ_NBITS * IVFPQ_MIN_POINTS_PER_LIST)
+    return min(n, target, IVFPQ_MAX_TRAINING_POINTS)
+
+
+async def embed_to_index(
+    client,
+    texts: List[str],
+    index_type: str = 'flat',
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    index=None
+) -> Tuple[Optional[Any], List[int]]:
+    """
+    テキストのEmbeddingをバッチ単位で並行生成し、届いたバッチから順にFAISSインデックスへ追加
+
+    全件の (テキスト数, 次元数) 配列は作らず、L2正規化（内積 = コサイン類似度）したバッチをそのまま追加する。
+    インデックスの行番号をテキストの順序と揃えるため、先に届いた後続バッチは前のバッチの追加を待つ。
+    学習が必要なインデックス（hnsw_sq8・ivfpq）は先頭から学習用の件数が集まった時点で学習する。
+
+    Args:
+        client: AsyncOpenAIクライアント
+        texts: テキストのリスト
+        index_type: インデックス種別（INDEX_TYPES）
+        batch_size: 1リクエストあたりのテキスト数
+        concurrency: 同時リクエスト数
+        index: 追加先の既存インデックス（省略時はindex_typeで新規作成）
+
+    Returns:
+        (インデックス, 追加できたテキストの添字リスト) ※新規作成で全バッチ失敗した場合のインデックスはNone
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = {}  # バッチの開始位置 → 正規化済みEmbedding（失敗したバッチはNone）
+    next_start = 0
+    training_batches = []
+    kept_indices = []
+
+    def add_vectors(vectors: np.ndarray) -> None:
+        nonlocal index
+        if index is None:
+            index = create_index(len(texts), vectors.shape[1], index_type)
+        if index.is_trained:
+            index.add(vectors)
+            return
+        training_batches.append(vectors)
+        if sum(len(batch) for batch in training_batches) >= training_size(index, len(texts)):
+            train_and_add()
+
+    def train_and_add() -> None:
+        nonlocal index
+        samples = np.concatenate(training_batches)
+        training_batches.clear()
+        if isinstance(index, faiss.IndexIVF) and len(samples) < max(index.nlist * IVFPQ_MIN_POINTS_PER_LIST, 2 ** IVFPQ_NBITS):
+            # Embedding生成の失敗で学習件数が足りなくなった場合はFlatにする
+            print(f"⚠️  IVFPQの学習には件数が不足しているためFlatで作成します ({len(samples)}件)")
+            index = create_index(len(samples), samples.shape[1], 'flat')
+        else:
+            index.train(samples)
+        index.add(samples)
+
+    def flush() -> None:
+        nonlocal next_start
+        while next_start in pending:
+            vectors = pending.pop(next_start)
+            if vectors is not None:
+                add_vectors(vectors)
+                kept_indices.extend(range(next_start, next_start + len(vectors)))
+            next_start += batch_size
+
+    async def embed_batch(start: int) -> None:
+        batch = texts[start:start + batch_size]
+        async with semaphore:
+            try:
+                response = await client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=batch,
+                    encoding_format="base64"
+                )
+            except Exception as e:
+                print(f"❌ Embedding生成エラー: {e}")
+                pending[start] = None
+                flush()
+                return
+
+        vectors = None
+        for offset, item in enumerate(response.data):
+            vector = decode_embedding(item.embedding)
+            if vectors is None:
+                vectors = np.empty((len(response.data), len(vector)), dtype=np.float32)
+            vectors[offset] = vector
+        if vectors is not None:
+            faiss.normalize_L2(vectors)
+        pending[start] = vectors
+        flush()
+        print(f"   Embedding進捗: {min(start + batch_size, len(texts))}/{len(texts)}")
+
+    await asyncio.gather(*[embed_batch(start) for start in range(0, len(texts), batch_size)])
+
+    if training_batches:
+        train_and_add()
+
+    return index, kept_indices
+
+
+def write_metadata_arrow(metadata: List[Dict[str, Any]], path: Path) -> None:
+    """
+    RAGメタデータをArrow IPCファイルでも保存（pyarrowがある場合のみ）
+
+    app.pyはこのファイルをメモリマップで読み込む。分類用の列は辞書エンコードして小さくする。
+    Arrowファイルは任意の補助ファイルのため、変換できないメタデータ（行ごとに型が異なる列など）の場合は
+    警告を出し、古いArrowファイルを削除して続行する（app.pyはJSONを読み込む）
+    """
+    if not PYARROW_AVAILABLE:
+        return
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        # 行ごとにキーが異なる場合があるため、全行のキーから列を決める（from_pylistは先頭行のキーのみ）
+        table = pa.Table.from_struct_array(pa.array(metadata))
+        for name in ('type', 'scene', 'scenario_id'):
+            if name in table.column_names:
+                table = table.set_column(
+                    table.column_names.index(name), name, pc.dictionary_encode(table.column(name))
+                )
+        # 書き込み途中のファイルを読み込ませないよう、一時ファイルに書いてから置き換える
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except pa.ArrowException as e:
+        print(f"⚠️  Arrow形式のメタデータを保存できませんでした（JSONのみ保存します）: {e}")
+        tmp_path.unlink(missing_ok=True)
+        # JSONと内容が食い違う古いArrowファイルを残さない
+        path.unlink(missing_ok=True)
+
+
+def save_index(index, metadata: List[Dict[str, Any]], out_dir: Path = RAG_INDEX_DIR) -> Tuple[Path, Path]:
+    """
+    FAISSインデックスとメタデータを保存（メタデータの並びはインデックスの行番号と一致させること）
+
+    Returns:
+        (インデックスのパス, メタデータJSONのパス)
+    """
+    out_dir.mkdir(exist_ok=True)
+    index_path = out_dir / INDEX_FILENAME
+    metadata_path = out_dir / METADATA_FILENAME
+
+    faiss.write_index(index, str(index_path))
+
+    write_json(metadata_path, metadata)
+
+    write_metadata_arrow(metadata, out_dir / METADATA_ARROW_FILENAME)
+
+    return index_path, metadata_path
+
+
+def load_index(out_dir: Path = RAG_INDEX_DIR) -> Tuple[Optional[Any], List[Dict[str, Any]]]:
+    """
+    保存済みのFAISSインデックスとメタデータを読み込む
+
+    Returns:
+        (インデックス, メタデータ) ※無い・件数が一致しない場合は (None, [])
+    """
+    index_path = out_dir / INDEX_FILENAME
+    metadata_path = out_dir / METADATA_FILENAME
+    if not index_path.exists() or not metadata_path.exists():
+        return None, []
+
+    index = faiss.read_index(str(index_path))
+    metadata = read_json(metadata_path)
+    if index.ntotal != len(metadata):
+        print(f"⚠️  インデックス({index.ntotal}件)とメタデータ({len(metadata)}件)の件数が一致しないため作り直します")
+        return None, []
+    return index, metadata
+
+
+# RAGメタデータの項目と既定値（batch_ingest_videos.py と build_rag_index.py が同じインデックスに追加するため、
+# どちらのパターンもこの項目に揃えて保存する）
+RAG_METADATA_FIELDS = {
+    'type': None,
+    'text': '',
+    'scene': None,
+    'topics': [],
+    'scenario_id': None,
+    'source_file': None,
+}
+
+
+def normalize_pattern(pattern: Dict[str, Any]) -> Dict[str, Any]:
+    """パターンにRAG_METADATA_FIELDSの項目を揃える（無い項目だけ既定値で補い、それ以外の項目はそのまま残す）"""
+    normalized = dict(pattern)
+    for field, default in RAG_METADATA_FIELDS.items():
+        normalized.setdefault(field, list(default) if isinstance(default, list) else default)
+    return normalized
+
+
+def _pattern_key(pattern: Dict[str, Any]) -> Tuple:
+    """追加済みかどうかの判定に使うキー"""
+    return (pattern.get('type'), pattern.get('scenario_id'), pattern.get('text'))
+
+
+async def add_to_index(
+    client,
+    patterns: List[Dict[str, Any]],
+    index_type: str = 'flat',
+    rebuild: bool = False,
+    out_dir: Path = RAG_INDEX_DIR
+) -> Tuple[Optional[Any], List[Dict[str, Any]], int]:
+    """
+    保存済みのインデックスに、まだ入っていないパターンだけEmbeddingを生成して追加
+
+    (type, scenario_id, text) が同じパターンは追加済みとみなす。保存済みのインデックスが無い場合は
+    全件からindex_typeで新規作成する（既存インデックスの種別は変えない）。
+    rebuild=True の場合は保存済みのメタデータ（他のツールが追加した分も含む）と新しいパターンを合わせて
+    全件のEmbeddingを作り直す（同じキーのパターンは新しい方で置き換える）。
+    メタデータは既存分も含めてnormalize_patternで共通の項目を補う
+
+    Returns:
+        (インデックス, メタデータ, 追加件数) ※インデックスの行番号とメタデータの並びは一致する
+    """
+    patterns = [normalize_pattern(p) for p in patterns]
+    if rebuild:
+        # 既存のインデックスは読まず（件数が壊れていても）、他のツールが追加した分も消さないように
+        # 保存済みのメタデータと合わせて作り直す
+        metadata_path = out_dir / METADATA_FILENAME
+        existing_metadata = read_json(metadata_path) if metadata_path.exists() else []
+        new_keys = {_pattern_key(p) for p in patterns}
+        patterns = [
+            normalize_pattern(item) for item in existing_metadata if _pattern_key(item) not in new_keys
+        ] + patterns
+        index, metadata = None, []
+        print(f"🔁 インデックスを再構築: {len(patterns)}件")
+    else:
+        index, metadata = load_index(out_dir)
+        metadata = [normalize_pattern(item) for item in metadata]
+    if index is not None:
+        existing = {_pattern_key(item) for item in metadata}
+        patterns = [p for p in patterns if _pattern_key(p) not in existing]
+        print(f"📚 既存インデックス: {index.ntotal}件（{type(index).__name__}）、追加対象: {len(patterns)}件")
+        if not patterns:
+            return index, metadata, 0
+
+    index, kept_indices = await embed_to_index(client, [p['text'] for p in patterns], index_type, index=index)
+    # Embedding生成に失敗したバッチのパターンは除外（FAISSの行番号と揃える）
+    added = [patterns[i] for i in kept_indices]
+    return index, metadata + added, len(added)
+
+
+async def rebuild(metadata: List[Dict[str, Any]], index_type: str) -> None:
+    """メタデータのtextからEmbeddingを作り直してインデックスを保存"""
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    index, kept_indices = await embed_to_index(client, [item['text'] for item in metadata], index_type)
+    if index is None:
+        print("❌ エラー: Embeddingが生成されませんでした")
+        sys.exit(1)
+
+    metadata = [metadata[i] for i in kept_indices]
+    index_path, metadata_path = save_index(index, metadata)
+    print(f"✅ {index.ntotal}件で再構築しました: {index_path}, {metadata_path}")
+
+
+def main():
+    """既存メタデータからRAGインデックスを再構築"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if not os.getenv('OPENAI_API_KEY'):
+        print("❌ エラー: OPENAI_API_KEYが設定されていません")
+        sys.exit(1)
+
+    metadata_path = Path(sys.argv[1]) if len(sys.argv) > 1 else RAG_INDEX_DIR / METADATA_FILENAME
+    index_type = sys.argv[2] if len(sys.argv) > 2 else 'flat'
+    if index_type not in INDEX_TYPES:
+        print(f"❌ エラー: 不明なインデックス種別です: {index_type} ({'|'.join(INDEX_TYPES)})")
+        sys.exit(1)
+
+    metadata = read_json(metadata_path)
+    print(f"📄 {metadata_path}: {len(metadata)}件")
+
+    asyncio.run(rebuild(metadata, index_type))
+
+
+if __name__ == '__main__':
+    main()
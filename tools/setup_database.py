@@ -7,59 +7,69 @@ Week 1 Day 3: データベース設計・構築
 import os
 import sys
 from pathlib import Path
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
+# psycopg2のインポート（オプション、無い場合はSQL Editorでの手動実行手順を表示）
+try:
+    import psycopg2
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    PSYCOPG2_AVAILABLE = False
+    psycopg2 = None
+
 # .envファイルを読み込み
 load_dotenv()
 
 # Supabase認証情報
 SUPABASE_URL = os.getenv('VITE_SUPABASE_URL')
-SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+# DDL実行用のPostgreSQL接続文字列（postgresql://...）
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+if not SUPABASE_URL:
     print("❌ エラー: Supabase環境変数が設定されていません")
-    print("   VITE_SUPABASE_URL と SUPABASE_SERVICE_ROLE_KEY を .env に設定してください")
+    print("   VITE_SUPABASE_URL を .env に設定してください")
     sys.exit(1)
 
-# Supabaseクライアント作成
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+def execute_sql_file(file_path: str, conn) -> bool:
+    """
+    SQLファイルを読み込んで実行
+
+    ファイル全体を1回のexecuteで送り、1トランザクションで実行する（途中で失敗した場合は全てロールバック）
+
+    Args:
+        file_path: SQLファイルのパス
+        conn: psycopg2の接続（複数ファイルを実行する場合も同じ接続を使い回す）
 
-def execute_sql_file(file_path: str):
-    """SQLファイルを読み込んで実行"""
+    Returns:
+        成功したかどうか
+    """
     print(f"\n📄 実行中: {file_path}")
 
     with open(file_path, 'r', encoding='utf-8') as f:
         sql = f.read()
 
     try:
-        # Supabase PostgRESTを使ってSQLを実行
-        # 注: postgrestではDDLを直接実行できないため、
-        # Supabase Management APIまたはpg8000を使用する必要があります
-
-        # 代替方法: psycopg2を使用
-        import psycopg2
-
-        # Supabase接続文字列を構築
-        # URLからプロジェクト参照を取得
-        project_ref = SUPABASE_URL.split('//')[1].split('.')[0]
-
-        # 接続文字列（Supabaseの形式）
-        # 実際の接続にはDatabase Passwordが必要
-        print("⚠️  データベースパスワードの入力が必要です")
-        print(f"   Supabase Dashboard → Settings → Database → Connection String")
-        print(f"   から取得してください")
-
-        # 代わりに、REST APIを使う方法を試します
-        print("\n⚠️  直接SQL実行はサポートされていません")
-        print("   Supabase Dashboard → SQL Editor でマニュアル実行が必要です")
-
-        return False
+        # with conn: 正常終了でコミット、例外でロールバック
+        with conn, conn.cursor() as cur:
+            cur.execute(sql)
+        print(f"✅ 実行完了: {file_path}")
+        return True
 
     except Exception as e:
         print(f"❌ エラー: {e}")
         return False
 
+def print_manual_steps(master_schema: Path):
+    """SQL EditorでSQLを手動実行する手順を表示"""
+    print("\n📋 次の手順を手動で実行してください:")
+    print("   1. Supabase Dashboard にアクセス")
+    print(f"      {SUPABASE_URL.replace('.supabase.co', '.supabase.co/project/guargnhnblhiupjumkhe')}")
+    print("   2. 左メニュー → SQL Editor → New query")
+    print(f"   3. {master_schema} の内容をコピー&ペースト")
+    print("   4. 'Run' をクリック")
+    print("\n✅ または、以下のコマンドでファイル内容を表示:")
+    print(f"   cat {master_schema}")
+
 def main():
     """メイン処理"""
     print("=" * 60)
@@ -74,20 +84,40 @@ def main():
         print(f"❌ エラー: {master_schema} が見つかりません")
         sys.exit(1)
 
-    # マスタースキーマを実行
-    execute_sql_file(str(master_schema))
+    # 直接SQLを実行できない場合は手動実行の手順を表示
+    if not PSYCOPG2_AVAILABLE or not SUPABASE_DB_URL:
+        print("\n⚠️  直接SQL実行には psycopg2 と SUPABASE_DB_URL が必要です")
+        if not PSYCOPG2_AVAILABLE:
+            print("   pip install psycopg2-binary でインストールしてください")
+        if not SUPABASE_DB_URL:
+            print("   Supabase Dashboard → Settings → Database → Connection String")
+            print("   の接続文字列を .env の SUPABASE_DB_URL に設定してください")
+        print_manual_steps(master_schema)
+        sys.exit(1)
+
+    # マスタースキーマを実行（1つの接続で実行する）
+    try:
+        conn = psycopg2.connect(SUPABASE_DB_URL, sslmode='require')
+    except psycopg2.Error as e:
+        # 接続文字列の誤り・ネットワークエラー等
+        print(f"\n❌ データベースに接続できませんでした: {e}")
+        print_manual_steps(master_schema)
+        sys.exit(1)
+
+    try:
+        success = execute_sql_file(str(master_schema), conn)
+    finally:
+        conn.close()
 
     print("\n" + "=" * 60)
-    print("⚠️  注意: Supabase CLIからの直接SQL実行は制限があります")
+    if success:
+        print("✅ データベースセットアップ完了")
+    else:
+        print("❌ データベースセットアップに失敗しました（変更はロールバックされました）")
     print("=" * 60)
-    print("\n📋 次の手順を手動で実行してください:")
-    print("   1. Supabase Dashboard にアクセス")
-    print(f"      {SUPABASE_URL.replace('.supabase.co', '.supabase.co/project/guargnhnblhiupjumkhe')}")
-    print("   2. 左メニュー → SQL Editor → New query")
-    print(f"   3. {master_schema} の内容をコピー&ペースト")
-    print("   4. 'Run' をクリック")
-    print("\n✅ または、以下のコマンドでファイル内容を表示:")
-    print(f"   cat {master_schema}")
+
+    if not success:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+文字起こし結果の話者推定（営業・顧客）の共通処理（transcribe.py から利用）
+
+- 営業・顧客それぞれの特徴的なフレーズの種類数で話者を判定
+- スコアが同じ場合は直前の話者と交互にする
+"""
+
+import re
+from typing import Callable, List, Tuple
+
+# pyahocorasickのインポート（オプション、無い場合は正規表現で判定）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    ahocorasick = None
+
+
+def build_speaker_scorer(sales_patterns: List[str], customer_patterns: List[str]) -> Callable[[str], Tuple[int, int]]:
+    """
+    テキストに含まれる営業・顧客の特徴的なフレーズの種類数 (営業, 顧客) を返す関数を作る
+
+    pyahocorasickがあれば全フレーズを1つのオートマトンにまとめ、テキストを1回走査するだけで判定する。
+    無い場合は話者ごとに1つの正規表現にまとめる（フレーズごとに部分文字列検索しない）
+    """
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for pattern in sales_patterns:
+            automaton.add_word(pattern, ('sales', pattern))
+        for pattern in customer_patterns:
+            automaton.add_word(pattern, ('customer', pattern))
+        automaton.make_automaton()
+
+        def score(text: str) -> Tuple[int, int]:
+            # 同じフレーズが複数回出ても1とする（フレーズの種類数で比較）
+            found = {value for _, value in automaton.iter(text)}
+            sales_score = sum(1 for speaker, _ in found if speaker == 'sales')
+            return sales_score, len(found) - sales_score
+    else:
+        # 先読みで各位置を調べるため、重なったフレーズも両方検出できる
+        sales_re = re.compile('(?=(' + '|'.join(map(re.escape, sales_patterns)) + '))')
+        customer_re = re.compile('(?=(' + '|'.join(map(re.escape, customer_patterns)) + '))')
+
+        def score(text: str) -> Tuple[int, int]:
+            return len(set(sales_re.findall(text))), len(set(customer_re.findall(text)))
+
+    return score
+
+
+def detect_speakers(texts: List[str], score_phrases: Callable[[str], Tuple[int, int]]) -> List[str]:
+    """
+    発話内容から話者を推定（簡易版）
+
+    フレーズのスコアを全テキスト分まとめて計算してから、前から順に話者を決める
+
+    Args:
+        texts: 発話内容のリスト（会話順）
+        score_phrases: build_speaker_scorerで作ったスコア関数
+
+    Returns:
+        'sales' または 'customer' のリスト
+    """
+    speakers = []
+    previous_speaker = None
+
+    for sales_score, customer_score in map(score_phrases, texts):
+        if sales_score > customer_score:
+            speaker = 'sales'
+        elif customer_score > sales_score:
+            speaker = 'customer'
+        else:
+            # スコアが同じ場合は前の話者と交互に
+            speaker = 'customer' if previous_speaker == 'sales' else 'sales'
+        speakers.append(speaker)
+        previous_speaker = speaker
+
+    return speakers
+
+
+def segment_conversation(transcript_data: dict, score_phrases: Callable[[str], Tuple[int, int]]) -> list:
+    """
+    文字起こし結果を会話セグメントに分割
+
+    Args:
+        transcript_data: Whisper APIの結果
+        score_phrases: build_speaker_scorerで作ったスコア関数
+
+    Returns:
+        会話セグメントのリスト
+    """
+    # セグメント情報がある場合
+    if transcript_data.get('segments'):
+        source_segments = [
+            (text, seg)
+            for seg in transcript_data['segments']
+            if (text := seg.get('text', '').strip())
+        ]
+        speakers = detect_speakers([text for text, _ in source_segments], score_phrases)
+
+        return [
+            {
+                'speaker': '営業' if speaker == 'sales' else '顧客',
+                'speaker_type': speaker,
+                'text': text,
+                'start': seg.get('start'),
+                'end': seg.get('end'),
+            }
+            for (text, seg), speaker in zip(source_segments, speakers)
+        ]
+
+    # セグメント情報がない場合は全文を分割
+    text = transcript_data.get('text', '')
+    sentences = [sentence for sentence in (s.strip() for s in text.split('。')) if sentence]
+    speakers = detect_speakers(sentences, score_phrases)
+
+    return [
+        {
+            'speaker': '営業' if speaker == 'sales' else '顧客',
+            'speaker_type': speaker,
+            'text': sentence + '。',
+        }
+        for sentence, speaker in zip(sentences, speakers)
+    ]
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+音声ファイルの文字起こしツール（大容量ファイル対応版）
+
+使い方:
+    python tools/transcribe.py [--workers N] [--max-size MB]
+      --workers: 同時に処理するファイル数（省略時は環境変数 TRANSCRIBE_WORKERS、既定は4）
+      --max-size: これを超えるファイルは分割して文字起こしする（MB、省略時は24。Whisper APIの上限は25）
+
+機能:
+- videos/内の音声/動画ファイルを自動検出
+- ffmpegがあれば16kHzモノラルのOpusに変換してから送信（アップロード量を削減）
+- 25MB超のファイルを自動分割
+- Whisper APIで文字起こし
+- 話者分離（営業・顧客）の推定
+- transcripts/にJSON形式で保存
+"""
+
+import os
+import sys
+import csv
+import asyncio
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from shutil import which
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from pydub import AudioSegment
+
+from json_common import append_jsonl, iter_jsonl_offsets, read_jsonl, read_jsonl_at, truncate_torn_jsonl, write_json
+from speaker_common import build_speaker_scorer, segment_conversation
+from transcript_io import TRANSCRIPT_SCHEMA_VERSION
+
+# 環境変数読み込み
+load_dotenv()
+
+# OpenAI クライアント初期化（チャンクは並行して文字起こしするため非同期）
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+
+# ディレクトリ設定
+BASE_DIR = Path(__file__).parent.parent
+VIDEOS_DIR = BASE_DIR / 'videos'
+TRANSCRIPTS_DIR = BASE_DIR / 'transcripts'
+TEMP_DIR = BASE_DIR / 'temp_chunks'
+TRANSCRIPTS_DIR.mkdir(exist_ok=True)
+TEMP_DIR.mkdir(exist_ok=True)
+
+# 対応する音声/動画形式
+SUPPORTED_FORMATS = ['.mp3', '.mp4', '.wav', '.m4a', '.webm', '.mpeg', '.mpga']
+
+# Whisper API制限
+WHISPER_MAX_FILE_SIZE_MB = 25
+MAX_FILE_SIZE_MB = 24  # 25MBではなく24MBで安全マージン
+CHUNK_DURATION_MS = 10 * 60 * 1000  # 10分チャンク
+MAX_CONCURRENT_CHUNKS = 4  # 同時に文字起こしするチャンク数（ファイルごと）
+TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', '4'))  # 同時に処理するファイル数
+
+# Whisper送信前の変換設定（Whisperは内部で16kHzモノラルに変換するため、元の音質で送っても精度は変わらない）
+WHISPER_SAMPLE_RATE = 16000
+WHISPER_OPUS_BITRATE = '12k'
+
+# ffmpegがあれば分割に直接使う（pydubのように音声全体をPCMでメモリに展開しない）
+FFMPEG_AVAILABLE = which('ffmpeg') is not None
+
+
+def split_audio_with_ffmpeg(file_path: Path, chunk_duration_ms: int, copy_codec: bool) -> list:
+    """
+    ffmpegのsegmentで音声ファイルをMP3のチャンクに分割（ストリーム処理のためメモリ使用量は長さに依存しない）
+
+    Args:
+        file_path: 音声ファイルのパス
+        chunk_duration_ms: チャンクの長さ（ミリ秒）
+        copy_codec: Trueの場合は再エンコードせずにコピー（MP3入力のみ）
+
+    Returns:
+        (チャンクのパス, 開始ミリ秒, 終了ミリ秒) のリスト
+    """
+    output_pattern = TEMP_DIR / f"{file_path.name}_chunk_%03d.mp3"
+    segment_list_path = TEMP_DIR / f"{file_path.name}_chunks.csv"
+    codec_args = ['-c:a', 'copy'] if copy_codec else ['-c:a', 'libmp3lame', '-b:a', '64k']
+
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', str(file_path),
+        '-map', '0:a:0', '-vn',
+        *codec_args,
+        '-f', 'segment',
+        '-segment_time', str(chunk_duration_ms / 1000),
+        '-reset_timestamps', '1',
+        # 実際の分割位置（フレーム境界）を記録し、タイムスタンプのずらし幅に使う
+        '-segment_list', str(segment_list_path),
+        '-segment_list_type', 'csv',
+        str(output_pattern)
+    ], check=True, capture_output=True)
+
+    chunk_files = []
+    with open(segment_list_path, newline='', encoding='utf-8') as f:
+        for filename, start, end in csv.reader(f):
+            chunk_files.append((TEMP_DIR / Path(filename).name, int(float(start) * 1000), int(float(end) * 1000)))
+    segment_list_path.unlink()
+    return chunk_files
+
+
+def preprocess_for_whisper(file_path: Path) -> Path:
+    """
+    音声を16kHzモノラルのOpus（OGG）に変換（アップロード量が減り、多くの場合は分割せずに1回で文字起こしできる）
+
+    変換済みのファイルがあれば使い回す（書き込み途中のファイルを残さないよう一時ファイルから置き換える）
+
+    Args:
+        file_path: 音声/動画ファイルのパス
+
+    Returns:
+        変換後のファイルのパス
+    """
+    output_path = TEMP_DIR / f"{file_path.name}.ogg"
+    if output_path.exists():
+        return output_path
+
+    tmp_path = TEMP_DIR / f"{file_path.name}.ogg.tmp"
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', str(file_path),
+        '-map', '0:a:0', '-vn',
+        '-ac', '1', '-ar', str(WHISPER_SAMPLE_RATE),
+        '-c:a', 'libopus', '-b:a', WHISPER_OPUS_BITRATE,
+        '-f', 'ogg',
+        str(tmp_path)
+    ], check=True, capture_output=True)
+    tmp_path.replace(output_path)
+    return output_path
+
+
+def split_audio(file_path: Path, chunk_duration_ms: int = CHUNK_DURATION_MS) -> list:
+    """
+    音声ファイルを分割
+
+    Args:
+        file_path: 音声ファイルのパス
+        chunk_duration_ms: チャンクの長さ（ミリ秒）
+
+    Returns:
+        分割されたファイルのパスのリスト
+    """
+    print(f"🔪 音声ファイルを分割中...")
+
+    if FFMPEG_AVAILABLE:
+        chunk_files = None
+        if file_path.suffix.lower() == '.mp3':
+            # MP3はデコードせずにコピーで分割する
+            try:
+                chunk_files = split_audio_with_ffmpeg(file_path, chunk_duration_ms, copy_codec=True)
+            except subprocess.CalledProcessError as e:
+                print(f"⚠️  コピーでの分割に失敗したため再エンコードします: {e.stderr.decode(errors='ignore').strip()}")
+        if chunk_files is None:
+            chunk_files = split_audio_with_ffmpeg(file_path, chunk_duration_ms, copy_codec=False)
+
+        if chunk_files:
+            print(f"   総時間: {chunk_files[-1][2] / 1000 / 60:.2f}分")
+        for i, (chunk_filename, start_ms, end_ms) in enumerate(chunk_files):
+            chunk_size_mb = chunk_filename.stat().st_size / (1024 * 1024)
+            print(f"   チャンク {i+1}: {chunk_size_mb:.2f}MB ({start_ms/1000:.1f}s - {end_ms/1000:.1f}s)")
+        return chunk_files
+
+    # ffmpegが無い場合はpydubで読み込んで分割
+    audio = AudioSegment.from_file(file_path)
+    total_duration_ms = len(audio)
+
+    print(f"   総時間: {total_duration_ms / 1000 / 60:.2f}分")
+
+    # チャンクに分割
+    chunks = []
+    chunk_files = []
+
+    for i, start_ms in enumerate(range(0, total_duration_ms, chunk_duration_ms)):
+        end_ms = min(start_ms + chunk_duration_ms, total_duration_ms)
+        chunk = audio[start_ms:end_ms]
+
+        # 一時ファイルに保存
+        chunk_filename = TEMP_DIR / f"{file_path.name}_chunk_{i:03d}.mp3"
+        chunk.export(chunk_filename, format="mp3", bitrate="64k")
+
+        if not chunk_filename.exists():
+            print(f"❌ チャンク{i+1}の作成に失敗しました")
+            continue
+
+        chunk_size_mb = chunk_filename.stat().st_size / (1024 * 1024)
+        print(f"   チャンク {i+1}: {chunk_size_mb:.2f}MB ({start_ms/1000:.1f}s - {end_ms/1000:.1f}s)")
+
+        chunk_files.append((chunk_filename, start_ms, end_ms))
+
+    return chunk_files
+
+
+async def transcribe_audio_chunk(file_path: Path, start_ms: int = 0) -> dict:
+    """
+    音声チャンクを文字起こし
+
+    Args:
+        file_path: 音声ファイルのパス
+        start_ms: チャンクの開始時間（ミリ秒）
+
+    Returns:
+        文字起こし結果（dict）
+    """
+    try:
+        # Whisper APIで文字起こし
+        with open(file_path, 'rb') as audio_file:
+            transcript = await client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="verbose_json",
+                language="ja"
+            )
+
+        # セグメントのタイムスタンプを調整
+        segments = []
+        if hasattr(transcript, 'segments'):
+            for seg in transcript.segments:
+                segments.append({
+                    'text': seg.text,
+                    'start': seg.start + (start_ms / 1000),
+                    'end': seg.end + (start_ms / 1000),
+                })
+
+        return {
+            'text': transcript.text,
+            'duration': transcript.duration if hasattr(transcript, 'duration') else None,
+            'language': transcript.language if hasattr(transcript, 'language') else 'ja',
+            'segments': segments,
+        }
+
+    except Exception as e:
+        print(f"❌ エラー: {e}")
+        return None
+
+
+async def transcribe_large_audio(file_path: Path, max_file_size_mb: float = MAX_FILE_SIZE_MB) -> dict:
+    """
+    大容量音声ファイルを分割して文字起こし（チャンクはMAX_CONCURRENT_CHUNKSまで並行して処理）
+
+    Args:
+        file_path: 音声ファイルのパス
+        max_file_size_mb: これを超える場合は分割する（以下なら1回で文字起こし）
+
+    Returns:
+        文字起こし結果（dict）
+    """
+    print(f"📝 文字起こし開始: {file_path.name}")
+
+    file_size_mb = file_path.stat().st_size / (1024 * 1024)
+    print(f"   ファイルサイズ: {file_size_mb:.2f}MB")
+
+    # ファイルサイズチェック
+    if file_size_mb <= max_file_size_mb:
+        # 25MB以下の場合は直接処理
+        print(f"   直接処理します")
+        return await transcribe_audio_chunk(file_path, 0)
+
+    # 25MB超の場合は分割処理
+    print(f"   ファイルサイズが{max_file_size_mb}MBを超えているため、分割処理します")
+
+    # 分割はffmpeg/pydubの同期処理のため、スレッドで実行して他のファイルの文字起こしを止めない
+    chunk_files = await asyncio.to_thread(split_audio, file_path)
+    print(f"✅ {len(chunk_files)}個のチャンクに分割完了")
+
+    # 文字起こし済みのチャンクは途中結果ファイル（JSON Lines）に1行ずつ追記する。
+    # 全チャンクの結果をメモリに溜めず、中断・失敗した場合も次回は残りのチャンクだけ処理する
+    partial_path = TEMP_DIR / f"{file_path.name}.partial.jsonl"
+    done_chunks = set()
+    if partial_path.exists():
+        # 前回の書き込み途中の行を削除してから追記する
+        truncate_torn_jsonl(partial_path)
+        done_chunks = {(record['chunk'], record['start_ms']) for record in read_jsonl(partial_path)}
+        if done_chunks:
+            print(f"♻️  途中結果から再開: {len(done_chunks)}個のチャンクは文字起こし済み")
+
+    # 各チャンクを並行して文字起こし（チャンクごとに独立しており、タイムスタンプはstart_msでずらす）
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+
+    async def transcribe_bounded(i: int, chunk_file: Path, start_ms: int, partial) -> bool:
+        if (i, start_ms) in done_chunks:
+            return True
+        async with semaphore:
+            print(f"\n📝 チャンク {i+1}/{len(chunk_files)} を文字起こし中...")
+            chunk_result = await transcribe_audio_chunk(chunk_file, start_ms)
+        if not chunk_result:
+            return False
+        append_jsonl(partial, {'chunk': i, 'start_ms': start_ms, **chunk_result})
+        print(f"✅ チャンク {i+1} 完了: {len(chunk_result['text'])}文字")
+        return True
+
+    try:
+        with open(partial_path, 'ab') as partial:
+            succeeded = await asyncio.gather(*[
+                transcribe_bounded(i, chunk_file, start_ms, partial)
+                for i, (chunk_file, start_ms, end_ms) in enumerate(chunk_files)
+            ])
+    finally:
+        # 一時ファイルを削除
+        for chunk_file, _, _ in chunk_files:
+            chunk_file.unlink(missing_ok=True)
+
+    if not all(succeeded):
+        print(f"❌ {succeeded.count(False)}個のチャンクの文字起こしに失敗しました（再実行すると残りのチャンクから再開します）")
+        return None
+
+    # 途中結果ファイルの各チャンクの行の位置を調べ、全チャンクが揃っているか確認する
+    expected_chunks = {(i, start_ms) for i, (_, start_ms, _) in enumerate(chunk_files)}
+    chunk_offsets = {
+        record['chunk']: offset
+        for offset, record in iter_jsonl_offsets(partial_path)
+        if (record['chunk'], record['start_ms']) in expected_chunks
+    }
+    missing_chunks = len(chunk_files) - len(chunk_offsets)
+    if missing_chunks:
+        print(f"❌ 途中結果ファイルに{missing_chunks}個のチャンクの結果がありません（再実行すると残りのチャンクから再開します）")
+        return None
+
+    # チャンク順に1行ずつ読み込んで結合する（全チャンクの結果を同時にメモリに載せない）
+    all_text = []
+    all_segments = []
+    total_duration = 0
+
+    with open(partial_path, 'rb') as partial:
+        for i in range(len(chunk_files)):
+            chunk_result = read_jsonl_at(partial, chunk_offsets[i])
+            all_text.append(chunk_result['text'])
+            if chunk_result.get('segments'):
+                all_segments.extend(chunk_result['segments'])
+            if chunk_result.get('duration'):
+                total_duration += chunk_result['duration']
+
+    partial_path.unlink()
+
+    # 統合結果
+    print(f"\n✅ 全チャンク文字起こし完了")
+    print(f"   総文字数: {sum(len(t) for t in all_text)}文字")
+
+    return {
+        'text': '\n'.join(all_text),
+        'duration': total_duration,
+        'language': 'ja',
+        'segments': all_segments,
+    }
+
+
+# 話者推定に使う営業の特徴的なフレーズ
+SALES_PATTERNS = [
+    'ご提案', 'お手伝い', 'サービス', 'プラン', 'お見積',
+    'ご説明', 'ご案内', 'お伺い', 'ご質問', 'ご確認',
+    'させていただ', 'いかがでしょ', 'よろしければ'
+]
+
+# 話者推定に使う顧客の特徴的なフレーズ
+CUSTOMER_PATTERNS = [
+    '検討', '予算', '費用', '悩み', '困って', '考えて',
+    '他社', '比較', 'どうなん', '分からない', 'ですね',
+    'そうですか', 'なるほど'
+]
+
+
+# 話者推定用のスコア関数（フレーズ一覧からモジュール読み込み時に1回だけ作る）
+score_speaker_phrases = build_speaker_scorer(SALES_PATTERNS, CUSTOMER_PATTERNS)
+
+
+async def process_video_file(video_path: Path, max_file_size_mb: float = MAX_FILE_SIZE_MB) -> bool:
+    """
+    動画/音声ファイルを処理
+
+    Args:
+        video_path: ファイルパス
+        max_file_size_mb: これを超える場合は分割して文字起こしする
+
+    Returns:
+        成功したかどうか
+    """
+    print(f"\n{'='*60}")
+    print(f"処理開始: {video_path.name}")
+    print(f"{'='*60}")
+
+    # 出力ファイル名
+    output_filename = video_path.stem + '_transcript.json'
+    output_path = TRANSCRIPTS_DIR / output_filename
+
+    # 既に処理済みの場合はスキップ
+    if output_path.exists():
+        print(f"⏭️  スキップ: 既に文字起こし済みです")
+        print(f"   出力ファイル: {output_path}")
+        return True
+
+    # 送信前に16kHzモノラルのOpusに変換（失敗した場合は元のファイルをそのまま送る）
+    audio_path = video_path
+    if FFMPEG_AVAILABLE:
+        try:
+            audio_path = await asyncio.to_thread(preprocess_for_whisper, video_path)
+            original_size_mb = video_path.stat().st_size / (1024 * 1024)
+            converted_size_mb = audio_path.stat().st_size / (1024 * 1024)
+            print(f"🎚️  Opusに変換: {original_size_mb:.2f}MB → {converted_size_mb:.2f}MB")
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️  Opusへの変換に失敗したため元のファイルを使います: {e.stderr.decode(errors='ignore').strip()}")
+
+    # 文字起こし
+    transcript_data = await transcribe_large_audio(audio_path, max_file_size_mb)
+    if not transcript_data:
+        return False
+
+    # 変換したファイルは文字起こしが成功したら削除（失敗時は再実行で使い回す）
+    if audio_path != video_path:
+        audio_path.unlink(missing_ok=True)
+
+    # 会話セグメント化
+    print(f"🔍 会話セグメント化中...")
+    segments = segment_conversation(transcript_data, score_speaker_phrases)
+    print(f"✅ {len(segments)}個のセグメントに分割")
+
+    # 統計情報
+    sales_count = sum(1 for s in segments if s['speaker_type'] == 'sales')
+    customer_count = sum(1 for s in segments if s['speaker_type'] == 'customer')
+    print(f"   営業発言: {sales_count}件")
+    print(f"   顧客発言: {customer_count}件")
+
+    # 結果を保存（全文はセグメントと重複するため保存しない。transcript_io.full_text で組み立てる）
+    result = {
+        'schema_version': TRANSCRIPT_SCHEMA_VERSION,
+        'source_file': video_path.name,
+        'processed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'duration': transcript_data.get('duration'),
+        'language': transcript_data.get('language'),
+        'segments': segments,
+        'stats': {
+            'total_segments': len(segments),
+            'sales_segments': sales_count,
+            'customer_segments': customer_count,
+        }
+    }
+
+    write_json(output_path, result)
+
+    print(f"💾 保存完了: {output_path}")
+    return True
+
+
+async def process_video_files(video_files: list, workers: int = TRANSCRIBE_WORKERS, max_file_size_mb: float = MAX_FILE_SIZE_MB) -> int:
+    """
+    ファイルをworkers件ずつ並行処理（イベントループは全ファイルで1つにし、非同期クライアントの接続を使い回す）
+
+    Returns:
+        成功したファイル数
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def process_bounded(video_file: Path) -> bool:
+        async with semaphore:
+            try:
+                return await process_video_file(video_file, max_file_size_mb)
+            except Exception as e:
+                print(f"❌ エラー: {video_file.name} - {e}")
+                return False
+
+    results = await asyncio.gather(*[process_bounded(video_file) for video_file in video_files])
+    return sum(1 for result in results if result)
+
+
+def get_option(args: list, name: str, default, convert):
+    """コマンドライン引数から「--name 値」の値を取得（指定が無い場合はdefault）"""
+    if name not in args:
+        return default
+    index = args.index(name)
+    if index + 1 >= len(args):
+        print(f"❌ エラー: {name} に値を指定してください")
+        sys.exit(1)
+    try:
+        return convert(args[index + 1])
+    except ValueError:
+        print(f"❌ エラー: {name} の値が不正です: {args[index + 1]}")
+        sys.exit(1)
+
+
+def main():
+    """メイン処理"""
+    args = sys.argv[1:]
+    workers = get_option(args, '--workers', TRANSCRIBE_WORKERS, int)
+    max_file_size_mb = get_option(args, '--max-size', MAX_FILE_SIZE_MB, float)
+    if workers < 1 or not 0 < max_file_size_mb <= WHISPER_MAX_FILE_SIZE_MB:
+        print(f"❌ エラー: --workers は1以上、--max-size は{WHISPER_MAX_FILE_SIZE_MB}MB以下を指定してください")
+        sys.exit(1)
+
+    print(f"""
+{'='*60}
+音声文字起こしツール - Whisper API（大容量ファイル対応）
+{'='*60}
+対応形式: {', '.join(SUPPORTED_FORMATS)}
+入力ディレクトリ: {VIDEOS_DIR}
+出力ディレクトリ: {TRANSCRIPTS_DIR}
+最大ファイルサイズ: {max_file_size_mb}MB（超える場合は自動分割）
+同時処理ファイル数: {workers}
+{'='*60}
+    """)
+
+    # OpenAI APIキーの確認
+    if not os.getenv('OPENAI_API_KEY'):
+        print("❌ エラー: OPENAI_API_KEYが設定されていません")
+        print("   .envファイルに設定してください")
+        sys.exit(1)
+
+    # 動画/音声ファイルを検索（ディレクトリを1回だけ走査し、拡張子は大文字小文字を区別しない）
+    video_files = []
+    if VIDEOS_DIR.is_dir():
+        supported_suffixes = tuple(SUPPORTED_FORMATS)
+        with os.scandir(VIDEOS_DIR) as entries:
+            video_files = sorted(
+                Path(entry.path)
+                for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(supported_suffixes)
+            )
+
+    if not video_files:
+        print(f"⚠️  {VIDEOS_DIR} に音声/動画ファイルが見つかりませんでした")
+        sys.exit(0)
+
+    print(f"📁 {len(video_files)}件のファイルを検出しました:\n")
+    for i, vf in enumerate(video_files, 1):
+        size_mb = vf.stat().st_size / (1024 * 1024)
+        status = "要分割" if size_mb > max_file_size_mb else "直接処理"
+        print(f"   {i}. {vf.name} ({size_mb:.2f}MB) [{status}]")
+
+    print()
+
+    # 処理実行
+    success_count = asyncio.run(process_video_files(video_files, workers, max_file_size_mb))
+
+    # 一時ディレクトリをクリーンアップ（失敗したファイルがある場合は再開用の途中結果・変換済みファイルを残す）
+    if success_count == len(video_files) and TEMP_DIR.exists():
+        for temp_file in TEMP_DIR.glob('*'):
+            temp_file.unlink()
+
+    # 結果サマリー
+    print(f"\n{'='*60}")
+    print(f"処理完了: {success_count}/{len(video_files)}件成功")
+    print(f"{'='*60}\n")
+
+    # 出力ファイル一覧
+    transcripts = list(TRANSCRIPTS_DIR.glob('*.json'))
+    if transcripts:
+        print(f"📄 生成された文字起こしファイル: {len(transcripts)}件\n")
+
+
+if __name__ == '__main__':
+    main()
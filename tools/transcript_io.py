@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+文字起こしJSON（transcripts/*_transcript.json）の共通処理
+
+- 全文はセグメントと重複するため保存せず、必要なときにセグメントから組み立てる（schema_version 2以降）
+"""
+
+# 文字起こしJSONの形式のバージョン（2: full_textを保存しない）
+TRANSCRIPT_SCHEMA_VERSION = 2
+
+
+def full_text(transcript: dict) -> str:
+    """
+    文字起こしJSONの全文を返す
+
+    Args:
+        transcript: 文字起こしJSONの内容
+
+    Returns:
+        全文（セグメントのテキストを会話順に連結したもの）
+    """
+    # full_textを保存していた旧形式（schema_versionなし）はそのまま返す
+    if 'full_text' in transcript:
+        return transcript['full_text'] or ''
+    return ''.join(segment['text'] for segment in transcript.get('segments', []))
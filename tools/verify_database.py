@@ -6,6 +6,7 @@ Week 1 Day 3: データベース設計・構築の確認
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
@@ -23,6 +24,42 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 # Supabaseクライアント作成
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+def check_table(table_name: str) -> tuple:
+    """
+    テーブルの存在確認（0件でもOK）
+
+    行データは取得せず（limit 0）、件数だけをレスポンスヘッダー（Content-Range）で受け取る
+
+    Returns:
+        (件数, エラー)。存在しない場合は (None, 例外)
+    """
+    try:
+        result = supabase.table(table_name).select("*", count="exact").limit(0).execute()
+        return result.count, None
+    except Exception as e:
+        return None, e
+
+def check_tables(tables_to_check: list) -> dict:
+    """
+    テーブルの存在確認をまとめて行う
+
+    list_tables RPC（database/14_list_tables.sql）で一覧を1回で取得する。
+    RPCが未作成の場合はテーブルごとの確認を並行して行う
+
+    Returns:
+        テーブル名 → (件数, エラー)。存在する場合のエラーはNone、RPCで確認した場合の件数はNone
+    """
+    try:
+        present = set(supabase.rpc('list_tables').execute().data)
+        return {
+            table_name: (None, None) if table_name in present else (None, Exception("テーブルが存在しません"))
+            for table_name in tables_to_check
+        }
+    except Exception:
+        # supabase-pyのクライアントは同期通信のためスレッドで並行実行
+        with ThreadPoolExecutor(max_workers=len(tables_to_check)) as executor:
+            return dict(zip(tables_to_check, executor.map(check_table, tables_to_check)))
+
 def verify_tables():
     """テーブルの存在確認"""
     print("=" * 60)
@@ -31,13 +68,12 @@ def verify_tables():
 
     tables_to_check = ['stores', 'profiles', 'conversations', 'evaluations']
 
-    for table_name in tables_to_check:
-        try:
-            # テーブルからデータを取得（0件でもOK）
-            result = supabase.table(table_name).select("*").limit(1).execute()
-            print(f"✅ {table_name:<20} テーブル存在確認OK")
-        except Exception as e:
-            print(f"❌ {table_name:<20} エラー: {e}")
+    for table_name, (count, error) in check_tables(tables_to_check).items():
+        if error is None:
+            rows = f" ({count}件)" if count is not None else ""
+            print(f"✅ {table_name:<20} テーブル存在確認OK{rows}")
+        else:
+            print(f"❌ {table_name:<20} エラー: {error}")
 
     print("\n" + "=" * 60)
     print("📊 サンプルデータ確認（stores テーブル）")
@@ -2,12 +2,51 @@
 """
 音声ファイルを文字起こしするスクリプト
 Whisper APIを使用して、話者分離付きで文字起こしを行う
+音声は無音の位置で短いチャンクに分割し、Whisper APIを並行して呼び出す
+pyannote.audioとHUGGINGFACE_TOKENがあれば、Whisper APIと並行して話者分離を行う
 """
+import io
 import os
 import sys
 import json
-from datetime import datetime
-from openai import OpenAI
+import re
+import csv
+import bisect
+import asyncio
+import functools
+import random
+import time
+import hashlib
+import shutil
+import tempfile
+import mimetypes
+import subprocess
+from collections import deque
+from datetime import datetime, timezone
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+
+# orjsonがあれば使用（セグメント数の多い文字起こし結果の読み書きが高速）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# h2のインポート（オプション、あればHTTP/2で1つの接続に複数チャンクのリクエストを多重化する）
+try:
+    import h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+    h2 = None
+
+# pyannote.audioのインポート（オプション、あれば話者分離に使う。無い場合は営業/顧客を交互に割り当てる）
+try:
+    from pyannote.audio import Pipeline
+    PYANNOTE_AVAILABLE = True
+except ImportError:
+    PYANNOTE_AVAILABLE = False
+    Pipeline = None
 
 # OpenAI APIキーを環境変数から取得
 api_key = os.getenv('OPENAI_API_KEY')
@@ -15,85 +54,490 @@ if not api_key:
     print("❌ Error: OPENAI_API_KEY environment variable not set")
     sys.exit(1)
 
-client = OpenAI(api_key=api_key)
+# 分割するチャンクの長さ（秒）と同時に文字起こしするチャンク数
+CHUNK_SECONDS = 45
+MAX_CONCURRENT_CHUNKS = 5
+# Whisper APIへの接続プール（同時に送るチャンク数分の接続をkeep-aliveで使い回す）
+HTTP_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# レート制限（429）・サーバーエラー・接続エラー時のリトライ（待ち時間は指数的に伸ばし、ランダムにずらす）
+WHISPER_MAX_ATTEMPTS = 6
+WHISPER_BACKOFF_MIN_SECONDS = 1
+WHISPER_BACKOFF_MAX_SECONDS = 30
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+# Whisper APIへのリクエスト数の上限（直近WHISPER_RATE_PERIOD_SECONDS秒間。429を受ける前に送信側で間隔を空ける）
+WHISPER_MAX_REQUESTS = 50
+WHISPER_RATE_PERIOD_SECONDS = 60
+
+# チャンクの分割位置にする無音（この音量以下がこの秒数以上続く区間。最大CHUNK_SECONDSの範囲で最も後ろの無音で区切る）
+SILENCE_THRESHOLD_DB = -35
+SILENCE_MIN_SECONDS = 0.4
+
+# チャンクのOpusのビットレート（16kHzモノラル）
+CHUNK_OPUS_BITRATE = '24k'
+
+# アップロード時にファイルから読み込むバッファサイズ（64KB）
+UPLOAD_BUFFER_SIZE = 1 << 16
+
+# 話者の種別と表示名（話者分離を使わない場合はセグメント番号の偶数・奇数で交互に割り当てる）
+SPEAKERS = (("sales", "営業"), ("customer", "顧客"))
+SPEAKER_NAMES = dict(SPEAKERS)
+
+# pyannoteの話者分離モデル（Hugging Faceのアクセストークンが必要）
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+HUGGINGFACE_TOKEN = os.getenv('HUGGINGFACE_TOKEN')
+DIARIZATION_ENABLED = PYANNOTE_AVAILABLE and bool(HUGGINGFACE_TOKEN)
+
+# 文字起こし結果のキャッシュ（出力ディレクトリ内。音声の内容のハッシュ → 結果JSON）
+CACHE_DIRNAME = '.cache'
+HASH_BLOCK_SIZE = 1 << 20
+
+def _content_hash(audio_file_path: str, audio_bytes) -> str:
+    """
+    送信する音声の内容のハッシュ（モデル・言語・チャンク長も含め、設定を変えた場合は別のキーになる）
+    """
+    speaker_method = DIARIZATION_MODEL if DIARIZATION_ENABLED else "alternate"
+    h = hashlib.blake2b(f"whisper-1|ja|{CHUNK_SECONDS}|silence{SILENCE_THRESHOLD_DB}|opus{CHUNK_OPUS_BITRATE}|{speaker_method}|".encode('utf-8'), digest_size=16)
+    if audio_bytes is not None:
+        h.update(audio_bytes)
+    else:
+        with open(audio_file_path, 'rb') as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                h.update(block)
+    return h.hexdigest()
+
+@functools.lru_cache(maxsize=32)
+def _ensure_dir(path: str) -> None:
+    """ディレクトリを作成（同じパスはプロセス中1回だけ作成する）"""
+    os.makedirs(path, exist_ok=True)
+
+@functools.lru_cache(maxsize=1)
+def _diarization_pipeline():
+    """話者分離のパイプライン（読み込みに時間がかかるため1回だけ作る）"""
+    return Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=HUGGINGFACE_TOKEN)
+
+def _diarize(audio_file_path: str, audio_bytes) -> list:
+    """
+    pyannoteで話者分離
+
+    Returns:
+        (開始秒, 終了秒, 話者ラベル) のリスト（開始秒順）
+    """
+    audio = {"audio": io.BytesIO(audio_bytes)} if audio_bytes is not None else audio_file_path
+    diarization = _diarization_pipeline()(audio)
+    return sorted((turn.start, turn.end, label) for turn, _, label in diarization.itertracks(yield_label=True))
+
+def _assign_speakers(segments: list, turns: list) -> list:
+    """
+    各セグメントに、時間が最も重なる話者分離の区間の話者を割り当てる
+
+    最初に話した話者を営業、それ以外を顧客とする。どの区間とも重ならないセグメントは直前の話者を引き継ぐ
+
+    Returns:
+        セグメントごとの話者の種別（'sales' または 'customer'）のリスト
+    """
+    turn_starts = [start for start, _, _ in turns]
+    max_turn_length = max((end - start for start, end, _ in turns), default=0)
+    roles = {}
+    speaker_types = []
+    previous = SPEAKERS[0][0]
+
+    for segment in segments:
+        seg_start, seg_end = segment['start'], segment['end']
+        # 開始秒で二分探索し、重なり得る区間だけを調べる
+        lo = bisect.bisect_left(turn_starts, seg_start - max_turn_length)
+        hi = bisect.bisect_left(turn_starts, seg_end)
+        overlaps = {}
+        for start, end, label in turns[lo:hi]:
+            overlap = min(end, seg_end) - max(start, seg_start)
+            if overlap > 0:
+                overlaps[label] = overlaps.get(label, 0) + overlap
+
+        if overlaps:
+            label = max(overlaps, key=overlaps.get)
+            if label not in roles:
+                roles[label] = SPEAKERS[0][0] if not roles else SPEAKERS[1][0]
+            previous = roles[label]
+        speaker_types.append(previous)
+
+    return speaker_types
+
+def _load_json(path: str) -> dict:
+    """JSONファイルを読み込む"""
+    if orjson:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _silence_cut_times(audio_file_path: str, audio_bytes, chunk_sec: int = CHUNK_SECONDS) -> list:
+    """
+    ffmpegのsilencedetectで無音区間を検出し、チャンクの分割位置を決める
+
+    各チャンクが chunk_sec 秒以下になるよう、範囲内で最も後ろの無音の中央で区切る
+    （単語の途中で切らない）。範囲の後半に無音が無い場合は chunk_sec 秒の位置で区切る
+
+    Returns:
+        分割位置（秒）のリスト
+    """
+    completed = subprocess.run([
+        'ffmpeg', '-hide_banner', '-nostdin',
+        '-i', 'pipe:0' if audio_bytes is not None else audio_file_path,
+        '-map', '0:a:0', '-vn',
+        '-af', f'silencedetect=noise={SILENCE_THRESHOLD_DB}dB:d={SILENCE_MIN_SECONDS}',
+        '-f', 'null', '-'
+    ], input=audio_bytes, check=True, capture_output=True)
+    log = completed.stderr.decode('utf-8', errors='replace')
 
-def transcribe_audio(audio_file_path: str, output_dir: str = "transcripts") -> dict:
+    silence_starts = [float(t) for t in re.findall(r'silence_start: (-?[\d.]+)', log)]
+    silence_ends = [float(t) for t in re.findall(r'silence_end: ([\d.]+)', log)]
+    midpoints = [(start + end) / 2 for start, end in zip(silence_starts, silence_ends)]
+    # 長さは最後に出力された処理位置（time=HH:MM:SS.xx）から取得
+    progress = re.findall(r'time=(\d+):(\d+):([\d.]+)', log)
+    hours, minutes, seconds = progress[-1] if progress else (0, 0, 0)
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    cut_times = []
+    last_cut = 0.0
+    i = 0
+    while duration - last_cut > chunk_sec:
+        limit = last_cut + chunk_sec
+        # 短すぎるチャンクを作らないよう、範囲の後半にある無音だけを候補にする
+        candidate = None
+        while i < len(midpoints) and midpoints[i] <= limit:
+            if midpoints[i] > last_cut + chunk_sec / 2:
+                candidate = midpoints[i]
+            i += 1
+        last_cut = candidate if candidate is not None else limit
+        cut_times.append(last_cut)
+
+    return cut_times
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    """JSONのバイト列に変換（indent=Trueの場合はインデント2）"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+def _save_transcript(path: str, result: dict) -> None:
+    """
+    文字起こし結果をインデント2・UTF-8のJSONで保存
+
+    セグメントは1つずつ変換して書き出し、結果全体のJSONをメモリ上に作らない
     """
-    音声ファイルを文字起こし
+    with open(path, 'wb') as f:
+        f.write(b'{\n')
+        for key, value in result.items():
+            if key != 'segments':
+                f.write(b'  ' + _dumps(key) + b': ' + _dumps(value) + b',\n')
+        if not result['segments']:
+            f.write(b'  "segments": []\n}')
+            return
+        f.write(b'  "segments": [\n')
+        for i, segment in enumerate(result['segments']):
+            if i:
+                f.write(b',\n')
+            f.write(b'    ' + _dumps(segment, indent=True).replace(b'\n', b'\n    '))
+        f.write(b'\n  ]\n}')
+
+def _split_audio(audio_file_path: str, audio_bytes, chunk_dir: str, chunk_sec: int = CHUNK_SECONDS, opus: bool = True, cut_times: list = None) -> list:
+    """
+    ffmpegのsegmentで音声をチャンクに分割
+
+    cut_times を指定した場合はその位置（秒）で、省略時は chunk_sec 秒ごとに区切る。
+
+    opus=Trueの場合は16kHzモノラルのOpus（OGG）に変換する（MP3よりアップロード量が小さい）。
+    Opusの入力と、opus=FalseでのMP3（圧縮済みのストリームを含む）の入力は再エンコードせずにコピーする
+
+    Returns:
+        (チャンクのパス, 開始秒) のリスト
+    """
+    input_ext = '.mp3' if audio_bytes is not None else os.path.splitext(audio_file_path)[1].lower()
+    if input_ext in ('.ogg', '.opus'):
+        codec_args, chunk_ext = ['-c:a', 'copy'], 'ogg'
+    elif opus:
+        codec_args, chunk_ext = ['-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', CHUNK_OPUS_BITRATE], 'ogg'
+    elif input_ext == '.mp3':
+        codec_args, chunk_ext = ['-c:a', 'copy'], 'mp3'
+    else:
+        codec_args, chunk_ext = ['-ac', '1', '-ar', '16000', '-c:a', 'libmp3lame', '-b:a', '64k'], 'mp3'
+    segment_list_path = os.path.join(chunk_dir, 'chunks.csv')
+
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', 'pipe:0' if audio_bytes is not None else audio_file_path,
+        '-map', '0:a:0', '-vn',
+        *codec_args,
+        '-f', 'segment',
+        *(['-segment_times', ','.join(f'{t:.3f}' for t in cut_times)] if cut_times else ['-segment_time', str(chunk_sec)]),
+        '-reset_timestamps', '1',
+        # 実際の分割位置（フレーム境界）を記録し、タイムスタンプのずらし幅に使う
+        '-segment_list', segment_list_path,
+        '-segment_list_type', 'csv',
+        os.path.join(chunk_dir, f'chunk_%04d.{chunk_ext}')
+    ], input=audio_bytes, check=True, capture_output=True)
+
+    with open(segment_list_path, newline='', encoding='utf-8') as f:
+        return [(os.path.join(chunk_dir, os.path.basename(filename)), float(start)) for filename, start, _ in csv.reader(f)]
+
+def _split_audio_for_upload(audio_file_path: str, audio_bytes, chunk_dir: str) -> list:
+    """
+    無音の位置で区切ってOpusで分割し、ffmpegがOpusに対応していない場合はMP3で分割する
+
+    無音の検出に失敗した場合は CHUNK_SECONDS 秒ごとに区切る
+    """
+    try:
+        cut_times = _silence_cut_times(audio_file_path, audio_bytes)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"⚠️  無音の検出に失敗したため、{CHUNK_SECONDS}秒ごとに分割します: {e}")
+        cut_times = None
+    try:
+        return _split_audio(audio_file_path, audio_bytes, chunk_dir, opus=True, cut_times=cut_times)
+    except subprocess.CalledProcessError:
+        return _split_audio(audio_file_path, audio_bytes, chunk_dir, opus=False, cut_times=cut_times)
+
+class _SlidingWindowLimiter:
+    """
+    直近period秒間のリクエスト数をmax_requestsまでに抑える（スライディングウィンドウ）
+
+    送信時刻だけを保持するため、asyncio.runごとにイベントループが変わっても同じインスタンスを使える
+    """
+
+    def __init__(self, max_requests: int, period: float):
+        self.max_requests = max_requests
+        self.period = period
+        self.sent_at = deque()
+
+    async def acquire(self) -> None:
+        """送信できるまで待ってから、送信時刻を記録する"""
+        while True:
+            now = time.monotonic()
+            while self.sent_at and now - self.sent_at[0] >= self.period:
+                self.sent_at.popleft()
+            if len(self.sent_at) < self.max_requests:
+                self.sent_at.append(now)
+                return
+            await asyncio.sleep(self.sent_at[0] + self.period - now)
+
+# バッチ処理で複数ファイルを続けて文字起こしする場合も、プロセス全体で上限を共有する
+whisper_rate_limiter = _SlidingWindowLimiter(WHISPER_MAX_REQUESTS, WHISPER_RATE_PERIOD_SECONDS)
+
+async def _with_retry(make_request, label: str):
+    """
+    Whisper APIのリクエストを一時的なエラー時にリトライ
+
+    待ち時間は1秒から倍々に伸ばした上限（最大30秒）までのランダムな値にし、並行するチャンクのリトライが同時に集中しないようにする
+
+    Args:
+        make_request: 呼ぶたびに新しいリクエストを送るコルーチン関数
+        label: ログに表示する名前
+    """
+    for attempt in range(WHISPER_MAX_ATTEMPTS):
+        # リトライも1リクエストとして数える
+        await whisper_rate_limiter.acquire()
+        try:
+            return await make_request()
+        except RETRYABLE_ERRORS as e:
+            if attempt == WHISPER_MAX_ATTEMPTS - 1:
+                raise
+            backoff_cap = min(WHISPER_BACKOFF_MAX_SECONDS, WHISPER_BACKOFF_MIN_SECONDS * 2 ** attempt)
+            wait_seconds = random.uniform(WHISPER_BACKOFF_MIN_SECONDS, backoff_cap)
+            print(f"   ⏳ {label}: {type(e).__name__} のため{wait_seconds:.1f}秒後にリトライします（{attempt + 1}/{WHISPER_MAX_ATTEMPTS - 1}）")
+            await asyncio.sleep(wait_seconds)
+
+async def _transcribe_chunk(async_client: AsyncOpenAI, idx: int, chunk_path: str, offset: float) -> tuple:
+    """
+    チャンクを文字起こし
+
+    Returns:
+        (チャンク番号, Whisper APIの結果, 開始秒)
+    """
+    # ファイルオブジェクトのまま渡し、multipartの本文をディスクから少しずつ読みながら送信する
+    # （ファイル名とMIMEタイプも明示し、ファイル全体をメモリに読み込まない）
+    mime_type = mimetypes.guess_type(chunk_path)[0] or 'application/octet-stream'
+
+    async def request():
+        # リトライのたびにファイルを開き直して先頭から送信する
+        with open(chunk_path, 'rb', buffering=UPLOAD_BUFFER_SIZE) as audio_file:
+            return await async_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=(os.path.basename(chunk_path), audio_file, mime_type),
+                language="ja",
+                response_format="verbose_json"
+            )
+
+    transcript = await _with_retry(request, f"チャンク{idx + 1}")
+    return idx, transcript, offset
+
+def _transcript_segments(transcript) -> list:
+    """
+    Whisper APIの結果のセグメントをdictのリストとして取得
+
+    チャンクごとに1回だけ変換し、以降はセグメントごとに型を判定せずにキーで参照する
+    """
+    if hasattr(transcript, 'model_dump'):
+        return transcript.model_dump().get('segments') or []
+    return getattr(transcript, 'segments', None) or []
+
+def transcribe_audio(
+    audio_file_path: str,
+    output_dir: str = "transcripts",
+    output_basename: str = None,
+    audio_stream=None
+) -> dict:
+    """
+    音声ファイルを文字起こし（transcribe_audio_asyncの同期版。引数・戻り値は同じ）
+    """
+    return asyncio.run(transcribe_audio_async(audio_file_path, output_dir, output_basename, audio_stream))
+
+async def transcribe_audio_async(
+    audio_file_path: str,
+    output_dir: str = "transcripts",
+    output_basename: str = None,
+    audio_stream=None
+) -> dict:
+    """
+    音声ファイルを文字起こし（チャンクはAsyncOpenAIで並行して送信）
 
     Args:
         audio_file_path: 音声ファイルのパス
         output_dir: 出力ディレクトリ
+        output_basename: 出力JSON名・source_fileに使うファイル名（省略時は入力ファイル名）
+        audio_stream: 圧縮済みMP3のファイルライクオブジェクト（指定時はaudio_file_pathを開かずにこれを送信）
 
     Returns:
         文字起こし結果の辞書
     """
     print(f"🎤 音声ファイルを文字起こし中: {audio_file_path}")
 
-    # ファイル名を取得
-    file_name = os.path.basename(audio_file_path)
+    # ファイル名を取得（指定があればそちらを優先）
+    file_name = output_basename or os.path.basename(audio_file_path)
     file_name_without_ext = os.path.splitext(file_name)[0]
+    output_path = os.path.join(output_dir, f"{file_name_without_ext}_transcript.json")
+
+    # 同じ内容の音声を文字起こし済みならキャッシュを使う（Whisper APIを呼ばない）
+    # ストリームは1回だけ読み込み、ハッシュ・話者分離・分割で同じバイト列を共有する
+    audio_bytes = None
+    if audio_stream is not None:
+        audio_bytes = audio_stream.read()
+        audio_stream.seek(0)
+
+    cache_path = os.path.join(output_dir, CACHE_DIRNAME, f"{_content_hash(audio_file_path, audio_bytes)}.json")
+    if os.path.exists(cache_path):
+        result = _load_json(cache_path)
+        result["source_file"] = file_name
+        _save_transcript(output_path, result)
+        print(f"♻️  キャッシュから文字起こし結果を保存: {output_path}")
+        return result
+
+    # 話者分離はWhisper APIの呼び出しと並行してスレッドで実行する
+    diarization_task = None
+    if DIARIZATION_ENABLED:
+        diarization_task = asyncio.create_task(asyncio.to_thread(_diarize, audio_file_path, audio_bytes))
+
+    # 音声を短いチャンクに分割し、Whisper APIを並行して呼び出す（タイムスタンプ付き）
+    print("📝 Whisper API実行中...")
+    # クライアントは1回の文字起こしの全チャンクで共有し、HTTP接続を使い回す
+    # （asyncio.runごとにイベントループが変わるため、呼び出しをまたいでは共有しない）
+    http_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE)
+    # リトライは_with_retryで行うため、SDK内蔵のリトライは無効にする
+    async with AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0) as async_client:
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            try:
+                # ffmpegの実行中も他の処理を止めないようスレッドで実行
+                chunks = await asyncio.to_thread(_split_audio_for_upload, audio_file_path, audio_bytes, chunk_dir)
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                # ffmpegが無い・分割に失敗した場合はファイル全体を1回で送信
+                print(f"⚠️  音声の分割に失敗したため、まとめて送信します: {e}")
+                chunks = []
+            if len(chunks) > 1:
+                print(f"   {len(chunks)}個のチャンクを並行処理します")
+                semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+
+                async def transcribe_bounded(idx: int, chunk_path: str, offset: float) -> tuple:
+                    async with semaphore:
+                        return await _transcribe_chunk(async_client, idx, chunk_path, offset)
 
-    # 音声ファイルを開く
-    with open(audio_file_path, 'rb') as audio_file:
-        # Whisper APIで文字起こし（タイムスタンプ付き）
-        print("📝 Whisper API実行中...")
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            language="ja",
-            response_format="verbose_json"
-        )
+                chunk_results = await asyncio.gather(*[
+                    transcribe_bounded(idx, chunk_path, offset)
+                    for idx, (chunk_path, offset) in enumerate(chunks)
+                ])
+            elif audio_stream is not None:
+                # メモリ上の圧縮済みMP3をそのまま送信（拡張子でフォーマットが判定される）
+                async def request():
+                    audio_stream.seek(0)
+                    return await async_client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=(f"{file_name_without_ext}.mp3", audio_stream, 'audio/mpeg'),
+                        language="ja",
+                        response_format="verbose_json"
+                    )
 
-    print(f"✅ 文字起こし完了: {len(transcript.text)}文字")
+                chunk_results = [(0, await _with_retry(request, file_name), 0.0)]
+            else:
+                chunk_results = [await _transcribe_chunk(async_client, 0, audio_file_path, 0.0)]
+
+    # チャンクの結果を順に結合（セグメントの時刻はチャンクの開始位置だけずらす）
+    last_transcript, last_offset = chunk_results[-1][1], chunk_results[-1][2]
+    segments = [
+        {
+            "text": segment['text'],
+            "start": segment['start'] + offset,
+            "end": segment['end'] + offset,
+        }
+        for _, transcript, offset in chunk_results
+        for segment in _transcript_segments(transcript)
+    ]
+
+    print(f"✅ 文字起こし完了: {len(segments)}セグメント")
 
     # 結果を構造化
     result = {
         "source_file": file_name,
-        "processed_at": datetime.now().isoformat(),
-        "duration": transcript.duration,
-        "language": transcript.language,
-        "full_text": transcript.text,
+        # 処理日時はタイムゾーン付きのUTC（秒単位）で記録する
+        "processed_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "duration": last_offset + last_transcript.duration,
+        "language": chunk_results[0][1].language,
+        "full_text": "",
         "segments": []
     }
 
     # セグメントを処理（話者を推定）
     print("👥 話者分離処理中...")
-    segments = transcript.segments if hasattr(transcript, 'segments') else []
 
-    for i, segment in enumerate(segments):
+    speaker_types = None
+    if diarization_task is not None:
+        try:
+            speaker_types = _assign_speakers(segments, await diarization_task)
+        except Exception as e:
+            print(f"⚠️  話者分離に失敗したため、営業/顧客を交互に割り当てます: {e}")
+    if speaker_types is None:
         # 簡易的な話者推定（交互に営業/顧客を割り当て）
-        # より高度な話者分離にはpyannoteなどを使用
-        speaker_type = "sales" if i % 2 == 0 else "customer"
-        speaker = "営業" if speaker_type == "sales" else "顧客"
-
-        # segmentがdictかobjectかを判定
-        if isinstance(segment, dict):
-            text = segment.get('text', '').strip()
-            start = segment.get('start', 0)
-            end = segment.get('end', 0)
-        else:
-            text = segment.text.strip()
-            start = segment.start
-            end = segment.end
-
-        result["segments"].append({
-            "speaker": speaker,
+        speaker_types = [SPEAKERS[i & 1][0] for i in range(len(segments))]
+
+    result["segments"] = [
+        {
+            "speaker": SPEAKER_NAMES[speaker_type],
             "speaker_type": speaker_type,
-            "text": text,
-            "start": start,
-            "end": end
-        })
+            "text": segment['text'].strip(),
+            "start": segment['start'],
+            "end": segment['end']
+        }
+        for speaker_type, segment in zip(speaker_types, segments)
+    ]
 
-    print(f"✅ セグメント処理完了: {len(result['segments'])}個")
+    # 全文は処理後のセグメントから組み立て、segmentsと内容を一致させる
+    result["full_text"] = "".join(segment["text"] for segment in result["segments"])
 
-    # 出力ディレクトリを作成
-    os.makedirs(output_dir, exist_ok=True)
+    print(f"✅ セグメント処理完了: {len(result['segments'])}個（{len(result['full_text'])}文字）")
 
-    # JSONファイルとして保存
-    output_path = os.path.join(output_dir, f"{file_name_without_ext}_transcript.json")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    # 出力ディレクトリを作成（バッチ処理で同じディレクトリに続けて保存する場合は2回目以降何もしない）
+    _ensure_dir(os.path.dirname(cache_path))
+
+    # JSONファイルとして保存（次回以降のためキャッシュにもコピーし、2回変換しない）
+    _save_transcript(output_path, result)
+    shutil.copyfile(output_path, cache_path)
 
     print(f"💾 文字起こし結果を保存: {output_path}")
 